@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Requests without a business_account_id share one bucket
+ALL_TENANTS = "_all"
+
+class AdmissionRejected(Exception):
+    """A request was refused by rate limiting or concurrency control"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consume a token; returns 0 if allowed, otherwise seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class TenantAdmission:
+    """
+    Per-tenant admission control for the API, used from the event loop only.
+
+    - check_rate: token bucket per business_account_id for every dashboard request.
+      Requests without one (the dashboard page) share the ALL_TENANTS bucket, which
+      has its own anonymous_rate_per_second and anonymous_burst (default: a tenant's).
+    - expensive_slot: caps concurrent expensive requests per tenant and overall.
+      Requests over the global cap wait in a bounded queue that is served
+      round-robin across tenants, so one busy tenant can't starve the others.
+    """
+
+    def __init__(self, rate_per_second=2.0, burst=20, max_active_total=8, max_active_per_tenant=2,
+                 max_pending_per_tenant=4, max_queue=64, queue_timeout=10.0, max_buckets=10000,
+                 anonymous_rate_per_second=None, anonymous_burst=None):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.anonymous_rate_per_second = anonymous_rate_per_second or rate_per_second
+        self.anonymous_burst = anonymous_burst or burst
+        # Tenant ids come from the query string: keep only the most recently used buckets.
+        # An evicted bucket had been idle long enough to be full again in practice.
+        self.max_buckets = max_buckets
+        self.max_active_total = max_active_total
+        self.max_active_per_tenant = max_active_per_tenant
+        self.max_pending_per_tenant = max_pending_per_tenant
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._buckets = OrderedDict()
+        self._active_total = 0
+        self._active = {}
+        self._waiting = OrderedDict()  # tenant -> deque of futures, in round-robin order
+        self.rejected = {"rate_limited": 0, "too_many_concurrent": 0, "queue_full": 0, "queue_timeout": 0}
+
+    def check_rate(self, tenant):
+        """Raises AdmissionRejected if the tenant is over its request rate"""
+        tenant = tenant or ALL_TENANTS
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            if tenant == ALL_TENANTS:
+                bucket = TokenBucket(self.anonymous_rate_per_second, self.anonymous_burst)
+            else:
+                bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[tenant] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(tenant)
+        retry_after = bucket.take()
+        if retry_after:
+            self.rejected["rate_limited"] += 1
+            raise AdmissionRejected("rate_limited", retry_after)
+
+    def queue_depth(self):
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def _pending(self, tenant):
+        return self._active.get(tenant, 0) + len(self._waiting.get(tenant, ()))
+
+    def _can_start(self, tenant):
+        return (self._active_total < self.max_active_total
+                and self._active.get(tenant, 0) < self.max_active_per_tenant)
+
+    def _start(self, tenant):
+        self._active_total += 1
+        self._active[tenant] = self._active.get(tenant, 0) + 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting tenants, one request per tenant per round"""
+        progressed = True
+        while progressed and self._waiting and self._active_total < self.max_active_total:
+            progressed = False
+            for tenant in list(self._waiting):
+                waiters = self._waiting[tenant]
+                while waiters and waiters[0].done():
+                    waiters.popleft()  # timed out or cancelled
+                if not waiters:
+                    del self._waiting[tenant]
+                    continue
+                if not self._can_start(tenant):
+                    continue
+                self._start(tenant)
+                waiters.popleft().set_result(True)
+                self._waiting.move_to_end(tenant)
+                progressed = True
+                if self._active_total >= self.max_active_total:
+                    break
+
+    def _release(self, tenant):
+        self._active_total -= 1
+        self._active[tenant] -= 1
+        if not self._active[tenant]:
+            del self._active[tenant]
+        self._dispatch()
+
+    async def acquire(self, tenant):
+        """Wait for one of the limited slots for an expensive request; give it back with release()"""
+        tenant = tenant or ALL_TENANTS
+
+        if self._pending(tenant) >= self.max_pending_per_tenant:
+            self.rejected["too_many_concurrent"] += 1
+            raise AdmissionRejected("too_many_concurrent", 1)
+
+        # Whoever else is waiting is held by their own per-tenant cap when a global slot is
+        # free (_dispatch hands free slots out as they are released), so only this tenant's
+        # earlier requests go first
+        if self._can_start(tenant) and not self._waiting.get(tenant):
+            self._start(tenant)
+        else:
+            if self.queue_depth() >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise AdmissionRejected("queue_full", 1)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(tenant, deque()).append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # Slot was granted just as we gave up; hand it back
+                    self._release(tenant)
+                else:
+                    waiter.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected["queue_timeout"] += 1
+                    raise AdmissionRejected("queue_timeout", math.ceil(self.queue_timeout)) from None
+                raise
+
+    def release(self, tenant):
+        self._release(tenant or ALL_TENANTS)
+
+    @asynccontextmanager
+    async def expensive_slot(self, tenant):
+        """Hold one of the limited slots for an expensive request"""
+        await self.acquire(tenant)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "queued_by_tenant": {tenant: len(waiters) for tenant, waiters in self._waiting.items() if waiters},
+            "active_expensive": self._active_total,
+            "rejected": dict(self.rejected)
+        }
@@ -0,0 +1,363 @@
+"""
+Local columnar mirror of order_transactions / order_items for historical analytics.
+
+AnalyticsMirror.export() copies orders changed since the previous run (and the
+items of those orders) from Postgres into Parquet files partitioned by UTC
+order date, one new file per partition per run:
+
+    <mirror_dir>/order_transactions/order_date=2025-12-28/part-<run>.parquet
+    <mirror_dir>/order_items/order_date=2025-12-28/part-<run>.parquet
+    <mirror_dir>/products/products.parquet      (full snapshot)
+    <mirror_dir>/businesses/businesses.parquet  (full snapshot: id, timezone)
+    <mirror_dir>/_state.json                    (export watermark)
+
+An updated order is appended again rather than rewritten in place: readers keep
+the latest version of each order and the items exported with that version.
+compact() folds a partition's files back into one. Queries run in DuckDB over
+the files, so long-range questions never touch the OLTP database.
+
+duckdb and pyarrow are optional; without them available() is False and callers
+stay on Postgres.
+"""
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = pa = pq = None
+
+ORDERS_DIR = "order_transactions"
+ITEMS_DIR = "order_items"
+PRODUCTS_DIR = "products"
+BUSINESSES_DIR = "businesses"
+STATE_FILE = "_state.json"
+
+# Rows updated up to this long before the previous watermark are exported again,
+# for transactions that committed after the previous run had read past them
+EXPORT_OVERLAP = timedelta(minutes=10)
+
+# Money is mirrored as float8: it is only ever aggregated for analytics
+ORDERS_EXPORT_QUERY = """
+    SELECT
+        (created_at AT TIME ZONE 'UTC')::date as order_date,
+        id, order_number, business_account_id, customer_id,
+        total_order_value::float8, number_of_items, status, payment_status, delivery_type,
+        created_at, COALESCE(updated_at, created_at) as updated_at, channel_type_id,
+        order_tax::float8, order_value_sub_total::float8
+    FROM order_transactions
+    WHERE COALESCE(updated_at, created_at) >= %(since)s
+    ORDER BY created_at
+"""
+
+ITEMS_EXPORT_QUERY = """
+    SELECT
+        (ot.created_at AT TIME ZONE 'UTC')::date as order_date,
+        oi.id, oi.order_id, oi.product_retailer_id, oi.quantity, oi.unit_price::float8,
+        COALESCE(ot.updated_at, ot.created_at) as order_updated_at
+    FROM order_items oi
+    JOIN order_transactions ot ON oi.order_id = ot.id
+    WHERE COALESCE(ot.updated_at, ot.created_at) >= %(since)s
+    ORDER BY ot.created_at
+"""
+
+PRODUCTS_EXPORT_QUERY = """
+    SELECT retailer_id, name, business_account_id
+    FROM products
+"""
+
+BUSINESSES_EXPORT_QUERY = """
+    SELECT id, timezone
+    FROM business_accounts
+"""
+
+def _schemas():
+    timestamp = pa.timestamp("us", tz="UTC")
+    orders = pa.schema([
+        ("id", pa.string()), ("order_number", pa.string()), ("business_account_id", pa.string()),
+        ("customer_id", pa.string()), ("total_order_value", pa.float64()), ("number_of_items", pa.int64()),
+        ("status", pa.string()), ("payment_status", pa.string()), ("delivery_type", pa.string()),
+        ("created_at", timestamp), ("updated_at", timestamp), ("channel_type_id", pa.string()),
+        ("order_tax", pa.float64()), ("order_value_sub_total", pa.float64())
+    ])
+    items = pa.schema([
+        ("id", pa.string()), ("order_id", pa.string()), ("product_retailer_id", pa.string()),
+        ("quantity", pa.int64()), ("unit_price", pa.float64()), ("order_updated_at", timestamp)
+    ])
+    products = pa.schema([("retailer_id", pa.string()), ("name", pa.string()), ("business_account_id", pa.string())])
+    businesses = pa.schema([("id", pa.string()), ("timezone", pa.string())])
+    return orders, items, products, businesses
+
+# Latest version of every order, and the items exported with it
+ORDERS_VIEW = """
+    CREATE TEMP VIEW orders AS
+    SELECT * FROM order_files
+    QUALIFY row_number() OVER (PARTITION BY id ORDER BY updated_at DESC) = 1
+"""
+
+ITEMS_VIEW = """
+    CREATE TEMP VIEW order_items AS
+    SELECT * FROM item_files
+    QUALIFY order_updated_at = max(order_updated_at) OVER (PARTITION BY order_id)
+        AND row_number() OVER (PARTITION BY id ORDER BY order_updated_at DESC) = 1
+"""
+
+PRODUCT_DAILY_SALES_QUERY = """
+    SELECT
+        oi.product_retailer_id,
+        p.name as product_name,
+        CAST(timezone(b.timezone, o.created_at) AS DATE) as sale_date,
+        SUM(oi.quantity) as quantity,
+        SUM(oi.quantity * oi.unit_price) as revenue
+    FROM order_items oi
+    JOIN orders o ON oi.order_id = o.id
+    JOIN businesses b ON o.business_account_id = b.id
+    JOIN products p ON oi.product_retailer_id = p.retailer_id
+    WHERE o.business_account_id = ?
+        AND list_contains(?, oi.product_retailer_id)
+        AND o.status = 'completed'
+        AND CAST(timezone(b.timezone, o.created_at) AS DATE) BETWEEN ? AND ?
+    GROUP BY ALL
+    ORDER BY product_name, sale_date
+"""
+
+CHANNEL_TRENDS_QUERY = """
+    SELECT
+        CAST(date_trunc(?, CAST(timezone(b.timezone, o.created_at) AS DATE)) AS DATE) as period,
+        o.channel_type_id,
+        COUNT(*) as total_orders,
+        COALESCE(SUM(o.total_order_value), 0) as total_revenue
+    FROM orders o
+    JOIN businesses b ON o.business_account_id = b.id
+    WHERE o.status = 'completed'
+        AND o.business_account_id = ?
+        AND CAST(timezone(b.timezone, o.created_at) AS DATE) BETWEEN ? AND ?
+    GROUP BY ALL
+    ORDER BY period, channel_type_id
+"""
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+class MirrorUnavailable(Exception):
+    """The mirror can't answer: dependencies missing or nothing exported yet"""
+
+class AnalyticsMirror:
+    """Parquet mirror of the order tables under mirror_dir, exported from and queried instead of Postgres"""
+
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+
+    def available(self):
+        return duckdb is not None and os.path.exists(self._path(STATE_FILE))
+
+    def _path(self, *parts):
+        return os.path.join(self.mirror_dir, *parts)
+
+    def read_state(self):
+        try:
+            with open(self._path(STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_state(self, state):
+        tmp = self._path(STATE_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self._path(STATE_FILE))
+
+    def complete_before(self):
+        """Orders created before this datetime are fully mirrored; None if never exported"""
+        watermark = self.read_state().get("orders_updated_at")
+        return datetime.fromisoformat(watermark) if watermark else None
+
+    # Export
+
+    def export(self, conn, batch_size=50000):
+        """
+        Export orders changed since the last run, their items and the products and business tables.
+        Runs in one read-only REPEATABLE READ transaction so orders and items agree.
+        """
+        if pa is None:
+            raise MirrorUnavailable("pyarrow and duckdb are required for the analytics mirror")
+        orders_schema, items_schema, products_schema, businesses_schema = _schemas()
+
+        state = self.read_state()
+        previous = state.get("orders_updated_at")
+        since = datetime.fromisoformat(previous) - EXPORT_OVERLAP if previous else datetime(1970, 1, 1, tzinfo=timezone.utc)
+        run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+            orders, high_watermark = self._export_partitioned(
+                conn, ORDERS_EXPORT_QUERY, {"since": since}, ORDERS_DIR, orders_schema, run_id, batch_size,
+                watermark_column="updated_at"
+            )
+            items, _ = self._export_partitioned(
+                conn, ITEMS_EXPORT_QUERY, {"since": since}, ITEMS_DIR, items_schema, run_id, batch_size
+            )
+
+            snapshots = {}
+            for table_dir, query, schema in [(PRODUCTS_DIR, PRODUCTS_EXPORT_QUERY, products_schema),
+                                             (BUSINESSES_DIR, BUSINESSES_EXPORT_QUERY, businesses_schema)]:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
+                os.makedirs(self._path(table_dir), exist_ok=True)
+                self._write_file(self._path(table_dir, f"{table_dir}.parquet"), rows, schema)
+                snapshots[table_dir] = len(rows)
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+
+        if high_watermark is not None:
+            state["orders_updated_at"] = high_watermark.isoformat()
+        state["last_run"] = run_id
+        self._write_state(state)
+
+        return {"orders": orders, "items": items, **snapshots, "watermark": state.get("orders_updated_at")}
+
+    def _export_partitioned(self, conn, query, params, table_dir, schema, run_id, batch_size, watermark_column=None):
+        """Stream query rows (ordered by order date) into one file per order_date partition"""
+        count = 0
+        high_watermark = None
+        watermark_index = schema.names.index(watermark_column) if watermark_column else None
+        current_date, pending = None, []
+
+        with conn.cursor(name=f"mirror_{table_dir}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            for order_date, *row in cursor:
+                if order_date != current_date:
+                    self._flush_partition(table_dir, current_date, pending, schema, run_id)
+                    current_date, pending = order_date, []
+                pending.append(row)
+                count += 1
+                if watermark_index is not None and (high_watermark is None or row[watermark_index] > high_watermark):
+                    high_watermark = row[watermark_index]
+        self._flush_partition(table_dir, current_date, pending, schema, run_id)
+
+        return count, high_watermark
+
+    def _flush_partition(self, table_dir, order_date, rows, schema, run_id):
+        if not rows:
+            return
+        partition = self._path(table_dir, f"order_date={order_date.isoformat()}")
+        os.makedirs(partition, exist_ok=True)
+        self._write_file(os.path.join(partition, f"part-{run_id}.parquet"), rows, schema)
+
+    def _write_file(self, path, rows, schema):
+        """Write tuple rows atomically (tmp file + rename) so readers never see a partial file"""
+        columns = list(zip(*rows)) if rows else [[] for _ in schema.names]
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+
+    def compact(self, min_files=4):
+        """Rewrite partitions holding at least min_files files as one deduplicated file"""
+        if duckdb is None:
+            raise MirrorUnavailable("duckdb is required for the analytics mirror")
+        compacted = 0
+        run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        for table_dir, source, view, deduplicated in [(ORDERS_DIR, "order_files", ORDERS_VIEW, "orders"),
+                                                      (ITEMS_DIR, "item_files", ITEMS_VIEW, "order_items")]:
+            root = self._path(table_dir)
+            if not os.path.isdir(root):
+                continue
+            for partition in sorted(os.listdir(root)):
+                directory = os.path.join(root, partition)
+                files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet"))
+                if len(files) < min_files:
+                    continue
+
+                target = os.path.join(directory, f"part-{run_id}.parquet")
+                con = duckdb.connect()
+                try:
+                    con.read_parquet(files, hive_partitioning=False).create_view(source)
+                    con.execute(view)
+                    con.execute(f"COPY (SELECT * FROM {deduplicated}) TO '{target}.tmp' (FORMAT parquet)")
+                finally:
+                    con.close()
+                os.replace(target + ".tmp", target)
+                for path in files:
+                    os.remove(path)
+                compacted += 1
+        return compacted
+
+    # Queries
+
+    def _files(self, table_dir, date_from, date_to):
+        """Parquet files of the UTC order_date partitions that can hold local dates date_from..date_to"""
+        root = self._path(table_dir)
+        if not os.path.isdir(root):
+            return []
+        first, last = (date_from - timedelta(days=1)).isoformat(), (date_to + timedelta(days=1)).isoformat()
+        files = []
+        for partition in sorted(os.listdir(root)):
+            partition_date = partition.removeprefix("order_date=")
+            if first <= partition_date <= last:
+                directory = os.path.join(root, partition)
+                files.extend(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet"))
+        return files
+
+    def _connect(self, date_from, date_to):
+        """DuckDB connection with orders / order_items / products / businesses views over the partitions in range"""
+        if not self.available():
+            raise MirrorUnavailable(f"no analytics mirror at {self.mirror_dir}")
+        orders_schema, items_schema, products_schema, _ = _schemas()
+        con = duckdb.connect()
+
+        # Dates are bucketed by business time zone: a mirror exported before the
+        # businesses snapshot existed can't answer until the next export
+        businesses_file = self._path(BUSINESSES_DIR, "businesses.parquet")
+        if not os.path.exists(businesses_file):
+            con.close()
+            raise MirrorUnavailable(f"no business time zones in {self.mirror_dir} yet")
+        con.read_parquet(businesses_file).create_view("businesses")
+
+        products_file = self._path(PRODUCTS_DIR, "products.parquet")
+        if os.path.exists(products_file):
+            con.read_parquet(products_file).create_view("products")
+        else:
+            con.register("products", products_schema.empty_table())
+
+        for source, table_dir, schema in [("order_files", ORDERS_DIR, orders_schema), ("item_files", ITEMS_DIR, items_schema)]:
+            files = self._files(table_dir, date_from, date_to)
+            if files:
+                con.read_parquet(files, hive_partitioning=False).create_view(source)
+            else:
+                con.register(source, schema.empty_table())
+        con.execute(ORDERS_VIEW)
+        con.execute(ITEMS_VIEW)
+        return con
+
+    def query(self, sql, params, date_from, date_to):
+        """Run sql over the mirror for local dates date_from..date_to (dates); rows as dicts"""
+        con = self._connect(date_from, date_to)
+        try:
+            cursor = con.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            con.close()
+
+    def product_daily_sales(self, business_account_id, product_ids, date_from, date_to):
+        date_from, date_to = _as_date(date_from), _as_date(date_to)
+        return self.query(
+            PRODUCT_DAILY_SALES_QUERY, [str(business_account_id), list(product_ids), date_from, date_to], date_from, date_to
+        )
+
+    def channel_trends(self, business_account_id, date_from, date_to, granularity="month"):
+        date_from, date_to = _as_date(date_from), _as_date(date_to)
+        return self.query(CHANNEL_TRENDS_QUERY, [granularity, str(business_account_id), date_from, date_to], date_from, date_to)
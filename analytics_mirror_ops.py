@@ -0,0 +1,18 @@
+from dagster import op, OpExecutionContext
+from services.daily_metrics_service import DailyMetricsService
+
+@op
+def export_analytics_mirror_op(context: OpExecutionContext):
+    """Incrementally export order tables to the local Parquet analytics mirror"""
+    context.log.info("Exporting changed orders to the analytics mirror...")
+    
+    metrics_service = DailyMetricsService()
+    stats = metrics_service.refresh_analytics_mirror()
+    
+    context.log.info(
+        f"Analytics mirror updated: {stats['orders']} orders, {stats['items']} items, "
+        f"{stats['products']} products; {stats['compacted_partitions']} partitions compacted; "
+        f"watermark {stats['watermark']}"
+    )
+    
+    return stats
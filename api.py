@@ -1,10 +1,46 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import date
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from datetime import date, datetime, timedelta
+import asyncio
+import hashlib
+import anyio
+import math
+import os
+import uuid
 import psycopg2
+from psycopg2.errors import QueryCanceled
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+from request_coalescer import RequestCoalescer
+from db_pool import PooledDatabase, ReplicaRouter, config_from_dsn
+from resilience import CircuitBreaker, CancelToken
+from caches import TTLCache, SharedCache, RunningTotals
+from admission import TenantAdmission, AdmissionRejected
+from json_response import FastJSONResponse, json_response, raw_json_response, compressed_response
+from order_records import build_contact_map, build_order_records, contact_ids, build_item_map, attach_items
+from flyer_template_cache import FlyerTemplateCache, ANY_BUSINESS
+from snapshots import load_snapshot, watermark_key
+from report_store import report_sections, load_sections
+from flyer_export import EXPORT_FORMATS, EXPORT_QUERY, flyer_days, matrix_rows, csv_chunks, write_xlsx, file_chunks
+from rollups import (
+    format_top_products, format_top_customers, format_returning_customers, format_cohorts,
+    cohort_range, TOP_PRODUCTS_ORDERINGS
+)
+from query_registry import (
+    execute_named, prepare_named, ORDERS_DELTA, ORDERS_DELTA_ALL, NEW_CUSTOMERS_DELTA, NEW_CUSTOMERS_DELTA_ALL,
+    DAILY_ORDERS, DAILY_ORDERS_ALL, DAILY_ORDERS_SINCE, DAILY_ORDERS_SINCE_ALL, ORDER_ITEMS_BY_ORDER_IDS, CONTACTS_BY_IDS,
+    TOP_PRODUCTS, TOP_PRODUCTS_ALL, TOP_CUSTOMERS, TOP_CUSTOMERS_ALL,
+    RETURNING_CUSTOMERS, RETURNING_CUSTOMERS_ALL, COHORT_RETENTION, COHORT_RETENTION_ALL, ROLLUPS_WATERMARK,
+    PORTFOLIO_METRICS, PORTFOLIO_SORTS, ORDERS_WATERMARK, BUSINESS_ACCOUNTS_WATERMARK,
+    SINCE_START, encode_since, decode_since, since_position
+)
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
-app = FastAPI()
+# Identical concurrent dashboard queries share one in-flight computation
+coalescer = RequestCoalescer()
 
 # Enable CORS so your HTML page can call this API
 app.add_middleware(
@@ -13,6 +49,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "X-Cache"],
 )
 
 # Database configurations
@@ -32,6 +69,160 @@ DB_CONFIG_ATHENA = {
     "port": 5432
 }
 
+# Read replicas of DB_CONFIG_PROD for dashboard reads, e.g.
+# [{"host": "replica-1", "database": ..., "user": ..., "password": ..., "port": 5432}].
+# DASHBOARD_PRIMARY_DSN / DASHBOARD_REPLICA_DSNS (comma-separated libpq DSNs) override these,
+# and DASHBOARD_ATHENA_DSN overrides DB_CONFIG_ATHENA, which is how routing is exercised and
+# load tested (benchmarks/loadtest.py) against local Postgres instances.
+DB_CONFIG_REPLICAS = []
+
+# Replicas lagging more than this are skipped for queries about today
+REPLICA_MAX_LAG_SECONDS = 30
+
+if os.environ.get("DASHBOARD_PRIMARY_DSN"):
+    DB_CONFIG_PROD = config_from_dsn(os.environ["DASHBOARD_PRIMARY_DSN"])
+if os.environ.get("DASHBOARD_REPLICA_DSNS"):
+    DB_CONFIG_REPLICAS = [config_from_dsn(dsn) for dsn in os.environ["DASHBOARD_REPLICA_DSNS"].split(",") if dsn.strip()]
+if os.environ.get("DASHBOARD_ATHENA_DSN"):
+    DB_CONFIG_ATHENA = config_from_dsn(os.environ["DASHBOARD_ATHENA_DSN"])
+
+# Statement timeouts (milliseconds). Pools default to STATEMENT_TIMEOUT_MS; the
+# others are applied per query so one runaway statement can't hold a request forever.
+STATEMENT_TIMEOUT_MS = 8000
+WATERMARK_TIMEOUT_MS = 1000
+FLYER_SALES_TIMEOUT_MS = 15000
+
+# Rows the flyer export's server-side cursor fetches per round trip
+FLYER_EXPORT_FETCH_ROWS = 2000
+ATHENA_STATEMENT_TIMEOUT_MS = 1500
+ATHENA_CONNECT_TIMEOUT_SECONDS = 2
+
+# Orders returned by /api/daily-orders, and what ?include= can add to each
+DAILY_ORDERS_LIMIT = 100
+DAILY_ORDERS_INCLUDES = ("items",)
+
+# Bounds for /api/top-products and /api/top-customers
+LEADERBOARD_MAX_DAYS = 92
+LEADERBOARD_MAX_LIMIT = 50
+
+# Page size bounds for /api/portfolio/metrics
+PORTFOLIO_DEFAULT_LIMIT = 50
+PORTFOLIO_MAX_LIMIT = 500
+
+# Bounds for /api/cohorts: number of weekly cohorts and weeks of retention per cohort
+MAX_COHORTS = 26
+MAX_RETENTION_WEEKS = 26
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Multi-process serving (gunicorn.conf.py sets these). Each database server may see up to
+# DASHBOARD_DB_CONNECTION_BUDGET connections from all workers together; every worker's pools
+# get an equal share, less the primary's flyer template listener connection.
+API_WORKERS = int(os.environ.get("DASHBOARD_WORKERS", "1"))
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 10
+if os.environ.get("DASHBOARD_DB_CONNECTION_BUDGET"):
+    POOL_MAX_CONNECTIONS = max(2, int(os.environ["DASHBOARD_DB_CONNECTION_BUDGET"]) // API_WORKERS - 1)
+    POOL_MIN_CONNECTIONS = 2
+
+# SQLite file (on /dev/shm) holding contacts_cache for all workers; without it each
+# process keeps its own
+SHARED_CACHE_PATH = os.environ.get("DASHBOARD_SHARED_CACHE")
+
+def _per_worker(limit):
+    """
+    A limit meant for the whole API, as this worker's share (admission is per process).
+    Rates split exactly. Counts are rounded down so the workers together stay within the
+    limit, but never below 1: with more workers than the limit allows, each still admits one.
+    """
+    return max(1, limit // API_WORKERS) if isinstance(limit, int) else limit / API_WORKERS
+
+# Prepared on every pooled connection when a worker starts (warm_worker)
+WARM_QUERIES = (ORDERS_WATERMARK, ORDERS_DELTA, NEW_CUSTOMERS_DELTA, DAILY_ORDERS)
+WARM_ATHENA_QUERIES = (CONTACTS_BY_IDS,)
+
+def _pool(name, config, statement_timeout_ms):
+    return PooledDatabase(name, config, minconn=POOL_MIN_CONNECTIONS, maxconn=POOL_MAX_CONNECTIONS,
+                          statement_timeout_ms=statement_timeout_ms)
+
+PROD_DB = _pool("primary", DB_CONFIG_PROD, STATEMENT_TIMEOUT_MS)
+ATHENA_DB = _pool(
+    "athena",
+    {**DB_CONFIG_ATHENA, "connect_timeout": ATHENA_CONNECT_TIMEOUT_SECONDS},
+    ATHENA_STATEMENT_TIMEOUT_MS
+)
+router = ReplicaRouter(
+    PROD_DB,
+    [_pool(f"replica-{i + 1}", config, STATEMENT_TIMEOUT_MS) for i, config in enumerate(DB_CONFIG_REPLICAS)],
+    max_lag_seconds=REPLICA_MAX_LAG_SECONDS
+)
+
+def _cache(name, max_entries, ttl):
+    if SHARED_CACHE_PATH:
+        return SharedCache(SHARED_CACHE_PATH, name, max_entries=max_entries, ttl=ttl)
+    return TTLCache(max_entries=max_entries, ttl=ttl)
+
+# While athena is failing, orders are served with cached (or "Guest") contact details
+athena_breaker = CircuitBreaker("athena", failure_threshold=3, reset_timeout=30)
+contacts_cache = _cache("contacts", max_entries=50000, ttl=6 * 3600)
+
+# Per-business rate limits and a concurrency cap on expensive endpoints, for the API as a
+# whole: each worker enforces its share. Requests without a business_account_id (the
+# dashboard page, for every viewer) share one bucket, sized for all of them rather than
+# for one business. Throttled requests are answered from response_cache (last good
+# payload per request) when possible. response_cache stays in the process: it is read
+# and written on the event loop, where SQLite I/O would stall it.
+admission = TenantAdmission(
+    rate_per_second=_per_worker(2.0),
+    burst=_per_worker(20),
+    max_active_total=_per_worker(8),
+    max_active_per_tenant=_per_worker(2),
+    max_pending_per_tenant=_per_worker(4),
+    max_queue=_per_worker(64),
+    anonymous_rate_per_second=_per_worker(20.0),
+    anonymous_burst=_per_worker(100)
+)
+response_cache = TTLCache(max_entries=5000, ttl=15 * 60)
+
+# Dashboard totals per (report_date, business) for days still receiving orders, for since
+# requests: advanced by the rows after their cursor, and rebuilt from scratch by every full
+# request and at the latest every max_age seconds
+running_totals = RunningTotals(max_entries=5000, max_age=300)
+
+# Payloads served from the nightly dashboard snapshots (snapshots.py)
+snapshot_hits = {"served": 0}
+
+# Active flyer template + products per business; LISTENs on the primary for the
+# NOTIFY trigger in sql/flyer_template_notify.sql and revalidates by updated_at otherwise
+flyer_templates = FlyerTemplateCache(listen_config=DB_CONFIG_PROD, revalidate_after=60)
+
+def warm_worker():
+    """
+    Open this process's pool connections and prepare the hot queries on them, so a freshly
+    forked worker's first requests don't pay for connecting. A database that can't be
+    reached is left cold; requests connect to it as usual.
+    """
+    def prepare(queries):
+        def run(conn):
+            with conn.cursor() as cursor:
+                prepare_named(cursor, queries)
+        return run
+    
+    for db, queries in [(PROD_DB, WARM_QUERIES), *((replica, WARM_QUERIES) for replica in router.replicas),
+                        (ATHENA_DB, WARM_ATHENA_QUERIES)]:
+        try:
+            db.warm(prepare(queries))
+        except Exception as e:
+            print(f"Could not warm {db.name} connections: {e}")
+
+def _is_recent(report_date):
+    """True if report_date may still be receiving orders (today or, across time zones, yesterday)"""
+    try:
+        return date.fromisoformat(str(report_date)) >= date.today() - timedelta(days=1)
+    except ValueError:
+        return True
+
 # Channel type mapping
 CHANNEL_MAPPING = {
     "0199947b-b0a0-7885-a32a-4cb744df96a5": "Website",
@@ -44,61 +235,294 @@ CHANNEL_MAPPING = {
 def read_root():
     return {"message": "Daily Metrics API is running"}
 
+# Template part of the flyer watermark comes from flyer_templates (id + updated_at + a
+# digest of the sections and products it resolved to)
+FLYER_WATERMARK_QUERY = """
+    SELECT COUNT(*) || ':' || COALESCE(MAX(ot.updated_at)::text, '') as orders_watermark
+    FROM business_accounts ba
+    JOIN order_transactions ot ON ot.business_account_id = ba.id
+    WHERE ba.id = %(business_account_id)s::uuid
+        AND ot.created_at >= (%(start_date)s::date)::timestamp AT TIME ZONE ba.timezone
+        AND ot.created_at < (%(end_date)s::date + 1)::timestamp AT TIME ZONE ba.timezone
+"""
+
+def _resolve_flyer(cursor, business_account_id):
+    """The business's active flyer, else the newest active flyer of any business"""
+    flyer = flyer_templates.resolve(cursor, business_account_id) if business_account_id else None
+    if flyer is None:
+        flyer = flyer_templates.resolve(cursor, ANY_BUSINESS)
+    return flyer
+
+def _flyer_contents_digest(flyer):
+    """
+    Digest of a flyer's sections and products: editing the items of a section doesn't
+    touch the template's updated_at, but changes the payload
+    """
+    sections = [(str(section['id']), section['title'], section['serial_number']) for section in flyer.sections]
+    products = [(str(product['product_retailer_id']), product['name']) for product in flyer.products]
+    return hashlib.sha1(repr((sections, products)).encode()).hexdigest()
+
+def _flyer_watermark(cursor, business_account_id):
+    flyer = _resolve_flyer(cursor, business_account_id)
+    if flyer is None:
+        return None
+    cursor.execute(FLYER_WATERMARK_QUERY, {
+        "business_account_id": flyer.business_account_id,
+        "start_date": flyer.template['start_date'],
+        "end_date": flyer.template['end_date']
+    })
+    return (str(flyer.template['id']), str(flyer.version), _flyer_contents_digest(flyer),
+            cursor.fetchone()['orders_watermark'])
+
+def _etag(endpoint, params, watermark):
+    # Weak: the gzip, br and identity encodings of a payload share the tag but not their bytes
+    digest = hashlib.sha1(repr((endpoint, params, watermark)).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+def _compute_etag(endpoint, *params):
+    """Build an ETag from the endpoint's watermark; None if it can't be determined"""
+    try:
+        if endpoint == "weekly-flyer-performance":
+            with router.read_connection(fresh=True, statement_timeout_ms=WATERMARK_TIMEOUT_MS) as conn, \
+                    conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                watermark = _flyer_watermark(cursor, params[0])
+        else:
+            report_date, business_account_id = params[:2]
+            with router.read_connection(fresh=_is_recent(report_date), statement_timeout_ms=WATERMARK_TIMEOUT_MS) as conn, \
+                    conn.cursor() as cursor:
+                execute_named(cursor, ORDERS_WATERMARK, (report_date, business_account_id))
+                watermark = cursor.fetchone()
+                if endpoint == "portfolio-metrics":
+                    execute_named(cursor, BUSINESS_ACCOUNTS_WATERMARK)
+                    watermark += cursor.fetchone()
+    except Exception:
+        return None
+    
+    return _etag(endpoint, params, watermark)
+
+def _etag_and_snapshot(endpoint, report_date, business_account_id, *params, snapshot=True):
+    """
+    ETag of a per-day endpoint, and the nightly snapshot of its payload when one was stored
+    for this business and day at the current watermark (else None), on one connection
+    """
+    try:
+        with router.read_connection(fresh=_is_recent(report_date), statement_timeout_ms=WATERMARK_TIMEOUT_MS) as conn, \
+                conn.cursor() as cursor:
+            execute_named(cursor, ORDERS_WATERMARK, (report_date, business_account_id))
+            watermark = cursor.fetchone()
+            payload = None
+            if snapshot and business_account_id:
+                payload = load_snapshot(cursor, endpoint, business_account_id, report_date, watermark_key(watermark))
+    except Exception:
+        return None, None
+    
+    return _etag(endpoint, (report_date, business_account_id, *params), watermark), payload
+
+def _snapshot_response(request, payload, etag):
+    """A stored payload (serialized JSON) served as is"""
+    snapshot_hits["served"] += 1
+    headers = {"X-Cache": "snapshot"}
+    if etag:
+        headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return raw_json_response(request, payload, headers=headers)
+
+def _etag_matches(request, etag):
+    if not etag:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match calls for
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates or "*" in candidates
+
+def _not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def _is_complete(result):
+    """
+    Neither an error nor served with degraded contact details (athena down): only these are
+    tagged and kept, so clients get the full payload once athena is back
+    """
+    return "error" not in result and not result.get("contacts_degraded")
+
+def _etag_headers(etag, result):
+    if etag and _is_complete(result):
+        return {"ETag": etag, "Cache-Control": "no-cache"}
+    return {}
+
+def _error_type(e):
+    """Classify a handler exception so timeouts and outages aren't reported as plain errors"""
+    if isinstance(e, QueryCanceled):
+        return "timeout"
+    if isinstance(e, (psycopg2.OperationalError, PoolError)):
+        return "unavailable"
+    return "internal"
+
+# Error payloads keep their shape; timeouts, outages and missing reports get a matching status code
+ERROR_STATUS = {"timeout": 504, "unavailable": 503, "not_found": 404}
+
+def _query_response(request, result, etag=None, key=None):
+    status_code = ERROR_STATUS.get(result.get("error_type"), 200)
+    if key is not None and _is_complete(result):
+        response_cache.set(key, result)
+    return json_response(request, result, status_code=status_code, headers=_etag_headers(etag, result))
+
+def _rejected_response(request, key, rejection):
+    """Serve the last good payload for a throttled request, or a 429 if there is none"""
+    cached = response_cache.get(key)
+    if cached is not None:
+        return json_response(request, cached, headers={"X-Cache": "stale", "Cache-Control": "no-store"})
+    retry_after = str(max(1, math.ceil(rejection.retry_after)))
+    return json_response(request, {
+        "error": "Too many requests for this business, try again shortly",
+        "error_type": rejection.reason,
+        "retry_after": int(retry_after)
+    }, status_code=429, headers={"Retry-After": retry_after})
+
+# key -> {"waiters": n, "token": CancelToken} for computations started by _run_cancellable
+_cancel_scopes = {}
+
+async def _run_cancellable(request, key, fn, *args):
+    """
+    Run fn(*args, cancel_token=...) in the threadpool, coalesced with identical requests.
+    Once every client waiting on the computation has disconnected, its queries are cancelled.
+    Returns None if this request's client disconnected.
+    """
+    scope = _cancel_scopes.get(key)
+    if scope is None:
+        scope = _cancel_scopes[key] = {"waiters": 0, "token": CancelToken()}
+    scope["waiters"] += 1
+    token = scope["token"]
+    
+    task = asyncio.ensure_future(coalescer.do_async(key, run_in_threadpool, fn, *args, cancel_token=token))
+    disconnected = False
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if not task.done() and await request.is_disconnected():
+                disconnected = True
+                task.cancel()
+                return None
+        return task.result()
+    finally:
+        scope["waiters"] -= 1
+        if scope["waiters"] == 0:
+            if _cancel_scopes.get(key) is scope:
+                del _cancel_scopes[key]
+            if disconnected:
+                # Nobody is left waiting: stop the database work and don't hand it to new requests
+                token.cancel()
+                coalescer.forget(key)
+
+def _client_gone():
+    # 499: client closed the request before a response was ready (nginx convention)
+    return Response(status_code=499)
+
 @app.get("/api/daily-metrics")
-def get_daily_metrics(report_date: str = "2025-12-28", business_account_id: str = None):
-    """Get daily metrics: revenue, transactions, new customers, items sold"""
+async def get_daily_metrics(request: Request, report_date: str = "2025-12-28", business_account_id: str = None,
+                            since: str = None):
+    """
+    Get daily metrics: revenue, transactions, new customers, items sold.
+    Every response carries next_since; passing it back as since adds "delta", the
+    KPIs of the orders and customers that arrived in between. The totals of a since
+    response are kept running from such deltas, so they can miss changes to orders
+    already counted until the next full request.
+    """
+    if since is not None:
+        try:
+            decode_since(since, 2)
+        except ValueError:
+            return _bad_request(request, "Invalid since cursor")
+    
+    key = ("daily-metrics", report_date, business_account_id, since)
     try:
-        conn = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        base_query = """
-            SELECT 
-                COALESCE(SUM(total_order_value), 0) as total_revenue,
-                COUNT(*) as total_transactions,
-                COALESCE(SUM(number_of_items), 0) as items_sold
-            FROM order_transactions 
-            WHERE status = 'completed'
-                AND DATE(created_at AT TIME ZONE 'EST') = %s
-        """
-        
-        params = [report_date]
-        
-        if business_account_id:
-            base_query += " AND business_account_id = %s"
-            params.append(business_account_id)
-        
-        cursor.execute(base_query, params)
-        metrics = cursor.fetchone()
-        
-        # Get new customers for the day
-        customer_query = """
-            SELECT COUNT(*) as new_customers
-            FROM customers
-            WHERE DATE(created_at AT TIME ZONE 'EST') = %s
-        """
-        
-        customer_params = [report_date]
-        
-        if business_account_id:
-            customer_query += " AND business_account_id = %s"
-            customer_params.append(business_account_id)
-        
-        cursor.execute(customer_query, customer_params)
-        new_customers = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    # Deltas are small and a watermark would scan the whole day: conditional GETs and
+    # nightly snapshots are for full payloads
+    etag = None
+    if since is None:
+        etag, snapshot = await run_in_threadpool(_etag_and_snapshot, "daily-metrics", report_date, business_account_id)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        if snapshot is not None:
+            return _snapshot_response(request, snapshot, etag)
+    
+    result = await _run_cancellable(request, key, _fetch_daily_metrics, report_date, business_account_id, since)
+    if result is None:
+        return _client_gone()
+    # A delta is never served again: only full payloads are kept for throttled requests
+    return _query_response(request, result, etag, key if since is None else None)
+
+def _metrics_delta(cursor, report_date, business_account_id, since):
+    """
+    KPIs of the day's orders and new customers after since (positions for orders and
+    customers), and the positions they reach. From SINCE_START this is the whole day.
+    """
+    (orders_after, orders_after_id), (customers_after, customers_after_id) = since
+    # Named queries are prepared once per pooled connection and executed by name
+    if business_account_id:
+        execute_named(cursor, ORDERS_DELTA, (report_date, business_account_id, orders_after, orders_after_id))
+        orders = cursor.fetchone()
+        execute_named(cursor, NEW_CUSTOMERS_DELTA, (report_date, business_account_id, customers_after, customers_after_id))
+        customers = cursor.fetchone()
+    else:
+        execute_named(cursor, ORDERS_DELTA_ALL, (report_date, orders_after, orders_after_id))
+        orders = cursor.fetchone()
+        execute_named(cursor, NEW_CUSTOMERS_DELTA_ALL, (report_date, customers_after, customers_after_id))
+        customers = cursor.fetchone()
+    
+    delta = {
+        "total_revenue": float(orders['total_revenue']),
+        "total_transactions": orders['total_transactions'],
+        "items_sold": orders['items_sold'],
+        "new_customers": customers['new_customers']
+    }
+    return delta, encode_since(since_position(orders, since[0]), since_position(customers, since[1]))
+
+def _fetch_daily_metrics(report_date, business_account_id, since=None, cancel_token=None):
+    try:
+        recent = _is_recent(report_date)
+        totals_key = (report_date, business_account_id)
+        with router.read_connection(fresh=recent, cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            totals, since_delta = None, None
+            
+            # Step 1: A since request on a day still receiving orders: running totals, plus what
+            # arrived after their cursor. A full payload is always totalled from the whole day, as
+            # deltas miss status changes and late commits that its ETag (the orders watermark) sees
+            cached = running_totals.get(totals_key) if recent and since is not None else None
+            if cached is not None:
+                _, cached_since = cached
+                delta, reached = _metrics_delta(cursor, report_date, business_account_id, decode_since(cached_since, 2))
+                advanced = running_totals.advance(totals_key, cached_since, delta, reached)
+                if advanced is not None:
+                    totals, next_since = advanced
+                    if since == cached_since:
+                        since_delta = delta
+            
+            # Step 2: Otherwise total the whole day (and keep it running if the day is recent)
+            if totals is None:
+                totals, next_since = _metrics_delta(cursor, report_date, business_account_id, [SINCE_START, SINCE_START])
+                if recent:
+                    running_totals.seed(totals_key, totals, next_since)
+            
+            # Step 3: The caller's own delta, when its cursor isn't the one the totals moved from
+            if since is not None and since_delta is None:
+                since_delta, next_since = _metrics_delta(cursor, report_date, business_account_id, decode_since(since, 2))
         
-        return {
-            "total_revenue": float(metrics['total_revenue']),
-            "total_transactions": metrics['total_transactions'],
-            "items_sold": metrics['items_sold'],
-            "new_customers": new_customers['new_customers'],
-            "report_date": report_date
-        }
+        result = {**totals, "report_date": report_date, "next_since": next_since}
+        if since is not None:
+            result["since"] = since
+            result["delta"] = since_delta
+        return result
     except Exception as e:
         return {
             "error": str(e),
+            "error_type": _error_type(e),
             "total_revenue": 0,
             "total_transactions": 0,
             "items_sold": 0,
@@ -106,154 +530,842 @@ def get_daily_metrics(report_date: str = "2025-12-28", business_account_id: str
         }
 
 @app.get("/api/daily-orders")
-def get_daily_orders(report_date: str = "2025-12-28", business_account_id: str = None):
+async def get_daily_orders(request: Request, report_date: str = "2025-12-28", business_account_id: str = None,
+                           since: str = None, include: str = None):
     """
     Get daily orders with customer details from both databases.
     Flow: order_transactions -> customers (get chatwoot_contact_id) -> contacts (get name & phone)
+    Without since: the newest orders. With since (a previous response's next_since): only
+    the orders after it, oldest first, up to DAILY_ORDERS_LIMIT at a time (has_more if there are more).
+    include=items nests each order's line items, fetched for the whole page in one query.
     """
+    if since is not None:
+        try:
+            decode_since(since, 1)
+        except ValueError:
+            return _bad_request(request, "Invalid since cursor")
+    includes = {part.strip() for part in (include or "").split(",") if part.strip()}
+    if not includes <= set(DAILY_ORDERS_INCLUDES):
+        return _bad_request(request, f"include must be a comma-separated subset of {DAILY_ORDERS_INCLUDES}")
+    include_items = "items" in includes
+    
+    key = ("daily-orders", report_date, business_account_id, since, include_items)
     try:
-        # Step 1: Connect to afto_prod_new and get order data with chatwoot_contact_id
-        conn_prod = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor_prod = conn_prod.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-            SELECT 
-                ot.order_number,
-                ot.id as order_id,
-                ot.customer_id,
-                c.chatwoot_contact_id,
-                ot.total_order_value,
-                ot.number_of_items,
-                ot.status,
-                ot.payment_status,
-                ot.delivery_type,
-                ot.created_at,
-                ot.channel_type_id,
-                ot.order_tax,
-                ot.order_value_sub_total
-            FROM order_transactions ot
-            LEFT JOIN customers c ON ot.customer_id = c.id
-            WHERE ot.status = 'completed'
-                AND DATE(ot.created_at AT TIME ZONE 'EST') = %s
-        """
-        
-        params = [report_date]
-        
-        if business_account_id:
-            query += " AND ot.business_account_id = %s"
-            params.append(business_account_id)
-        
-        query += " ORDER BY ot.created_at DESC LIMIT 100"
-        
-        cursor_prod.execute(query, params)
-        orders = cursor_prod.fetchall()
-        
-        cursor_prod.close()
-        conn_prod.close()
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    etag = None
+    if since is None:
+        etag, snapshot = await run_in_threadpool(
+            _etag_and_snapshot, "daily-orders", report_date, business_account_id, include_items, snapshot=not include_items
+        )
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        if snapshot is not None:
+            return _snapshot_response(request, snapshot, etag)
+    
+    result = await _run_cancellable(request, key, _fetch_daily_orders, report_date, business_account_id, since, include_items)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, etag, key if since is None else None)
+
+def _lookup_contacts(chatwoot_ids, cancel_token=None):
+    """
+    Contact details from athena, behind a circuit breaker.
+    Returns (details, degraded). While athena is failing or its breaker is open the
+    lookup returns cached contacts immediately and the rest of the orders show as 'Guest'.
+    """
+    if not athena_breaker.allow():
+        return contacts_cache.get_many(chatwoot_ids), True
+    
+    try:
+        with ATHENA_DB.connection(cancel_token=cancel_token) as conn_athena, conn_athena.cursor() as cursor_athena:
+            execute_named(cursor_athena, CONTACTS_BY_IDS, (chatwoot_ids,))
+            customer_details = build_contact_map(cursor_athena.fetchall())
+    except psycopg2.Error:
+        if cancel_token is not None and cancel_token.cancelled:
+            athena_breaker.release_trial()
+            raise
+        athena_breaker.record_failure()
+        return contacts_cache.get_many(chatwoot_ids), True
+    except BaseException:
+        # Says nothing about athena either way; a half-open trial must still be resolved
+        athena_breaker.release_trial()
+        raise
+    
+    athena_breaker.record_success()
+    contacts_cache.set_many(customer_details)
+    return customer_details, False
+
+def _fetch_daily_orders(report_date, business_account_id, since=None, include_items=False, cancel_token=None):
+    try:
+        # Step 1: Connect to afto_prod_new and get order data with chatwoot_contact_id.
+        # Plain tuple cursor: rows go straight into OrderRecords without a dict per row.
+        with router.read_connection(fresh=_is_recent(report_date), cancel_token=cancel_token) as conn_prod, \
+                conn_prod.cursor() as cursor_prod:
+            if since is not None:
+                [(after, after_id)] = decode_since(since, 1)
+                if business_account_id:
+                    execute_named(cursor_prod, DAILY_ORDERS_SINCE,
+                                  (report_date, business_account_id, after, after_id, DAILY_ORDERS_LIMIT))
+                else:
+                    execute_named(cursor_prod, DAILY_ORDERS_SINCE_ALL, (report_date, after, after_id, DAILY_ORDERS_LIMIT))
+            elif business_account_id:
+                execute_named(cursor_prod, DAILY_ORDERS, (report_date, business_account_id, DAILY_ORDERS_LIMIT))
+            else:
+                execute_named(cursor_prod, DAILY_ORDERS_ALL, (report_date, DAILY_ORDERS_LIMIT))
+            rows = cursor_prod.fetchall()
+            
+            # Line items of every order on the page in one query, not one per order
+            item_rows = []
+            if include_items and rows:
+                execute_named(cursor_prod, ORDER_ITEMS_BY_ORDER_IDS, ([row[1] for row in rows],))
+                item_rows = cursor_prod.fetchall()
         
         # Step 2: If we have orders, get customer details from afto_athena_prod
-        if orders:
-            # Collect all chatwoot_contact_ids
-            chatwoot_ids = [order['chatwoot_contact_id'] for order in orders if order['chatwoot_contact_id']]
-            
-            customer_details = {}
-            
-            if chatwoot_ids:
-                conn_athena = psycopg2.connect(**DB_CONFIG_ATHENA)
-                cursor_athena = conn_athena.cursor(cursor_factory=RealDictCursor)
-                
-                # Fetch customer details from contacts table
-                cursor_athena.execute("""
-                    SELECT 
-                        id,
-                        name,
-                        phone_number,
-                        email
-                    FROM contacts
-                    WHERE id = ANY(%s)
-                """, (chatwoot_ids,))
-                
-                contacts = cursor_athena.fetchall()
-                
-                # Create a mapping of chatwoot_contact_id -> customer details
-                for contact in contacts:
-                    customer_details[contact['id']] = {
-                        'name': contact['name'] or 'Guest',
-                        'phone_number': contact['phone_number'] or 'N/A',
-                        'email': contact['email']
-                    }
-                
-                cursor_athena.close()
-                conn_athena.close()
-            
-            # Step 3: Merge customer details into orders
-            for order in orders:
-                chatwoot_id = order['chatwoot_contact_id']
-                
-                if chatwoot_id and chatwoot_id in customer_details:
-                    order['customer_name'] = customer_details[chatwoot_id]['name']
-                    order['customer_phone'] = customer_details[chatwoot_id]['phone_number']
-                    order['customer_email'] = customer_details[chatwoot_id]['email']
-                else:
-                    order['customer_name'] = 'Guest'
-                    order['customer_phone'] = 'N/A'
-                    order['customer_email'] = None
-                
-                # Map channel type
-                channel_id = str(order['channel_type_id'])
-                order['channel_name'] = CHANNEL_MAPPING.get(channel_id, 'Unknown')
-                
-                # Format timestamp
-                if order['created_at']:
-                    order['created_at'] = order['created_at'].isoformat()
-                
-                # Format phone for display (mask if needed)
-                if order['customer_phone'] and order['customer_phone'] != 'N/A':
-                    phone = order['customer_phone']
-                    if len(phone) > 6:
-                        order['customer_phone_display'] = phone[:6] + '...'
-                    else:
-                        order['customer_phone_display'] = phone
-                else:
-                    order['customer_phone_display'] = 'N/A'
+        customer_details = {}
+        contacts_degraded = False
+        chatwoot_ids = contact_ids(rows)
         
-        return {
+        if chatwoot_ids:
+            customer_details, contacts_degraded = _lookup_contacts(chatwoot_ids, cancel_token)
+        
+        # Step 3: Merge customer details, channel names and display phones in one pass
+        orders = build_order_records(rows, customer_details, CHANNEL_MAPPING)
+        if include_items:
+            orders = attach_items(orders, build_item_map(item_rows))
+        
+        # Step 4: Cursor for the next delta: the newest order seen (first row of a full list, last of a delta)
+        if since is not None:
+            newest = orders[-1] if orders else None
+        else:
+            newest = orders[0] if orders else None
+        next_since = encode_since((newest.created_at, newest.order_id)) if newest else (since or encode_since(SINCE_START))
+        
+        result = {
             "orders": orders,
             "total_orders": len(orders),
-            "report_date": report_date
+            "report_date": report_date,
+            "contacts_degraded": contacts_degraded,
+            "next_since": next_since
         }
+        if since is not None:
+            result["since"] = since
+            result["has_more"] = len(orders) == DAILY_ORDERS_LIMIT
+        return result
         
     except Exception as e:
         import traceback
         return {
             "error": str(e),
+            "error_type": _error_type(e),
             "traceback": traceback.format_exc(),
             "orders": [],
             "total_orders": 0
         }
 
+@app.get("/api/weekly-flyer-performance")
+async def get_weekly_flyer_performance(request: Request, business_account_id: str = None):
+    """
+    Get weekly flyer products performance showing daily sales breakdown.
+    Returns data in format: {product_name: {day1: quantity, day2: quantity, ...}, totals: {...}}
+    """
+    key = ("weekly-flyer-performance", business_account_id)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    etag = await run_in_threadpool(_compute_etag, "weekly-flyer-performance", business_account_id)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    
+    # Expensive: limited concurrency per tenant, with a fair queue across tenants
+    try:
+        async with admission.expensive_slot(business_account_id):
+            result = await _run_cancellable(request, key, _fetch_weekly_flyer_performance, business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, etag, key)
+
+def _fetch_weekly_flyer_performance(business_account_id, cancel_token=None):
+    try:
+        with router.read_connection(fresh=True, statement_timeout_ms=FLYER_SALES_TIMEOUT_MS,
+                                    cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        
+            # Step 1: Get active Weekly Flyer template (the business's own, else the newest of any
+            # business) with its sections and products, from flyer_templates unless it changed
+            flyer = _resolve_flyer(cursor, business_account_id)
+            template = flyer.template if flyer else None
+        
+            if not template:
+                # Check if ANY templates exist
+                cursor.execute("""
+                    SELECT 
+                        COUNT(*) as count, 
+                        COUNT(*) FILTER (WHERE status = 'active') as active_count,
+                        COUNT(*) FILTER (WHERE name ILIKE '%weekly%flyer%') as weekly_flyer_count,
+                        COUNT(*) FILTER (WHERE name ILIKE '%weekly%flyer%' AND status = 'active') as active_weekly_flyer_count
+                    FROM product_templates
+                """)
+                counts = cursor.fetchone()
+            
+                return {
+                    "error": "No active Weekly Flyer template found",
+                    "products": [],
+                    "template_info": None,
+                    "debug_info": {
+                        "total_templates": counts['count'],
+                        "active_templates": counts['active_count'],
+                        "weekly_flyer_templates": counts['weekly_flyer_count'],
+                        "active_weekly_flyer_templates": counts['active_weekly_flyer_count'],
+                        "business_account_id_filter": business_account_id,
+                        "search_criteria": "name = 'Weekly Flyer' OR name ILIKE '%weekly%flyer%' AND status = 'active'"
+                    }
+                }
+        
+            start_date = template['start_date']
+            end_date = template['end_date']
+        
+            # Step 2: Sections and products of the template (resolved with it in step 1)
+            if not flyer.sections:
+                return {
+                    "error": "No sections found for Weekly Flyer template",
+                    "products": [],
+                    "template_info": template
+                }
+        
+            template_products = flyer.products
+            product_retailer_ids = flyer.product_retailer_ids
+        
+            if not product_retailer_ids:
+                return {
+                    "error": "No products found in Weekly Flyer sections",
+                    "products": [],
+                    "template_info": template
+                }
+        
+            # Step 3: Get daily sales data for these products within the template date range,
+            # in the flyer business's local days (cast to UUID array)
+            cursor.execute("""
+                SELECT 
+                    oi.product_retailer_id,
+                    p.name as product_name,
+                    DATE(ot.created_at AT TIME ZONE ba.timezone) as sale_date,
+                    SUM(oi.quantity) as total_quantity,
+                    SUM(oi.quantity * oi.unit_price) as total_revenue
+                FROM business_accounts ba
+                JOIN order_transactions ot ON ot.business_account_id = ba.id
+                JOIN order_items oi ON oi.order_id = ot.id
+                JOIN products p ON oi.product_retailer_id = p.retailer_id
+                WHERE ba.id = %s::uuid
+                    AND oi.product_retailer_id = ANY(%s::uuid[])
+                    AND ot.status = 'completed'
+                    AND ot.created_at >= (%s::date)::timestamp AT TIME ZONE ba.timezone
+                    AND ot.created_at < (%s::date + 1)::timestamp AT TIME ZONE ba.timezone
+                GROUP BY oi.product_retailer_id, p.name, DATE(ot.created_at AT TIME ZONE ba.timezone)
+                ORDER BY p.name, sale_date
+            """, (flyer.business_account_id, product_retailer_ids, start_date, end_date))
+        
+            sales_data = cursor.fetchall()
+        
+        # Step 4: Format data for frontend
+        # Calculate number of days in the flyer period
+        start_dt = start_date if isinstance(start_date, datetime) else datetime.fromisoformat(str(start_date))
+        end_dt = end_date if isinstance(end_date, datetime) else datetime.fromisoformat(str(end_date))
+        num_days = (end_dt.date() - start_dt.date()).days + 1
+        
+        # Initialize product data structure
+        products_performance = {}
+        for product in template_products:
+            product_name = product['name']
+            products_performance[product_name] = {
+                'product_retailer_id': str(product['product_retailer_id']),
+                'daily_sales': {f'day_{i+1}': 0 for i in range(num_days)},
+                'total_quantity': 0,
+                'total_revenue': 0.0
+            }
+        
+        # Fill in actual sales data
+        for sale in sales_data:
+            product_name = sale['product_name']
+            sale_date = sale['sale_date']
+        
+            # Calculate which day of the flyer this sale occurred on
+            sale_dt = sale_date if isinstance(sale_date, datetime) else datetime.fromisoformat(str(sale_date))
+            day_offset = (sale_dt.date() - start_dt.date()).days
+        
+            if 0 <= day_offset < num_days:
+                day_key = f'day_{day_offset + 1}'
+                if product_name in products_performance:
+                    products_performance[product_name]['daily_sales'][day_key] += sale['total_quantity']
+                    products_performance[product_name]['total_quantity'] += sale['total_quantity']
+                    products_performance[product_name]['total_revenue'] += float(sale['total_revenue'])
+        
+        # Convert to list format for frontend
+        products_list = []
+        for product_name, data in products_performance.items():
+            product_entry = {
+                'product_name': product_name,
+                'total_quantity': data['total_quantity'],
+                'total_revenue': data['total_revenue']
+            }
+            # Add daily sales
+            for day_key, quantity in data['daily_sales'].items():
+                product_entry[day_key] = quantity
+        
+            products_list.append(product_entry)
+        
+        # Sort by total quantity sold (descending)
+        products_list.sort(key=lambda x: x['total_quantity'], reverse=True)
+        
+        return {
+            "products": products_list,
+            "template_info": {
+                "id": str(template['id']),
+                "name": template['name'],
+                "start_date": start_date.isoformat() if hasattr(start_date, 'isoformat') else str(start_date),
+                "end_date": end_date.isoformat() if hasattr(end_date, 'isoformat') else str(end_date),
+                "num_days": num_days,
+                "status": template['status']
+            },
+            "total_products": len(products_list)
+        }
+        
+    except Exception as e:
+        import traceback
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "traceback": traceback.format_exc(),
+            "products": [],
+            "template_info": None
+        }
+
+@app.get("/api/weekly-flyer-performance/export")
+async def export_weekly_flyer_performance(request: Request, business_account_id: str = None,
+                                          export_format: str = Query("csv", alias="format")):
+    """
+    The weekly flyer's product × day matrix as a CSV or XLSX download, one row per product.
+    Streamed from a server-side cursor as the rows are read, so memory doesn't grow with the
+    number of products or days. XLSX needs the optional xlsxwriter package.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return _bad_request(request, f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    
+    key = ("weekly-flyer-export", business_account_id)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    # Expensive, and for as long as the download lasts: the slot is released by the response
+    try:
+        await admission.acquire(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    response = None
+    try:
+        result = await _run_cancellable(request, key, _resolve_flyer_export, business_account_id)
+        if result is None:
+            return _client_gone()
+        if "error" in result:
+            return _query_response(request, result)
+        
+        flyer, days = result['flyer'], result['days']
+        filename = f"weekly-flyer-{days[0].isoformat()}-{days[-1].isoformat()}.{export_format}"
+        response = _AdmittedStreamingResponse(
+            _flyer_export_chunks(flyer, days, export_format), business_account_id,
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+        )
+        return response
+    finally:
+        if response is None:
+            admission.release(business_account_id)
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Streams chunks from a generator, then gives back the expensive slot it was admitted with"""
+
+    def __init__(self, chunks, tenant, **kwargs):
+        super().__init__(chunks, **kwargs)
+        self.chunks = chunks
+        self.tenant = tenant
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # Returns the connection now rather than when the generator is collected, if
+                # the client went away mid-download; off the event loop, as it rolls back
+                with anyio.CancelScope(shield=True):
+                    await run_in_threadpool(self.chunks.close)
+            finally:
+                admission.release(self.tenant)
+
+def _as_date(value):
+    value = value if isinstance(value, (date, datetime)) else datetime.fromisoformat(str(value))
+    return value.date() if isinstance(value, datetime) else value
+
+def _resolve_flyer_export(business_account_id, cancel_token=None):
+    try:
+        with router.read_connection(fresh=True, cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            flyer = _resolve_flyer(cursor, business_account_id)
+        
+        if flyer is None:
+            return {"error": "No active Weekly Flyer template found", "error_type": "not_found"}
+        if not flyer.product_retailer_ids:
+            return {"error": "No products found in Weekly Flyer sections", "error_type": "not_found"}
+        if not flyer.template['start_date'] or not flyer.template['end_date']:
+            return {"error": "Weekly Flyer template has no start or end date", "error_type": "not_found"}
+        days = flyer_days(_as_date(flyer.template['start_date']), _as_date(flyer.template['end_date']))
+        if not days:
+            return {"error": "Weekly Flyer template ends before it starts", "error_type": "not_found"}
+        return {"flyer": flyer, "days": days}
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e)
+        }
+
+def _flyer_export_chunks(flyer, days, export_format):
+    """
+    The export file's chunks, run by StreamingResponse in the threadpool. Headers have been
+    sent by the time the query runs, so an error here cuts the download short.
+    """
+    path = None
+    try:
+        with router.read_connection(fresh=True, statement_timeout_ms=FLYER_SALES_TIMEOUT_MS) as conn:
+            # A named cursor only lives inside a transaction
+            conn.autocommit = False
+            try:
+                with conn.cursor(name="weekly_flyer_export", cursor_factory=RealDictCursor) as cursor:
+                    cursor.itersize = FLYER_EXPORT_FETCH_ROWS
+                    cursor.execute(EXPORT_QUERY, {
+                        "template_id": flyer.template['id'],
+                        "business_account_id": flyer.business_account_id,
+                        "start_date": days[0],
+                        "end_date": days[-1]
+                    })
+                    rows = matrix_rows(cursor, days)
+                    if export_format == "xlsx":
+                        path = write_xlsx(rows, days)
+                    else:
+                        yield from csv_chunks(rows, days)
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+        
+        # The workbook is complete: the connection is back in the pool while it downloads
+        if path is not None:
+            yield from file_chunks(path)
+    finally:
+        if path is not None:
+            os.remove(path)
+
+def _leaderboard_range(report_date, days):
+    """(start_date, end_date) of the `days` days ending on report_date"""
+    end_date = date.fromisoformat(report_date)
+    days = max(1, min(days, LEADERBOARD_MAX_DAYS))
+    return (end_date - timedelta(days=days - 1)).isoformat(), end_date.isoformat()
+
+def _bad_request(request, message):
+    return json_response(request, {"error": message, "error_type": "bad_request"}, status_code=400)
+
+def _rollups_as_of(cursor):
+    execute_named(cursor, ROLLUPS_WATERMARK)
+    state = cursor.fetchone()
+    return state['watermark'] if state else None
+
+@app.get("/api/portfolio/metrics")
+async def get_portfolio_metrics(request: Request, report_date: str = Query("2025-12-28", alias="date"),
+                                sort: str = "revenue", order: str = "desc",
+                                limit: int = PORTFOLIO_DEFAULT_LIMIT, offset: int = 0):
+    """
+    Daily KPIs for every business in one grouped query, sorted by any KPI and paginated,
+    with portfolio-wide totals. sort: revenue, transactions, items_sold, new_customers,
+    average_order_value or business_name; order: asc or desc.
+    """
+    if sort not in PORTFOLIO_SORTS:
+        return _bad_request(request, f"sort must be one of {', '.join(PORTFOLIO_SORTS)}")
+    if order not in ("asc", "desc"):
+        return _bad_request(request, "order must be asc or desc")
+    try:
+        report_date = date.fromisoformat(report_date).isoformat()
+    except ValueError:
+        return _bad_request(request, "date must be YYYY-MM-DD")
+    limit = max(1, min(limit, PORTFOLIO_MAX_LIMIT))
+    offset = max(0, offset)
+    
+    key = ("portfolio-metrics", report_date, None, sort, order, limit, offset)
+    try:
+        admission.check_rate(None)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    etag = await run_in_threadpool(_compute_etag, *key)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    
+    result = await _run_cancellable(request, key, _fetch_portfolio_metrics, report_date, sort, order, limit, offset)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, etag, key)
+
+def _fetch_portfolio_metrics(report_date, sort, order, limit, offset, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(report_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            execute_named(cursor, PORTFOLIO_METRICS[(sort, order)], (report_date, limit, offset))
+            rows = cursor.fetchall()
+        
+        totals = rows[0]
+        businesses = [
+            {
+                "business_account_id": str(row['business_account_id']),
+                "business_name": row['business_name'],
+                "total_revenue": float(row['total_revenue']),
+                "total_transactions": row['total_transactions'],
+                "items_sold": row['items_sold'],
+                "new_customers": row['new_customers'],
+                "average_order_value": round(float(row['average_order_value']), 2)
+            }
+            for row in rows if row['business_account_id'] is not None
+        ]
+        
+        return {
+            "businesses": businesses,
+            "total_businesses": totals['total_businesses'],
+            "active_businesses": totals['active_businesses'],
+            "totals": {
+                "total_revenue": float(totals['portfolio_revenue']),
+                "total_transactions": int(totals['portfolio_transactions']),
+                "items_sold": int(totals['portfolio_items_sold']),
+                "new_customers": int(totals['portfolio_new_customers'])
+            },
+            "report_date": report_date,
+            "sort": sort,
+            "order": order,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if offset + limit < totals['total_businesses'] else None
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "businesses": [],
+            "total_businesses": 0
+        }
+
+@app.get("/api/top-products")
+async def get_top_products(request: Request, report_date: str = "2025-12-28", days: int = 1,
+                           business_account_id: str = None, by: str = "quantity", limit: int = 10):
+    """
+    Best-selling products over the `days` days ending on report_date (1 = that day, 7 = that week),
+    ranked by quantity or revenue. Served from the daily rollups; rollups_as_of says how current they are.
+    """
+    if by not in TOP_PRODUCTS_ORDERINGS:
+        return _bad_request(request, f"by must be one of {', '.join(TOP_PRODUCTS_ORDERINGS)}")
+    try:
+        start_date, end_date = _leaderboard_range(report_date, days)
+    except ValueError:
+        return _bad_request(request, "report_date must be YYYY-MM-DD")
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    
+    key = ("top-products", start_date, end_date, business_account_id, by, limit)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    result = await _run_cancellable(request, key, _fetch_top_products, start_date, end_date, business_account_id, by, limit)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, key=key)
+
+def _fetch_top_products(start_date, end_date, business_account_id, by, limit, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(end_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if business_account_id:
+                execute_named(cursor, TOP_PRODUCTS[by], (start_date, end_date, business_account_id, limit))
+            else:
+                execute_named(cursor, TOP_PRODUCTS_ALL[by], (start_date, end_date, limit))
+            rows = cursor.fetchall()
+            rollups_as_of = _rollups_as_of(cursor)
+        
+        return {
+            "products": format_top_products(rows),
+            "ranked_by": by,
+            "start_date": start_date,
+            "end_date": end_date,
+            "rollups_as_of": rollups_as_of
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "products": []
+        }
+
+@app.get("/api/top-customers")
+async def get_top_customers(request: Request, report_date: str = "2025-12-28", days: int = 1,
+                            business_account_id: str = None, limit: int = 10):
+    """
+    Top customers by spend over the `days` days ending on report_date, with contact details.
+    Served from the daily rollups; rollups_as_of says how current they are.
+    """
+    try:
+        start_date, end_date = _leaderboard_range(report_date, days)
+    except ValueError:
+        return _bad_request(request, "report_date must be YYYY-MM-DD")
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    
+    key = ("top-customers", start_date, end_date, business_account_id, limit)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    result = await _run_cancellable(request, key, _fetch_top_customers, start_date, end_date, business_account_id, limit)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, key=key)
+
+def _fetch_top_customers(start_date, end_date, business_account_id, limit, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(end_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if business_account_id:
+                execute_named(cursor, TOP_CUSTOMERS, (start_date, end_date, business_account_id, limit))
+            else:
+                execute_named(cursor, TOP_CUSTOMERS_ALL, (start_date, end_date, limit))
+            rows = cursor.fetchall()
+            rollups_as_of = _rollups_as_of(cursor)
+        
+        # Names and phones come from athena, degraded to cached/'Guest' while it is failing
+        customer_details = {}
+        contacts_degraded = False
+        chatwoot_ids = [row['chatwoot_contact_id'] for row in rows if row['chatwoot_contact_id']]
+        if chatwoot_ids:
+            customer_details, contacts_degraded = _lookup_contacts(chatwoot_ids, cancel_token)
+        
+        return {
+            "customers": format_top_customers(rows, customer_details),
+            "start_date": start_date,
+            "end_date": end_date,
+            "rollups_as_of": rollups_as_of,
+            "contacts_degraded": contacts_degraded
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "customers": []
+        }
+
+@app.get("/api/returning-customers")
+async def get_returning_customers(request: Request, report_date: str = "2025-12-28", days: int = 1,
+                                  business_account_id: str = None):
+    """
+    New vs. returning buyers over the `days` days ending on report_date: a buyer is returning
+    if their first completed order was before the range. Served from the customer order index.
+    """
+    try:
+        start_date, end_date = _leaderboard_range(report_date, days)
+    except ValueError:
+        return _bad_request(request, "report_date must be YYYY-MM-DD")
+    
+    key = ("returning-customers", start_date, end_date, business_account_id)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    result = await _run_cancellable(request, key, _fetch_returning_customers, start_date, end_date, business_account_id)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, key=key)
+
+def _fetch_returning_customers(start_date, end_date, business_account_id, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(end_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if business_account_id:
+                execute_named(cursor, RETURNING_CUSTOMERS, (start_date, end_date, business_account_id))
+            else:
+                execute_named(cursor, RETURNING_CUSTOMERS_ALL, (start_date, end_date))
+            row = cursor.fetchone()
+            rollups_as_of = _rollups_as_of(cursor)
+        
+        return {
+            **format_returning_customers(row),
+            "start_date": start_date,
+            "end_date": end_date,
+            "rollups_as_of": rollups_as_of
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "buying_customers": 0,
+            "new_customers": 0,
+            "returning_customers": 0,
+            "returning_rate": 0.0
+        }
+
+@app.get("/api/cohorts")
+async def get_cohorts(request: Request, report_date: str = "2025-12-28", cohorts: int = 8, weeks: int = 8,
+                      business_account_id: str = None):
+    """
+    Weekly customer cohorts (by week of first completed order) for the `cohorts` weeks ending with
+    report_date's week, each with a retention curve: retention[n] is the share of the cohort that
+    ordered again n weeks after its first week.
+    """
+    cohorts = max(1, min(cohorts, MAX_COHORTS))
+    weeks = max(1, min(weeks, MAX_RETENTION_WEEKS))
+    try:
+        first_week, last_week = cohort_range(report_date, cohorts)
+    except ValueError:
+        return _bad_request(request, "report_date must be YYYY-MM-DD")
+    
+    key = ("cohorts", first_week, last_week, weeks, business_account_id)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    result = await _run_cancellable(request, key, _fetch_cohorts, first_week, last_week, weeks, business_account_id)
+    if result is None:
+        return _client_gone()
+    return _query_response(request, result, key=key)
+
+def _fetch_cohorts(first_week, last_week, weeks, business_account_id, cancel_token=None):
+    try:
+        with router.read_connection(cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if business_account_id:
+                execute_named(cursor, COHORT_RETENTION, (first_week, last_week, business_account_id, weeks))
+            else:
+                execute_named(cursor, COHORT_RETENTION_ALL, (first_week, last_week, weeks))
+            rows = cursor.fetchall()
+            rollups_as_of = _rollups_as_of(cursor)
+        
+        return {
+            "cohorts": format_cohorts(rows, weeks),
+            "first_cohort_week": first_week,
+            "last_cohort_week": last_week,
+            "weeks": weeks,
+            "rollups_as_of": rollups_as_of
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "cohorts": []
+        }
+
+@app.get("/api/reports/{business_account_id}/{report_date}")
+async def get_report(request: Request, business_account_id: str, report_date: str):
+    """
+    A business's daily report email as rendered and stored by the nightly run, served as
+    HTML for "view in browser" links and support. 404 if none was stored for that day.
+    """
+    try:
+        business_account_id = str(uuid.UUID(business_account_id))
+        report_date = date.fromisoformat(report_date).isoformat()
+    except ValueError:
+        return _bad_request(request, "Expected /api/reports/{business_id}/{YYYY-MM-DD}")
+    
+    key = ("report", report_date, business_account_id)
+    try:
+        admission.check_rate(business_account_id)
+    except AdmissionRejected as rejection:
+        return _rejected_response(request, key, rejection)
+    
+    result = await _run_cancellable(request, ("report-sections", report_date, business_account_id),
+                                    _fetch_report_sections, report_date, business_account_id)
+    if result is None:
+        return _client_gone()
+    if "error" in result:
+        return _query_response(request, result)
+    
+    # Sections are content-addressed: their digests identify the report's exact HTML,
+    # so a revalidation is answered before any chunk is read
+    sections = result['sections']
+    etag = _etag("report", key, sections)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    
+    result = await _run_cancellable(request, (*key, tuple(sections)), _fetch_report_html, report_date, sections)
+    if result is None:
+        return _client_gone()
+    if "error" in result:
+        return _query_response(request, result)
+    # Stored email HTML, served from the API's origin: no scripts, no same-origin access
+    return compressed_response(request, result['html'].encode(), "text/html; charset=utf-8", headers={
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Content-Security-Policy": "sandbox",
+        "X-Content-Type-Options": "nosniff"
+    })
+
+def _fetch_report_sections(report_date, business_account_id, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(report_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            sections = report_sections(cursor, business_account_id, report_date)
+        
+        if sections is None:
+            return {"error": "No report stored for this business and date", "error_type": "not_found"}
+        return {"sections": sections}
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e)
+        }
+
+def _fetch_report_html(report_date, sections, cancel_token=None):
+    try:
+        with router.read_connection(fresh=_is_recent(report_date), cancel_token=cancel_token) as conn, \
+                conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            html = load_sections(cursor, sections)
+        
+        if html is None:
+            # Replaced and pruned since its sections were read
+            return {"error": "No report stored for this business and date", "error_type": "not_found"}
+        return {"html": html}
+    except Exception as e:
+        return {
+            "error": str(e),
+            "error_type": _error_type(e)
+        }
+
 @app.get("/api/health")
 def health_check():
     """Health check endpoint to verify database connectivity"""
     try:
         # Check afto_prod_new DB
-        conn_prod = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor_prod = conn_prod.cursor()
-        cursor_prod.execute("SELECT 1")
-        cursor_prod.close()
-        conn_prod.close()
+        with PROD_DB.connection() as conn_prod, conn_prod.cursor() as cursor_prod:
+            cursor_prod.execute("SELECT 1")
         
         # Check afto_athena_prod DB
-        conn_athena = psycopg2.connect(**DB_CONFIG_ATHENA)
-        cursor_athena = conn_athena.cursor()
-        cursor_athena.execute("SELECT 1")
-        cursor_athena.close()
-        conn_athena.close()
+        with ATHENA_DB.connection() as conn_athena, conn_athena.cursor() as cursor_athena:
+            cursor_athena.execute("SELECT 1")
         
         return {
             "status": "healthy",
             "afto_prod_new": "connected",
-            "afto_athena_prod": "connected"
+            "afto_athena_prod": "connected",
+            "athena_breaker": athena_breaker.status(),
+            "read_routing": router.status()
         }
     except Exception as e:
         return {
@@ -265,33 +1377,160 @@ def health_check():
 def test_channel_mapping():
     """Test endpoint to verify channel type mapping"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        with router.read_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
         
-        cursor.execute("""
-            SELECT DISTINCT channel_type_id, COUNT(*) as count
-            FROM order_transactions
-            GROUP BY channel_type_id
-        """)
+            cursor.execute("""
+                SELECT DISTINCT channel_type_id, COUNT(*) as count
+                FROM order_transactions
+                GROUP BY channel_type_id
+            """)
         
-        channels = cursor.fetchall()
+            channels = cursor.fetchall()
+        
+            result = []
+            for channel in channels:
+                channel_id = str(channel['channel_type_id'])
+                result.append({
+                    "channel_type_id": channel_id,
+                    "mapped_name": CHANNEL_MAPPING.get(channel_id, "Unknown"),
+                    "order_count": channel['count']
+                })
+
+            return {
+                "channels": result,
+                "mapping": CHANNEL_MAPPING
+            }
         
-        result = []
-        for channel in channels:
-            channel_id = str(channel['channel_type_id'])
-            result.append({
-                "channel_type_id": channel_id,
-                "mapped_name": CHANNEL_MAPPING.get(channel_id, "Unknown"),
-                "order_count": channel['count']
+    except Exception as e:
+        return {"error": str(e)}
+
+# Templates page + summary counts in one statement. Filters are passed as literals, so
+# the planner folds away the unused "IS NULL OR" branches and can use the indexes in
+# sql/indexes.sql (trigram on name, keyset on created_at/id).
+DEBUG_TEMPLATES_QUERY = """
+    WITH filtered AS (
+        SELECT id, name, status, start_date, end_date, created_at, business_account_id,
+            name ILIKE '%%weekly%%flyer%%' as is_weekly_flyer
+        FROM product_templates
+        WHERE (%(business_account_id)s::uuid IS NULL OR business_account_id = %(business_account_id)s::uuid)
+            AND (%(status)s::text IS NULL OR status = %(status)s::text)
+            AND (%(name_pattern)s::text IS NULL OR name ILIKE %(name_pattern)s::text)
+            AND (%(date_from)s::date IS NULL OR end_date >= %(date_from)s::date)
+            AND (%(date_to)s::date IS NULL OR start_date <= %(date_to)s::date)
+    ),
+    summary AS (
+        SELECT 
+            COUNT(*) as total,
+            COUNT(*) FILTER (WHERE status = 'active') as active_count,
+            COUNT(*) FILTER (WHERE is_weekly_flyer) as weekly_flyer_count,
+            COUNT(*) FILTER (WHERE is_weekly_flyer AND status = 'active') as active_weekly_flyer_count
+        FROM filtered
+    ),
+    page AS (
+        SELECT * FROM filtered
+        WHERE %(after_created_at)s::timestamptz IS NULL
+            OR (created_at, id) < (%(after_created_at)s::timestamptz, %(after_id)s::uuid)
+        ORDER BY created_at DESC, id DESC
+        LIMIT %(limit)s
+    )
+    SELECT summary.*, page.*
+    FROM summary
+    LEFT JOIN page ON true
+    ORDER BY page.created_at DESC, page.id DESC
+"""
+
+DEBUG_TEMPLATES_MAX_LIMIT = 200
+
+def _encode_template_cursor(template):
+    return f"{template['created_at'].isoformat()}|{template['id']}"
+
+def _decode_template_cursor(cursor_token):
+    created_at, template_id = cursor_token.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), str(uuid.UUID(template_id))
+
+@app.get("/api/debug-templates")
+def debug_templates(request: Request, business_account_id: str = None, status: str = None, name: str = None,
+                    date_from: str = None, date_to: str = None, limit: int = 50, cursor: str = None):
+    """
+    Debug endpoint to browse templates, newest first, with keyset pagination.
+    name is an ILIKE pattern (e.g. '%weekly%flyer%'); date_from/date_to keep templates
+    whose start/end window overlaps the range; pass next_cursor back as cursor for the next page.
+    """
+    limit = max(1, min(limit, DEBUG_TEMPLATES_MAX_LIMIT))
+    after_created_at, after_id = None, None
+    if cursor:
+        try:
+            after_created_at, after_id = _decode_template_cursor(cursor)
+        except ValueError:
+            return _bad_request(request, "Invalid cursor")
+    try:
+        for bound in (date_from, date_to):
+            if bound is not None:
+                date.fromisoformat(bound)
+    except ValueError:
+        return _bad_request(request, "date_from and date_to must be YYYY-MM-DD")
+    
+    try:
+        with router.read_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as db_cursor:
+            db_cursor.execute(DEBUG_TEMPLATES_QUERY, {
+                "business_account_id": business_account_id,
+                "status": status,
+                "name_pattern": name,
+                "date_from": date_from,
+                "date_to": date_to,
+                "after_created_at": after_created_at,
+                "after_id": after_id,
+                "limit": limit
             })
+            rows = db_cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+        summary = rows[0]
+        templates = [
+            {
+                "id": row['id'],
+                "name": row['name'],
+                "status": row['status'],
+                "start_date": row['start_date'],
+                "end_date": row['end_date'],
+                "created_at": row['created_at'],
+                "business_account_id": row['business_account_id'],
+                "is_weekly_flyer": row['is_weekly_flyer']
+            }
+            for row in rows if row['id'] is not None
+        ]
         
-        return {
-            "channels": result,
-            "mapping": CHANNEL_MAPPING
-        }
+        return json_response(request, {
+            "templates": templates,
+            "total": summary['total'],
+            "active_count": summary['active_count'],
+            "weekly_flyer_templates": [t for t in templates if t['is_weekly_flyer']],
+            "weekly_flyer_count": summary['weekly_flyer_count'],
+            "active_weekly_flyer_count": summary['active_weekly_flyer_count'],
+            "next_cursor": _encode_template_cursor(templates[-1]) if len(templates) == limit else None,
+            "limit": limit,
+            "business_account_id_filter": business_account_id
+        })
         
     except Exception as e:
-        return {"error": str(e)}
+        import traceback
+        return _query_response(request, {
+            "error": str(e),
+            "error_type": _error_type(e),
+            "traceback": traceback.format_exc()
+        })
+
+@app.get("/api/stats")
+def get_stats():
+    """Runtime counters for the API process"""
+    return {
+        "coalescing": coalescer.stats(),
+        "read_routing": {"routed": dict(router.routed), "lag_fallbacks": router.lag_fallbacks},
+        "athena_breaker": athena_breaker.status(),
+        "contacts_cache": contacts_cache.stats(),
+        "admission": admission.stats(),
+        "response_cache": response_cache.stats(),
+        "running_totals": running_totals.stats(),
+        "snapshots": dict(snapshot_hits),
+        "process": {"pid": os.getpid(), "workers": API_WORKERS, "pool_max_connections": POOL_MAX_CONNECTIONS},
+        "flyer_templates": flyer_templates.stats()
+    }
@@ -0,0 +1,104 @@
+"""
+Per-row cost of building the orders payload: RealDictCursor rows mutated in a
+Python loop (previous path) vs tuple rows enriched into slotted OrderRecords.
+Both variants include orjson serialization of the final payload.
+
+Usage: python benchmarks/bench_order_records.py [rows] [iterations]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extras import RealDictRow
+from json_response import dumps
+from order_records import build_contact_map, build_order_records
+
+CHANNEL_MAPPING = {
+    "0199947b-b0a0-7885-a32a-4cb744df96a5": "Website",
+    "0199947b-b0a0-7885-a32a-5686afc4481e": "App",
+    "0199947b-b0a0-7885-a32a-5f115333f817": "WhatsApp",
+    "0199947b-b0a0-7885-a32a-67a4a63bf846": "Voice"
+}
+
+COLUMNS = ("order_number", "order_id", "customer_id", "chatwoot_contact_id", "total_order_value",
+           "number_of_items", "status", "payment_status", "delivery_type", "created_at",
+           "channel_type_id", "order_tax", "order_value_sub_total")
+
+def build_rows(count):
+    created = datetime(2025, 12, 28, 18, 0, tzinfo=timezone.utc)
+    channels = list(CHANNEL_MAPPING)
+    rows = []
+    for i in range(count):
+        rows.append((
+            f"ORD-{100000 + i}", str(uuid.uuid4()), str(uuid.uuid4()), 5000 + i if i % 4 else None,
+            Decimal("123.45") + i, 3 + i % 7, "completed", "paid", "pickup",
+            created - timedelta(minutes=i), channels[i % 4], Decimal("9.88"), Decimal("113.57") + i
+        ))
+    contacts = [(5000 + i, f"Customer {i}", "+1555000%04d" % i, None) for i in range(count) if i % 3]
+    return rows, contacts
+
+def dict_path(rows, contact_rows):
+    """The previous implementation: one RealDictRow per order, mutated in place"""
+    orders = []
+    for row in rows:
+        order = RealDictRow()
+        order.update(zip(COLUMNS, row))
+        orders.append(order)
+
+    customer_details = {}
+    for contact_id, name, phone_number, email in contact_rows:
+        customer_details[contact_id] = {'name': name or 'Guest', 'phone_number': phone_number or 'N/A', 'email': email}
+
+    for order in orders:
+        chatwoot_id = order['chatwoot_contact_id']
+        if chatwoot_id and chatwoot_id in customer_details:
+            order['customer_name'] = customer_details[chatwoot_id]['name']
+            order['customer_phone'] = customer_details[chatwoot_id]['phone_number']
+            order['customer_email'] = customer_details[chatwoot_id]['email']
+        else:
+            order['customer_name'] = 'Guest'
+            order['customer_phone'] = 'N/A'
+            order['customer_email'] = None
+        order['channel_name'] = CHANNEL_MAPPING.get(str(order['channel_type_id']), 'Unknown')
+        if order['created_at']:
+            order['created_at'] = order['created_at'].isoformat()
+        if order['customer_phone'] and order['customer_phone'] != 'N/A':
+            phone = order['customer_phone']
+            order['customer_phone_display'] = phone[:6] + '...' if len(phone) > 6 else phone
+        else:
+            order['customer_phone_display'] = 'N/A'
+
+    return dumps({"orders": orders, "total_orders": len(orders)})
+
+def record_path(rows, contact_rows):
+    orders = build_order_records(rows, build_contact_map(contact_rows), CHANNEL_MAPPING)
+    return dumps({"orders": orders, "total_orders": len(orders)})
+
+def peak_memory(fn, rows, contacts):
+    tracemalloc.start()
+    fn(rows, contacts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rows, contacts = build_rows(row_count)
+
+    assert dict_path(rows, contacts) == record_path(rows, contacts), "payloads differ"
+
+    print(f"{row_count} orders, {iterations} iterations")
+    for label, fn in [("RealDictRow + mutation", dict_path), ("tuple -> OrderRecord", record_path)]:
+        seconds = timeit.timeit(lambda: fn(rows, contacts), number=iterations)
+        print(f"  {label:<24} {seconds / iterations * 1e6 / row_count:7.2f} us/row"
+              f"   peak {peak_memory(fn, rows, contacts) / 1024:8.1f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Throughput of the hot dashboard queries executed as plain SQL text (parsed and
+planned on every call) vs as server-side prepared statements from query_registry.
+
+Runs against any Postgres you point it at; tables are created in a throwaway
+schema which is dropped afterwards.
+
+Usage: BENCH_DSN=postgresql://localhost/postgres python benchmarks/bench_prepared_statements.py [seconds] [threads]
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from db_pool import DashboardConnection
+from query_registry import execute_named, DAILY_METRICS_TOTALS, NEW_CUSTOMERS, DAILY_ORDERS
+
+SCHEMA = "bench_prepared_statements"
+BUSINESSES = [str(uuid.uuid4()) for _ in range(20)]
+REPORT_DATE = "2025-12-28"
+
+def connect(dsn):
+    conn = psycopg2.connect(dsn, connection_factory=DashboardConnection)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"SET search_path = {SCHEMA}")
+    return conn
+
+def seed(dsn, orders_per_business=2000):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path = {SCHEMA}")
+        cursor.execute("""
+            CREATE TABLE business_accounts (
+                id uuid PRIMARY KEY, name text, email text, timezone text NOT NULL DEFAULT 'America/New_York'
+            );
+            CREATE TABLE customers (
+                id uuid PRIMARY KEY, business_account_id uuid, chatwoot_contact_id bigint, created_at timestamptz
+            );
+            CREATE TABLE order_transactions (
+                id uuid PRIMARY KEY, order_number text, business_account_id uuid, customer_id uuid,
+                total_order_value numeric, number_of_items int, status text, payment_status text,
+                delivery_type text, created_at timestamptz, updated_at timestamptz, channel_type_id uuid,
+                order_tax numeric, order_value_sub_total numeric
+            );
+            CREATE INDEX ON order_transactions (business_account_id, created_at);
+            CREATE INDEX ON customers (business_account_id, created_at);
+        """)
+        for index, business in enumerate(BUSINESSES):
+            cursor.execute(
+                "INSERT INTO business_accounts VALUES (%s, %s, NULL, %s)",
+                (business, f"Business {index}", ["America/New_York", "America/Los_Angeles", "Asia/Kolkata"][index % 3])
+            )
+            cursor.execute("""
+                INSERT INTO customers
+                SELECT gen_random_uuid(), %(b)s, g, timestamptz '2025-12-20' + g * interval '5 minutes'
+                FROM generate_series(1, %(n)s / 4) g
+            """, {"b": business, "n": orders_per_business})
+            cursor.execute("""
+                INSERT INTO order_transactions
+                SELECT gen_random_uuid(), 'ORD-' || g, %(b)s, NULL, 10 + g %% 90, 1 + g %% 6,
+                    CASE WHEN g %% 10 = 0 THEN 'cancelled' ELSE 'completed' END, 'paid', 'pickup',
+                    timestamptz '2025-12-20' + g * interval '7 minutes', now(), NULL, 1, 9
+                FROM generate_series(1, %(n)s) g
+            """, {"b": business, "n": orders_per_business})
+        cursor.execute("ANALYZE")
+    conn.close()
+
+def one_request(cursor, business, prepared):
+    """The three statements a dashboard refresh issues for one business"""
+    for query, params in [(DAILY_METRICS_TOTALS, (REPORT_DATE, business)),
+                          (NEW_CUSTOMERS, (REPORT_DATE, business)),
+                          (DAILY_ORDERS, (REPORT_DATE, business, 100))]:
+        if prepared:
+            execute_named(cursor, query, params)
+        else:
+            cursor.execute(query.inline_sql, query.inline_params(params))
+        cursor.fetchall()
+
+def run(dsn, prepared, seconds, threads):
+    done = []
+    deadline = time.monotonic() + seconds
+
+    def worker(index):
+        conn = connect(dsn)
+        count = 0
+        with conn.cursor() as cursor:
+            while time.monotonic() < deadline:
+                one_request(cursor, BUSINESSES[(index + count) % len(BUSINESSES)], prepared)
+                count += 1
+        conn.close()
+        done.append(count)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(done) / seconds
+
+def main():
+    dsn = os.environ.get("BENCH_DSN")
+    if not dsn:
+        sys.exit("Set BENCH_DSN to a Postgres connection string")
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    seed(dsn)
+    try:
+        plain = run(dsn, prepared=False, seconds=seconds, threads=threads)
+        prepared = run(dsn, prepared=True, seconds=seconds, threads=threads)
+    finally:
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+    print(f"{threads} threads, {seconds:.0f}s each, 3 statements per request")
+    print(f"  plain SQL text        {plain:9.1f} req/s  {1000 / plain * threads:7.3f} ms/req")
+    print(f"  prepared statements   {prepared:9.1f} req/s  {1000 / prepared * threads:7.3f} ms/req")
+    print(f"  improvement           {(prepared / plain - 1) * 100:8.1f} %")
+
+if __name__ == "__main__":
+    main()
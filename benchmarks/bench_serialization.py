@@ -0,0 +1,94 @@
+"""
+Serialization cost of the orders and flyer payloads: FastAPI's default path
+(jsonable_encoder + json.dumps) vs the orjson response used by api.py.
+
+Usage: python benchmarks/bench_serialization.py [iterations]
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from psycopg2.extras import RealDictRow
+from json_response import dumps, compress_body
+
+def build_orders_payload(rows=100):
+    """Same shape as /api/daily-orders: RealDictRows with Decimal, UUID and datetime values"""
+    created = datetime(2025, 12, 28, 18, 0, tzinfo=timezone.utc)
+    orders = []
+    for i in range(rows):
+        row = RealDictRow()
+        row.update({
+            "order_number": f"ORD-{100000 + i}",
+            "order_id": uuid.uuid4(),
+            "customer_id": uuid.uuid4(),
+            "chatwoot_contact_id": 5000 + i,
+            "total_order_value": Decimal("123.45") + i,
+            "number_of_items": 3 + i % 7,
+            "status": "completed",
+            "payment_status": "paid",
+            "delivery_type": "pickup",
+            "created_at": (created - timedelta(minutes=i)).isoformat(),
+            "channel_type_id": uuid.uuid4(),
+            "order_tax": Decimal("9.88"),
+            "order_value_sub_total": Decimal("113.57") + i,
+            "customer_name": f"Customer {i}",
+            "customer_phone": "+15550000000",
+            "customer_email": None,
+            "channel_name": "WhatsApp",
+            "customer_phone_display": "+15550..."
+        })
+        orders.append(row)
+    return {"orders": orders, "total_orders": rows, "report_date": "2025-12-28"}
+
+def build_flyer_payload(products=500, days=14):
+    """Same shape as /api/weekly-flyer-performance: one wide row per product with day_N keys"""
+    products_list = []
+    for i in range(products):
+        entry = {
+            "product_name": f"Product {i}",
+            "total_quantity": Decimal(i * 3),
+            "total_revenue": float(i) * 4.25
+        }
+        for d in range(days):
+            entry[f"day_{d + 1}"] = Decimal((i + d) % 11)
+        products_list.append(entry)
+    return {
+        "products": products_list,
+        "template_info": {"id": str(uuid.uuid4()), "name": "Weekly Flyer", "num_days": days},
+        "total_products": products
+    }
+
+def fastapi_default(payload):
+    return json.dumps(jsonable_encoder(payload)).encode()
+
+def bench(label, fn, payload, iterations):
+    seconds = timeit.timeit(lambda: fn(payload), number=iterations)
+    per_call_ms = seconds / iterations * 1000
+    print(f"  {label:<32} {per_call_ms:8.3f} ms/call")
+    return per_call_ms
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    for name, payload in [("orders (100 rows)", build_orders_payload()),
+                          ("flyer (500 products x 14 days)", build_flyer_payload())]:
+        print(name)
+        before = bench("jsonable_encoder + json.dumps", fastapi_default, payload, iterations)
+        after = bench("orjson", dumps, payload, iterations)
+        print(f"  speedup                          {before / after:8.1f}x")
+
+        body = dumps(payload)
+        gzipped = gzip.compress(body, compresslevel=5)
+        bench("orjson + compression", lambda p: compress_body(dumps(p), "br, gzip"), payload, iterations)
+        print(f"  size raw/gzip                    {len(body):8d} / {len(gzipped)} bytes")
+
+if __name__ == "__main__":
+    main()
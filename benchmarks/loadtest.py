@@ -0,0 +1,452 @@
+"""
+Load test of the dashboard API: replays a mix of dashboard requests (daily metrics,
+daily orders, weekly flyer, health) with a skewed tenant distribution against the app
+backed by a seeded local Postgres, with a stand-in athena contacts database, and reports
+throughput, p50/p95/p99 latency and error rates per endpoint. Each run is saved as JSON
+so runs before and after a change can be compared.
+
+LOADTEST_DSN points at a Postgres server (any database) where the two databases
+dashboard_loadtest and dashboard_loadtest_athena are (re)created by `seed`.
+
+  seed:     LOADTEST_DSN=postgresql://localhost/postgres python benchmarks/loadtest.py seed [--businesses 40]
+  run:      LOADTEST_DSN=... python benchmarks/loadtest.py run [--seconds 30] [--concurrency 32]
+                [--mix daily-metrics=40,daily-orders=30,weekly-flyer-performance=20,health=10]
+                [--skew 1.1] [--url http://127.0.0.1:8000] [--save results.json]
+  compare:  python benchmarks/loadtest.py compare baseline.json candidate.json
+
+Without --url the app runs in this process (ASGI, no network), which is enough to compare
+changes to the request path; client and server then share one interpreter, so absolute
+numbers are pessimistic. For deployment-like numbers start the server against the seeded
+databases (run prints the environment to use) and pass its --url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import psycopg2
+from psycopg2.extensions import make_dsn
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROD_DB = "dashboard_loadtest"
+ATHENA_DB = "dashboard_loadtest_athena"
+RESULTS_DIR = os.path.join(REPO, "benchmarks", "results")
+
+# The day dashboards ask for ("yesterday"), and how much history is seeded before it
+REPORT_DATE = date(2025, 12, 28)
+SEEDED_DAYS = 28
+
+DEFAULT_MIX = "daily-metrics=40,daily-orders=30,weekly-flyer-performance=20,health=10"
+ENDPOINTS = ("daily-metrics", "daily-orders", "weekly-flyer-performance", "health")
+
+TIMEZONES = ["America/New_York", "America/Chicago", "America/Los_Angeles", "Europe/London", "Asia/Kolkata"]
+
+SCHEMA = """
+    CREATE TABLE business_accounts (
+        id uuid PRIMARY KEY, name text, email text, created_at timestamptz DEFAULT now()
+    );
+    CREATE TABLE customers (
+        id uuid PRIMARY KEY, business_account_id uuid, chatwoot_contact_id bigint, created_at timestamptz
+    );
+    CREATE TABLE order_transactions (
+        id uuid PRIMARY KEY, order_number text, business_account_id uuid, customer_id uuid,
+        total_order_value numeric(12,2), number_of_items int, status text, payment_status text,
+        delivery_type text, created_at timestamptz, updated_at timestamptz, channel_type_id uuid,
+        order_tax numeric(12,2), order_value_sub_total numeric(12,2)
+    );
+    CREATE TABLE products (retailer_id uuid PRIMARY KEY, name text, business_account_id uuid);
+    CREATE TABLE order_items (
+        id uuid PRIMARY KEY, order_id uuid, product_retailer_id uuid, quantity int, unit_price numeric(12,2)
+    );
+    CREATE TABLE product_templates (
+        id uuid PRIMARY KEY, name text, status text, start_date date, end_date date,
+        created_at timestamptz, updated_at timestamptz, business_account_id uuid
+    );
+    CREATE TABLE product_template_sections (id uuid PRIMARY KEY, template_id uuid, title text, serial_number int);
+    CREATE TABLE product_template_items (id uuid PRIMARY KEY, section_id uuid, product_retailer_id uuid);
+    CREATE INDEX ON order_transactions (business_account_id, created_at);
+    CREATE INDEX ON customers (business_account_id, created_at);
+    CREATE INDEX ON product_template_sections (template_id);
+    CREATE INDEX ON product_template_items (section_id);
+"""
+
+# Applied after the tables above; indexes.sql is applied statement by statement
+MIGRATIONS = ["business_timezones.sql", "dashboard_snapshots.sql", "rendered_reports.sql"]
+
+SEED_BUSINESS_SQL = """
+    INSERT INTO products
+    SELECT gen_random_uuid(), 'Product ' || %(rank)s || '-' || g, %(b)s
+    FROM generate_series(1, 60) g;
+
+    INSERT INTO customers
+    SELECT gen_random_uuid(), %(b)s, CASE WHEN g %% 5 <> 0 THEN %(contact_base)s + g END,
+        %(start)s::timestamptz + random() * (%(end)s::timestamptz - %(start)s::timestamptz)
+    FROM generate_series(1, %(customers)s) g;
+
+    WITH c AS (SELECT array_agg(id) AS ids FROM customers WHERE business_account_id = %(b)s)
+    INSERT INTO order_transactions
+    SELECT gen_random_uuid(), 'ORD-' || %(rank)s || '-' || o.g, %(b)s, c.ids[1 + floor(random() * cardinality(c.ids))::int],
+        0, 0, CASE WHEN random() < 0.08 THEN 'cancelled' ELSE 'completed' END, 'paid',
+        CASE WHEN random() < 0.5 THEN 'pickup' ELSE 'delivery' END, o.ts, o.ts,
+        (%(channels)s::uuid[])[1 + floor(random() * cardinality(%(channels)s::uuid[]))::int], 0, 0
+    FROM c, (
+        SELECT g, %(start)s::timestamptz + random() * (%(end)s::timestamptz - %(start)s::timestamptz) AS ts
+        FROM generate_series(1, %(orders)s) g
+    ) o;
+
+    WITH p AS (SELECT array_agg(retailer_id) AS ids FROM products WHERE business_account_id = %(b)s)
+    INSERT INTO order_items
+    SELECT gen_random_uuid(), ot.id, p.ids[1 + floor(random() * cardinality(p.ids))::int],
+        1 + floor(random() * 3)::int, 2 + floor(random() * 18)
+    FROM p, order_transactions ot, LATERAL generate_series(1, 1 + (hashtext(ot.id::text) & 3)) k
+    WHERE ot.business_account_id = %(b)s;
+
+    INSERT INTO product_templates
+    VALUES (gen_random_uuid(), 'Weekly Flyer', 'active', %(flyer_start)s, %(flyer_end)s, now(), now(), %(b)s);
+
+    INSERT INTO product_template_sections
+    SELECT gen_random_uuid(), t.id, 'Section ' || g, g
+    FROM product_templates t, generate_series(1, 2) g
+    WHERE t.business_account_id = %(b)s;
+
+    INSERT INTO product_template_items
+    SELECT gen_random_uuid(), s.id, p.retailer_id
+    FROM product_templates t
+    JOIN product_template_sections s ON s.template_id = t.id
+    JOIN LATERAL (
+        SELECT retailer_id FROM products
+        WHERE business_account_id = %(b)s
+        ORDER BY name
+        OFFSET (s.serial_number - 1) * 10 LIMIT 10
+    ) p ON true
+    WHERE t.business_account_id = %(b)s;
+"""
+
+ORDER_TOTALS_SQL = """
+    UPDATE order_transactions ot
+    SET total_order_value = s.total, order_value_sub_total = s.total, number_of_items = s.items
+    FROM (
+        SELECT order_id, sum(quantity * unit_price) AS total, sum(quantity) AS items
+        FROM order_items
+        GROUP BY order_id
+    ) s
+    WHERE s.order_id = ot.id
+"""
+
+def server_dsn():
+    dsn = os.environ.get("LOADTEST_DSN")
+    if not dsn:
+        sys.exit("Set LOADTEST_DSN to a Postgres connection string")
+    return dsn
+
+def database_dsn(dbname):
+    return make_dsn(server_dsn(), dbname=dbname)
+
+def _statements(path):
+    """Statements of a SQL file without its comments, for files that can't run as one batch"""
+    with open(path) as f:
+        text = "\n".join(line for line in f if not line.lstrip().startswith("--"))
+    return [statement.strip() for statement in text.split(";") if statement.strip()]
+
+def seed(args):
+    from api import CHANNEL_MAPPING
+
+    admin = psycopg2.connect(server_dsn())
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        for dbname in (PROD_DB, ATHENA_DB):
+            cursor.execute(f"DROP DATABASE IF EXISTS {dbname}")
+            cursor.execute(f"CREATE DATABASE {dbname}")
+    admin.close()
+
+    start = datetime.combine(REPORT_DATE - timedelta(days=SEEDED_DAYS - 1), datetime.min.time(), timezone.utc)
+    end = datetime.combine(REPORT_DATE + timedelta(days=1), datetime.min.time(), timezone.utc)
+    contacts = 0
+
+    conn = psycopg2.connect(database_dsn(PROD_DB))
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT setseed(0.42)")
+        cursor.execute(SCHEMA)
+        for name in MIGRATIONS:
+            with open(os.path.join(REPO, "sql", name)) as f:
+                cursor.execute(f.read())
+        for statement in _statements(os.path.join(REPO, "sql", "indexes.sql")):
+            try:
+                cursor.execute(statement)
+            except psycopg2.Error as e:
+                print(f"  skipped from indexes.sql: {str(e).strip().splitlines()[0]}")
+
+        # Business sizes follow the same power law as traffic: a few big tenants, a long tail
+        for rank in range(1, args.businesses + 1):
+            business = f"00000000-0000-0000-0000-{rank:012d}"
+            orders = max(5, round(args.orders_per_day / rank ** args.size_skew)) * SEEDED_DAYS
+            cursor.execute(
+                "INSERT INTO business_accounts (id, name, email, timezone) VALUES (%s, %s, %s, %s)",
+                (business, f"Business {rank:03d}", f"owner{rank}@loadtest.invalid", TIMEZONES[rank % len(TIMEZONES)])
+            )
+            cursor.execute(SEED_BUSINESS_SQL, {
+                "b": business, "rank": rank, "start": start, "end": end,
+                "orders": orders, "customers": max(10, orders // 4), "contact_base": contacts,
+                "channels": list(CHANNEL_MAPPING), "flyer_start": REPORT_DATE - timedelta(days=6), "flyer_end": REPORT_DATE
+            })
+            contacts += max(10, orders // 4)
+        cursor.execute(ORDER_TOTALS_SQL)
+        cursor.execute("ANALYZE")
+        cursor.execute("SELECT count(*) FROM order_transactions")
+        total_orders = cursor.fetchone()[0]
+    conn.close()
+
+    conn = psycopg2.connect(database_dsn(ATHENA_DB))
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TABLE contacts (id bigint PRIMARY KEY, name text, phone_number text, email text)")
+        cursor.execute("""
+            INSERT INTO contacts
+            SELECT g, 'Contact ' || g, '+1555' || lpad(g::text, 7, '0'), NULL
+            FROM generate_series(1, %s) g
+        """, (contacts,))
+        cursor.execute("ANALYZE")
+    conn.close()
+
+    print(f"Seeded {args.businesses} businesses, {total_orders} orders and {contacts} contacts")
+
+class TrafficMix:
+    """Picks the next request: endpoint by ratio, business by a Zipf-like rank distribution"""
+
+    def __init__(self, mix, businesses, skew):
+        self.endpoints = list(mix)
+        self.endpoint_weights = [mix[endpoint] for endpoint in self.endpoints]
+        self.businesses = businesses
+        self.business_weights = [1 / rank ** skew for rank in range(1, len(businesses) + 1)]
+
+    def next_request(self, rng):
+        endpoint = rng.choices(self.endpoints, self.endpoint_weights)[0]
+        if endpoint == "health":
+            return endpoint, "/api/health"
+        business = rng.choices(self.businesses, self.business_weights)[0]
+        if endpoint == "weekly-flyer-performance":
+            return endpoint, f"/api/weekly-flyer-performance?business_account_id={business}"
+        # Most dashboard opens are for yesterday; some look back through the week
+        days_back = 0 if rng.random() < 0.7 else rng.randint(1, 6)
+        report_date = (REPORT_DATE - timedelta(days=days_back)).isoformat()
+        return endpoint, f"/api/{endpoint}?business_account_id={business}&report_date={report_date}"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        endpoint, _, weight = part.partition("=")
+        if endpoint.strip() not in ENDPOINTS:
+            sys.exit(f"Unknown endpoint in --mix: {endpoint.strip()} (expected {', '.join(ENDPOINTS)})")
+        mix[endpoint.strip()] = float(weight)
+    return mix
+
+def _percentile(ordered, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def summarize(latencies, statuses, seconds):
+    ordered = sorted(latencies)
+    requests = len(ordered)
+    errors = sum(count for status, count in statuses.items() if status not in (200, 304, 429))
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / seconds, 1),
+        "p50_ms": _ms(_percentile(ordered, 50)),
+        "p95_ms": _ms(_percentile(ordered, 95)),
+        "p99_ms": _ms(_percentile(ordered, 99)),
+        "max_ms": _ms(ordered[-1] if ordered else None),
+        "error_rate": round(errors / requests, 4) if requests else 0,
+        "throttled_rate": round(statuses.get(429, 0) / requests, 4) if requests else 0,
+        "not_modified_rate": round(statuses.get(304, 0) / requests, 4) if requests else 0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))}
+    }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+async def generate_load(client, traffic, seconds, warmup, concurrency, revalidate, seed_value):
+    """Closed loop: `concurrency` users each send their next request as soon as the last one finished"""
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    measure_from = time.monotonic() + warmup
+    deadline = measure_from + seconds
+
+    async def user(index):
+        rng = random.Random(seed_value + index)
+        etags = {}
+        while time.monotonic() < deadline:
+            endpoint, url = traffic.next_request(rng)
+            headers = {"Accept-Encoding": "gzip, br"}
+            # A dashboard refresh revalidates what the browser already has
+            if url in etags and rng.random() < revalidate:
+                headers["If-None-Match"] = etags[url]
+            started = time.monotonic()
+            try:
+                response = await client.get(url, headers=headers)
+                status = response.status_code
+                if response.headers.get("etag"):
+                    etags[url] = response.headers["etag"]
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            finished = time.monotonic()
+            if started >= measure_from and finished <= deadline:
+                latencies[endpoint].append(finished - started)
+                statuses[endpoint][status] += 1
+
+    await asyncio.gather(*(user(index) for index in range(concurrency)))
+    return latencies, statuses
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    mix = parse_mix(args.mix)
+    conn = psycopg2.connect(database_dsn(PROD_DB))
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM business_accounts ORDER BY name")
+        businesses = [str(row[0]) for row in cursor.fetchall()]
+    conn.close()
+    traffic = TrafficMix(mix, businesses, args.skew)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        os.environ["DASHBOARD_PRIMARY_DSN"] = database_dsn(PROD_DB)
+        os.environ["DASHBOARD_ATHENA_DSN"] = database_dsn(ATHENA_DB)
+        import api
+        if not args.rate_limit:
+            # Measure the request path rather than the per-tenant limits
+            api.admission.rate_per_second = api.admission.burst = 1e9
+        api.warm_worker()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://loadtest",
+                                   timeout=args.timeout)
+
+    async def main():
+        async with client:
+            return await generate_load(client, traffic, args.seconds, args.warmup, args.concurrency,
+                                       args.revalidate, args.seed)
+
+    latencies, statuses = asyncio.run(main())
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    all_statuses = sum(statuses.values(), Counter())
+    result = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "config": {
+            "target": args.url or "in-process",
+            "seconds": args.seconds,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "skew": args.skew,
+            "revalidate": args.revalidate,
+            "rate_limit": args.rate_limit or bool(args.url),
+            "businesses": len(businesses)
+        },
+        "overall": summarize(all_latencies, all_statuses, args.seconds),
+        "endpoints": {endpoint: summarize(latencies[endpoint], statuses[endpoint], args.seconds)
+                      for endpoint in mix if latencies[endpoint]}
+    }
+    print_result(result)
+
+    path = args.save
+    if not path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(RESULTS_DIR, f"loadtest-{stamp}-{result['git_commit'] or 'nogit'}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved to {path}")
+
+def print_result(result):
+    config = result["config"]
+    print(f"{config['target']}: {config['concurrency']} users for {config['seconds']:.0f}s, "
+          f"skew {config['skew']}, {config['businesses']} businesses (commit {result['git_commit']})")
+    print(f"  {'endpoint':<26}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'429':>8}{'304':>8}")
+    for name, summary in [*result["endpoints"].items(), ("overall", result["overall"])]:
+        print(f"  {name:<26}{summary['throughput_rps']:>9.1f}{_fmt(summary['p50_ms'])}{_fmt(summary['p95_ms'])}"
+              f"{_fmt(summary['p99_ms'])}{summary['error_rate']:>9.2%}{summary['throttled_rate']:>8.1%}"
+              f"{summary['not_modified_rate']:>8.1%}")
+
+def _fmt(value):
+    return f"{'-':>10}" if value is None else f"{value:>10.1f}"
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["config"] != candidate["config"]:
+        print("Note: the runs were made with different settings\n")
+
+    print(f"{baseline['git_commit']} -> {candidate['git_commit']}")
+    print(f"  {'endpoint':<26}{'req/s':>16}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'errors':>16}")
+    names = [name for name in candidate["endpoints"] if name in baseline["endpoints"]] + ["overall"]
+    for name in names:
+        before = baseline["overall"] if name == "overall" else baseline["endpoints"][name]
+        after = candidate["overall"] if name == "overall" else candidate["endpoints"][name]
+        cells = [_change(before[metric], after[metric]) for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")]
+        cells.append(f"{before['error_rate']:.2%}->{after['error_rate']:.2%}")
+        print(f"  {name:<26}" + "".join(f"{cell:>16}" for cell in cells))
+
+def _change(before, after):
+    if not before or after is None:
+        return "-"
+    return f"{after:.1f} ({(after / before - 1) * 100:+.0f}%)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the dashboard API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="(re)create and seed the load test databases")
+    seed_parser.add_argument("--businesses", type=int, default=40)
+    seed_parser.add_argument("--orders-per-day", type=int, default=200, help="of the largest business")
+    seed_parser.add_argument("--size-skew", type=float, default=1.0, help="business size ~ 1 / rank ** size_skew")
+
+    run_parser = commands.add_parser("run", help="generate load and report latencies")
+    run_parser.add_argument("--seconds", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,...")
+    run_parser.add_argument("--skew", type=float, default=1.1, help="tenant popularity ~ 1 / rank ** skew (0: uniform)")
+    run_parser.add_argument("--revalidate", type=float, default=0.3, help="share of repeat requests sent with If-None-Match")
+    run_parser.add_argument("--rate-limit", action="store_true", help="keep per-tenant rate limits (in-process only)")
+    run_parser.add_argument("--url", help="test a running server instead of the app in this process")
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--seed", type=int, default=1, help="random seed of the request sequence")
+    run_parser.add_argument("--save", help="result file (default: benchmarks/results/)")
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    elif args.command == "run":
+        if args.url:
+            print(f"Serve with DASHBOARD_PRIMARY_DSN='{database_dsn(PROD_DB)}' DASHBOARD_ATHENA_DSN='{database_dsn(ATHENA_DB)}'")
+        run(args)
+    else:
+        compare(args)
+
+if __name__ == "__main__":
+    main()
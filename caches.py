@@ -0,0 +1,225 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        """Found entries only, as a dict"""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, items, ttl=None):
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+class SharedCache:
+    """
+    TTLCache with its entries in a SQLite file shared by every process that opens it, e.g.
+    the API's worker processes with the file on /dev/shm (see gunicorn.conf.py).
+
+    Keys are compared by repr() and values are pickled, so only use it from processes of one
+    deployment. Over max_entries, the entries closest to expiring are dropped first. The
+    cache never fails a request: if SQLite is busy or broken a get misses and a set is skipped.
+    """
+
+    # Expired and surplus entries are purged every this many sets in each process
+    PURGE_EVERY = 500
+
+    def __init__(self, path, name, max_entries=10000, ttl=300, busy_timeout=0.05):
+        self.path = path
+        self.table = f"cache_{name}"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._sets = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, opened again in a forked process
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Cache contents don't need to survive a crash
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires_idx ON {self.table} (expires_at)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        found = self.get_many([key])
+        return found[key] if key in found else default
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def get_many(self, keys):
+        """Found entries only, as a dict"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        by_repr = {repr(key): key for key in keys}
+        reprs = list(by_repr)
+        found = {}
+        try:
+            conn = self._connection()
+            # SQLite's default limit on host parameters is well above this
+            for start in range(0, len(reprs), 500):
+                batch = reprs[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({', '.join('?' * len(batch))}) AND expires_at > ?",
+                    (*batch, time.time())
+                ).fetchall()
+                for key, value in rows:
+                    found[by_repr[key]] = pickle.loads(value)
+        except sqlite3.Error:
+            self.errors += 1
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items, ttl=None):
+        if not items:
+            return
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        rows = [(repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at) for key, value in items.items()]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)", rows)
+            self._sets += len(rows)
+            if self._sets >= self.PURGE_EVERY:
+                self._sets = 0
+                self._purge(conn)
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _purge(self, conn):
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+            conn.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY expires_at
+                    LIMIT max(0, (SELECT count(*) FROM {self.table}) - ?)
+                )
+            """, (self.max_entries,))
+
+    def delete(self, key):
+        try:
+            self._connection().execute(f"DELETE FROM {self.table} WHERE key = ?", (repr(key),))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self):
+        try:
+            entries = self._connection().execute(f"SELECT count(*) FROM {self.table}").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        # hits and misses are this process's; entries are shared
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "errors": self.errors, "shared": self.path}
+
+class RunningTotals:
+    """
+    KPI totals per key (e.g. business and day) kept current by adding the totals of rows
+    newer than the entry's cursor, so a refresh costs time proportional to the new rows.
+
+    A delta only sees new rows: changes to rows already counted (a cancelled order, a
+    transaction that committed behind the cursor) are picked up when the entry is
+    rebuilt from scratch, at the latest max_age seconds after it was seeded.
+    """
+
+    def __init__(self, max_entries=5000, max_age=300):
+        self.max_age = max_age
+        self.seeded = 0
+        self.advanced = 0
+        self._entries = TTLCache(max_entries=max_entries, ttl=max_age)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(totals, cursor) or None; totals is a copy"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        totals, cursor, _ = entry
+        return dict(totals), cursor
+
+    def seed(self, key, totals, cursor):
+        with self._lock:
+            self._entries.set(key, (dict(totals), cursor, time.monotonic() + self.max_age))
+            self.seeded += 1
+
+    def advance(self, key, cursor, delta, new_cursor):
+        """
+        Add delta (computed from rows after cursor) and move the entry to new_cursor.
+        Returns the updated (totals, cursor), or None if the entry expired or another
+        request advanced it first; the caller then reseeds or reads it again.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != cursor:
+                return None
+            totals, _, expires_at = entry
+            totals = {name: value + delta.get(name, 0) for name, value in totals.items()}
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._entries.set(key, (totals, new_cursor, expires_at), ttl=remaining)
+            self.advanced += 1
+        return dict(totals), new_cursor
+
+    def stats(self):
+        return {**self._entries.stats(), "seeded": self.seeded, "advanced": self.advanced}
@@ -1,67 +1,170 @@
-import psycopg2
+import os
 from psycopg2.extras import RealDictCursor
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from config.settings import DB_CONFIG_PROD, DB_CONFIG_ATHENA, CHANNEL_MAPPING
+from services.db_pool import PooledDatabase, DashboardConnection
+from services.flyer_template_cache import FlyerTemplateCache
+from services.analytics_mirror import AnalyticsMirror
+from services.rollups import (
+    refresh_rollups, format_top_products, format_top_customers, format_returning_customers, format_cohorts,
+    cohort_range, TOP_PRODUCTS_ORDERINGS
+)
+from services.order_records import build_contact_map, build_order_records, contact_ids, build_item_map, attach_items
+from services.query_registry import (
+    execute_named, DAILY_METRICS_TOTALS, NEW_CUSTOMERS, DAILY_ORDERS, ORDER_ITEMS_BY_ORDER_IDS, CONTACTS_BY_IDS,
+    TOP_PRODUCTS, TOP_CUSTOMERS, RETURNING_CUSTOMERS, COHORT_RETENTION,
+    ORDERS_WATERMARK, ORDERS_DELTA, NEW_CUSTOMERS_DELTA, SINCE_START, encode_since, since_position
+)
+from services.snapshots import save_snapshot, prune_snapshots, watermark_key
+from services.json_response import dumps
+from services.report_store import save_report, prune_reports
+from services.tracing import traced_methods, traced_connection_factory
 
+# Shared by every DailyMetricsService in the process, so the named queries are
+# prepared once per connection rather than once per business. Every statement is
+# a "sql" span when tracing (services.tracing).
+PROD_DB = PooledDatabase("prod", DB_CONFIG_PROD, maxconn=4, connection_factory=traced_connection_factory(DashboardConnection))
+ATHENA_DB = PooledDatabase("athena", DB_CONFIG_ATHENA, maxconn=2, connection_factory=traced_connection_factory(DashboardConnection))
+
+# Active flyer template + products per business, revalidated by template updated_at
+FLYER_TEMPLATES = FlyerTemplateCache(revalidate_after=60)
+
+# Historical analytics: dates older than MIRROR_MIN_AGE_DAYS are read from the local
+# Parquet mirror (refreshed by export_analytics_mirror_op) instead of prod
+ANALYTICS_MIRROR = AnalyticsMirror(os.environ.get("ANALYTICS_MIRROR_DIR", "analytics_mirror"))
+MIRROR_MIN_AGE_DAYS = 7
+
+CHANNEL_TREND_GRANULARITIES = ("day", "week", "month")
+
+# Page size of /api/daily-orders (api.DAILY_ORDERS_LIMIT): dashboard snapshots of the
+# orders list must hold the same orders the live endpoint returns
+DASHBOARD_ORDERS_LIMIT = 100
+
+# Reports fall back to this zone for a business whose time zone isn't known here
+DEFAULT_TIMEZONE = "America/New_York"
+
+# Dates below are local days of the business (business_accounts.timezone), turned into
+# UTC ranges on created_at so the (business_account_id, created_at) index is used
+PRODUCT_DAILY_SALES_QUERY = """
+    SELECT 
+        oi.product_retailer_id,
+        p.name as product_name,
+        DATE(ot.created_at AT TIME ZONE ba.timezone) as sale_date,
+        SUM(oi.quantity) as quantity,
+        SUM(oi.quantity * oi.unit_price) as revenue
+    FROM business_accounts ba
+    JOIN order_transactions ot ON ot.business_account_id = ba.id
+    JOIN order_items oi ON oi.order_id = ot.id
+    JOIN products p ON oi.product_retailer_id = p.retailer_id
+    WHERE ba.id = %s
+        AND oi.product_retailer_id = ANY(%s::uuid[])
+        AND ot.status = 'completed'
+        AND ot.created_at >= (%s::date)::timestamp AT TIME ZONE ba.timezone
+        AND ot.created_at < (%s::date + 1)::timestamp AT TIME ZONE ba.timezone
+    GROUP BY oi.product_retailer_id, p.name, DATE(ot.created_at AT TIME ZONE ba.timezone)
+    ORDER BY p.name, sale_date
+"""
+
+CHANNEL_TRENDS_QUERY = """
+    SELECT 
+        date_trunc(%s, DATE(ot.created_at AT TIME ZONE ba.timezone)::timestamp)::date as period,
+        ot.channel_type_id,
+        COUNT(*) as total_orders,
+        COALESCE(SUM(ot.total_order_value), 0) as total_revenue
+    FROM business_accounts ba
+    JOIN order_transactions ot ON ot.business_account_id = ba.id
+    WHERE ba.id = %s
+        AND ot.status = 'completed'
+        AND ot.created_at >= (%s::date)::timestamp AT TIME ZONE ba.timezone
+        AND ot.created_at < (%s::date + 1)::timestamp AT TIME ZONE ba.timezone
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+# Daily metrics of many businesses, each for its own report date, in one grouped
+# statement: the nightly run covers every time zone without a query per business
+BULK_DAILY_METRICS_QUERY = """
+    WITH targets AS (
+        SELECT 
+            t.business_account_id,
+            t.report_date,
+            (t.report_date)::timestamp AT TIME ZONE ba.timezone as day_start,
+            (t.report_date + 1)::timestamp AT TIME ZONE ba.timezone as day_end
+        FROM unnest(%s::uuid[], %s::date[]) AS t(business_account_id, report_date)
+        JOIN business_accounts ba ON ba.id = t.business_account_id
+    )
+    SELECT 
+        t.business_account_id,
+        o.total_revenue,
+        o.total_transactions,
+        o.items_sold,
+        n.new_customers
+    FROM targets t
+    CROSS JOIN LATERAL (
+        SELECT 
+            COALESCE(SUM(ot.total_order_value), 0) as total_revenue,
+            COUNT(*) as total_transactions,
+            COALESCE(SUM(ot.number_of_items), 0) as items_sold
+        FROM order_transactions ot
+        WHERE ot.business_account_id = t.business_account_id
+            AND ot.status = 'completed'
+            AND ot.created_at >= t.day_start
+            AND ot.created_at < t.day_end
+    ) o
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) as new_customers
+        FROM customers c
+        WHERE c.business_account_id = t.business_account_id
+            AND c.created_at >= t.day_start
+            AND c.created_at < t.day_end
+    ) n
+"""
+
+def local_report_date(timezone_name, days_ago=1):
+    """The date `days_ago` days before today in the given IANA time zone, as YYYY-MM-DD"""
+    try:
+        zone = ZoneInfo(timezone_name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = ZoneInfo(DEFAULT_TIMEZONE)
+    return (datetime.now(zone) - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+
+@traced_methods
 class DailyMetricsService:
     
     def get_business_accounts(self):
         """
-        Get all active business accounts with email addresses.
+        Get all active business accounts with email addresses and IANA time zones.
         Uses direct database query for performance.
         """
-        conn = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Query matches actual schema: 'name' and 'email' columns
-        # Using aliases so rest of code doesn't need changes
-        cursor.execute("""
-            SELECT 
-                id, 
-                name as business_name, 
-                email as business_email
-            FROM business_accounts
-            WHERE email IS NOT NULL
-            ORDER BY name
-        """)
-        
-        accounts = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Query matches actual schema: 'name' and 'email' columns
+            # Using aliases so rest of code doesn't need changes
+            cursor.execute("""
+                SELECT 
+                    id, 
+                    name as business_name, 
+                    email as business_email,
+                    timezone
+                FROM business_accounts
+                WHERE email IS NOT NULL
+                ORDER BY name
+            """)
+            
+            accounts = cursor.fetchall()
         
         return accounts
     
     def get_daily_metrics(self, business_account_id: str, report_date: str):
         """Get daily metrics for a business"""
-        conn = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get order metrics
-        cursor.execute("""
-            SELECT 
-                COALESCE(SUM(total_order_value), 0) as total_revenue,
-                COUNT(*) as total_transactions,
-                COALESCE(SUM(number_of_items), 0) as items_sold
-            FROM order_transactions 
-            WHERE status = 'completed'
-                AND DATE(created_at AT TIME ZONE 'EST') = %s
-                AND business_account_id = %s
-        """, (report_date, business_account_id))
-        
-        metrics = cursor.fetchone()
-        
-        # Get new customers
-        cursor.execute("""
-            SELECT COUNT(*) as new_customers
-            FROM customers
-            WHERE DATE(created_at AT TIME ZONE 'EST') = %s
-                AND business_account_id = %s
-        """, (report_date, business_account_id))
-        
-        new_customers = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Get order metrics
+            execute_named(cursor, DAILY_METRICS_TOTALS, (report_date, business_account_id))
+            metrics = cursor.fetchone()
+            
+            # Get new customers
+            execute_named(cursor, NEW_CUSTOMERS, (report_date, business_account_id))
+            new_customers = cursor.fetchone()
         
         return {
             "total_revenue": float(metrics['total_revenue']),
@@ -70,154 +173,76 @@ class DailyMetricsService:
             "new_customers": new_customers['new_customers']
         }
     
-    def get_daily_orders(self, business_account_id: str, report_date: str, limit: int = 50):
-        """Get daily orders with customer details"""
-        conn_prod = psycopg2.connect(**DB_CONFIG_PROD)
-        cursor_prod = conn_prod.cursor(cursor_factory=RealDictCursor)
+    def get_daily_metrics_bulk(self, report_dates):
+        """
+        Daily metrics for many businesses at once. report_dates maps business_account_id ->
+        report date (each business's own local day); returns business_account_id -> metrics.
+        """
+        if not report_dates:
+            return {}
         
-        cursor_prod.execute("""
-            SELECT 
-                ot.order_number,
-                ot.customer_id,
-                c.chatwoot_contact_id,
-                ot.total_order_value,
-                ot.number_of_items,
-                ot.status,
-                ot.delivery_type,
-                ot.created_at,
-                ot.channel_type_id
-            FROM order_transactions ot
-            LEFT JOIN customers c ON ot.customer_id = c.id
-            WHERE ot.status = 'completed'
-                AND DATE(ot.created_at AT TIME ZONE 'EST') = %s
-                AND ot.business_account_id = %s
-            ORDER BY ot.created_at DESC
-            LIMIT %s
-        """, (report_date, business_account_id, limit))
+        business_ids = list(report_dates)
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(BULK_DAILY_METRICS_QUERY, (business_ids, [report_dates[b] for b in business_ids]))
+            rows = cursor.fetchall()
         
-        orders = cursor_prod.fetchall()
-        cursor_prod.close()
-        conn_prod.close()
+        return {
+            str(row['business_account_id']): {
+                "total_revenue": float(row['total_revenue']),
+                "total_transactions": row['total_transactions'],
+                "items_sold": row['items_sold'],
+                "new_customers": row['new_customers']
+            }
+            for row in rows
+        }
+    
+    def get_daily_orders(self, business_account_id: str, report_date: str, limit: int = 50, include_items: bool = False):
+        """
+        Get daily orders with customer details as OrderRecords (tuple cursor, one enrichment pass).
+        include_items nests each order's line items, fetched for all the orders in one query.
+        """
+        with PROD_DB.connection() as conn_prod, conn_prod.cursor() as cursor_prod:
+            execute_named(cursor_prod, DAILY_ORDERS, (report_date, business_account_id, limit))
+            rows = cursor_prod.fetchall()
+            
+            item_rows = []
+            if include_items and rows:
+                execute_named(cursor_prod, ORDER_ITEMS_BY_ORDER_IDS, ([row[1] for row in rows],))
+                item_rows = cursor_prod.fetchall()
         
-        if not orders:
+        if not rows:
             return []
         
         # Get customer details from Athena DB
-        chatwoot_ids = [order['chatwoot_contact_id'] for order in orders if order['chatwoot_contact_id']]
+        chatwoot_ids = contact_ids(rows)
         customer_details = {}
         
         if chatwoot_ids:
-            conn_athena = psycopg2.connect(**DB_CONFIG_ATHENA)
-            cursor_athena = conn_athena.cursor(cursor_factory=RealDictCursor)
-            
-            cursor_athena.execute("""
-                SELECT id, name, phone_number
-                FROM contacts
-                WHERE id = ANY(%s)
-            """, (chatwoot_ids,))
-            
-            contacts = cursor_athena.fetchall()
-            
-            for contact in contacts:
-                customer_details[contact['id']] = {
-                    'name': contact['name'] or 'Guest',
-                    'phone_number': contact['phone_number'] or 'N/A'
-                }
-            
-            cursor_athena.close()
-            conn_athena.close()
-        
-        # Merge customer details
-        for order in orders:
-            chatwoot_id = order['chatwoot_contact_id']
-            
-            if chatwoot_id and chatwoot_id in customer_details:
-                order['customer_name'] = customer_details[chatwoot_id]['name']
-                order['customer_phone'] = customer_details[chatwoot_id]['phone_number']
-            else:
-                order['customer_name'] = 'Guest'
-                order['customer_phone'] = 'N/A'
-            
-            order['channel_name'] = CHANNEL_MAPPING.get(str(order['channel_type_id']), 'Unknown')
+            with ATHENA_DB.connection() as conn_athena, conn_athena.cursor() as cursor_athena:
+                execute_named(cursor_athena, CONTACTS_BY_IDS, (chatwoot_ids,))
+                customer_details = build_contact_map(cursor_athena.fetchall())
         
+        orders = build_order_records(rows, customer_details, CHANNEL_MAPPING)
+        if include_items:
+            orders = attach_items(orders, build_item_map(item_rows))
         return orders
     
     def get_weekly_flyer_performance(self, business_account_id: str):
         """Get weekly flyer products performance with daily breakdown"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG_PROD)
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Get active Weekly Flyer template
-            cursor.execute("""
-                SELECT id, name, start_date, end_date
-                FROM product_templates
-                WHERE (name = 'Weekly Flyer' OR name ILIKE '%%weekly%%flyer%%')
-                    AND status = 'active'
-                    AND business_account_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (business_account_id,))
-            
-            template = cursor.fetchone()
-            
-            if not template:
-                cursor.close()
-                conn.close()
-                return None
-            
-            # Get sections
-            cursor.execute("""
-                SELECT id FROM product_template_sections
-                WHERE template_id = %s
-            """, (template['id'],))
-            
-            sections = cursor.fetchall()
-            section_ids = [str(s['id']) for s in sections]
-            
-            if not section_ids:
-                cursor.close()
-                conn.close()
-                return None
-            
-            # Get all products in the flyer
-            cursor.execute("""
-                SELECT DISTINCT pti.product_retailer_id, p.name
-                FROM product_template_items pti
-                JOIN products p ON pti.product_retailer_id = p.retailer_id
-                WHERE pti.section_id = ANY(%s::uuid[])
-                ORDER BY p.name
-            """, (section_ids,))
-            
-            products = cursor.fetchall()
-            product_ids = [str(p['product_retailer_id']) for p in products]
-            
-            if not product_ids:
-                cursor.close()
-                conn.close()
-                return None
-            
-            # Get sales data with actual dates
-            cursor.execute("""
-                SELECT 
-                    oi.product_retailer_id,
-                    p.name as product_name,
-                    DATE(ot.created_at AT TIME ZONE 'EST') as sale_date,
-                    SUM(oi.quantity) as quantity
-                FROM order_items oi
-                JOIN order_transactions ot ON oi.order_id = ot.id
-                JOIN products p ON oi.product_retailer_id = p.retailer_id
-                WHERE oi.product_retailer_id = ANY(%s::uuid[])
-                    AND ot.status = 'completed'
-                    AND DATE(ot.created_at AT TIME ZONE 'EST') >= DATE(%s)
-                    AND DATE(ot.created_at AT TIME ZONE 'EST') <= DATE(%s)
-                GROUP BY oi.product_retailer_id, p.name, DATE(ot.created_at AT TIME ZONE 'EST')
-                ORDER BY p.name, sale_date
-            """, (product_ids, template['start_date'], template['end_date']))
-            
-            sales = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Get active Weekly Flyer template with its products (cached until it changes)
+                flyer = FLYER_TEMPLATES.resolve(cursor, business_account_id)
+                
+                if not flyer or not flyer.products:
+                    return None
+                
+                template = flyer.template
+                products = flyer.products
+                product_ids = flyer.product_retailer_ids
+                
+            # Get sales data with actual dates (from the analytics mirror for old flyers)
+            sales = self.get_product_daily_sales(flyer.business_account_id, product_ids, template['start_date'], template['end_date'])
             
             # Format data with daily breakdown
             start_dt = template['start_date'] if isinstance(template['start_date'], datetime) else datetime.fromisoformat(str(template['start_date']))
@@ -266,8 +291,207 @@ class DailyMetricsService:
             print(f"Error in get_weekly_flyer_performance: {e}")
             import traceback
             traceback.print_exc()
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
             return None
+
+    
+    def get_product_daily_sales(self, business_account_id: str, product_ids, start_date, end_date):
+        """Quantity and revenue per product per local day of the business; dates old enough come from the analytics mirror"""
+        def from_prod(date_from, date_to):
+            with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(PRODUCT_DAILY_SALES_QUERY, (business_account_id, product_ids, date_from, date_to))
+                return cursor.fetchall()
+        
+        def from_mirror(date_from, date_to):
+            return ANALYTICS_MIRROR.product_daily_sales(business_account_id, product_ids, date_from, date_to)
+        
+        sales = self._from_mirror_or_prod(start_date, end_date, from_mirror, from_prod)
+        sales.sort(key=lambda sale: (sale['product_name'], sale['sale_date']))
+        return sales
+    
+    def get_channel_trends(self, business_account_id: str, start_date: str, end_date: str, granularity: str = "month"):
+        """Completed orders and revenue per channel per day/week/month; dates old enough come from the analytics mirror"""
+        if granularity not in CHANNEL_TREND_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {CHANNEL_TREND_GRANULARITIES}")
+        
+        def from_prod(date_from, date_to):
+            with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(CHANNEL_TRENDS_QUERY, (granularity, business_account_id, date_from, date_to))
+                return cursor.fetchall()
+        
+        def from_mirror(date_from, date_to):
+            return ANALYTICS_MIRROR.channel_trends(business_account_id, date_from, date_to, granularity)
+        
+        # A period that straddles the mirror/prod split comes back as two rows; add them up
+        trends = {}
+        for row in self._from_mirror_or_prod(start_date, end_date, from_mirror, from_prod):
+            key = (row['period'], str(row['channel_type_id']))
+            trend = trends.get(key)
+            if trend is None:
+                trends[key] = trend = {
+                    "period": row['period'],
+                    "channel_type_id": key[1],
+                    "channel_name": CHANNEL_MAPPING.get(key[1], 'Unknown'),
+                    "total_orders": 0,
+                    "total_revenue": 0.0
+                }
+            trend['total_orders'] += row['total_orders']
+            trend['total_revenue'] += float(row['total_revenue'])
+        
+        return [trends[key] for key in sorted(trends)]
+    
+    def _from_mirror_or_prod(self, start_date, end_date, from_mirror, from_prod):
+        """
+        Rows for start_date..end_date, calling from_mirror(date_from, date_to) for the part
+        older than MIRROR_MIN_AGE_DAYS that the mirror covers and from_prod for the rest.
+        """
+        start_date = date.fromisoformat(str(start_date)[:10])
+        end_date = date.fromisoformat(str(end_date)[:10])
+        
+        # First date served from prod. A local day's orders are all mirrored once the
+        # mirror has caught up past the following day (in any time zone).
+        complete_before = ANALYTICS_MIRROR.complete_before() if ANALYTICS_MIRROR.available() else None
+        if complete_before is None:
+            return list(from_prod(start_date, end_date))
+        cutoff = min(date.today() - timedelta(days=MIRROR_MIN_AGE_DAYS), complete_before.date() - timedelta(days=1))
+        
+        rows = []
+        prod_from = max(start_date, cutoff)
+        if start_date < cutoff:
+            mirror_to = min(end_date, cutoff - timedelta(days=1))
+            try:
+                rows.extend(from_mirror(start_date, mirror_to))
+            except Exception as e:
+                print(f"Analytics mirror query failed, reading from prod instead: {e}")
+                prod_from = start_date
+        if prod_from <= end_date:
+            rows.extend(from_prod(prod_from, end_date))
+        return rows
+    
+    def refresh_analytics_mirror(self):
+        """Export orders changed since the last run to the local Parquet mirror and compact busy partitions"""
+        with PROD_DB.connection() as conn:
+            stats = ANALYTICS_MIRROR.export(conn)
+        stats['compacted_partitions'] = ANALYTICS_MIRROR.compact()
+        return stats
+    
+    def get_top_products(self, business_account_id: str, start_date: str, end_date: str, limit: int = 10, by: str = "quantity"):
+        """Top products by quantity or revenue over start_date..end_date, from the daily rollups"""
+        if by not in TOP_PRODUCTS_ORDERINGS:
+            raise ValueError(f"by must be one of {TOP_PRODUCTS_ORDERINGS}")
+        
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            execute_named(cursor, TOP_PRODUCTS[by], (start_date, end_date, business_account_id, limit))
+            rows = cursor.fetchall()
+        
+        return format_top_products(rows)
+    
+    def get_top_customers(self, business_account_id: str, start_date: str, end_date: str, limit: int = 10):
+        """Top customers by spend over start_date..end_date, from the daily rollups, with contact details"""
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            execute_named(cursor, TOP_CUSTOMERS, (start_date, end_date, business_account_id, limit))
+            rows = cursor.fetchall()
+        
+        chatwoot_ids = [row['chatwoot_contact_id'] for row in rows if row['chatwoot_contact_id']]
+        customer_details = {}
+        
+        if chatwoot_ids:
+            with ATHENA_DB.connection() as conn_athena, conn_athena.cursor() as cursor_athena:
+                execute_named(cursor_athena, CONTACTS_BY_IDS, (chatwoot_ids,))
+                customer_details = build_contact_map(cursor_athena.fetchall())
+        
+        return format_top_customers(rows, customer_details)
+    
+    def get_returning_customers(self, business_account_id: str, start_date: str, end_date: str):
+        """New vs. returning buyers over start_date..end_date, from the customer order index"""
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            execute_named(cursor, RETURNING_CUSTOMERS, (start_date, end_date, business_account_id))
+            row = cursor.fetchone()
+        
+        return format_returning_customers(row)
+    
+    def get_cohort_retention(self, business_account_id: str, end_date: str, cohorts: int = 8, weeks: int = 8):
+        """Weekly cohorts (by first order week) ending with end_date's week, with `weeks` weeks of retention each"""
+        first_week, last_week = cohort_range(end_date, cohorts)
+        
+        with PROD_DB.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            execute_named(cursor, COHORT_RETENTION, (first_week, last_week, business_account_id, weeks))
+            rows = cursor.fetchall()
+        
+        return format_cohorts(rows, weeks)
+    
+    def refresh_rollups(self):
+        """Bring the leaderboard and customer rollups up to date with orders changed since the last refresh"""
+        with PROD_DB.connection() as conn:
+            return refresh_rollups(conn)
+    
+    def get_orders_watermark(self, business_account_id: str, report_date: str):
+        """Change marker of a business's day; take it before computing payloads to snapshot"""
+        with PROD_DB.connection() as conn, conn.cursor() as cursor:
+            execute_named(cursor, ORDERS_WATERMARK, (report_date, business_account_id))
+            return watermark_key(cursor.fetchone())
+    
+    def save_dashboard_snapshots(self, business_account_id: str, report_date: str, watermark: str, orders):
+        """
+        Store the /api/daily-metrics and /api/daily-orders payloads of a business's day for the API
+        to serve. orders are the newest DASHBOARD_ORDERS_LIMIT orders, fetched after `watermark`
+        was taken; if the day changed since then nothing is stored and False is returned.
+        Metrics are totalled in the same transaction so they carry the live endpoint's since cursor.
+        """
+        with PROD_DB.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    execute_named(cursor, ORDERS_WATERMARK, (report_date, business_account_id))
+                    if watermark_key(cursor.fetchone()) != watermark:
+                        return False
+                    
+                    execute_named(cursor, ORDERS_DELTA, (report_date, business_account_id, *SINCE_START))
+                    totals = cursor.fetchone()
+                    execute_named(cursor, NEW_CUSTOMERS_DELTA, (report_date, business_account_id, *SINCE_START))
+                    customers = cursor.fetchone()
+                    save_snapshot(cursor, "daily-metrics", business_account_id, report_date, watermark, dumps({
+                        "total_revenue": float(totals['total_revenue']),
+                        "total_transactions": totals['total_transactions'],
+                        "items_sold": totals['items_sold'],
+                        "new_customers": customers['new_customers'],
+                        "report_date": report_date,
+                        "next_since": encode_since(since_position(totals, SINCE_START), since_position(customers, SINCE_START))
+                    }))
+                    
+                    newest = (orders[0].created_at, orders[0].order_id) if orders else SINCE_START
+                    save_snapshot(cursor, "daily-orders", business_account_id, report_date, watermark, dumps({
+                        "orders": orders,
+                        "total_orders": len(orders),
+                        "report_date": report_date,
+                        "contacts_degraded": False,
+                        "next_since": encode_since(newest)
+                    }))
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+        return True
+    
+    def prune_dashboard_snapshots(self):
+        """Delete dashboard snapshots past their retention; returns how many"""
+        with PROD_DB.connection() as conn, conn.cursor() as cursor:
+            return prune_snapshots(cursor)
+    
+    def save_rendered_report(self, business_account_id: str, report_date: str, html: str):
+        """Store a report email for /api/reports; returns (sections, newly stored sections)"""
+        with PROD_DB.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    result = save_report(cursor, business_account_id, report_date, html)
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+        return result
+    
+    def prune_rendered_reports(self):
+        """Delete stored reports past their retention and unused sections; returns (reports, sections)"""
+        with PROD_DB.connection() as conn, conn.cursor() as cursor:
+            return prune_reports(cursor)
@@ -1,12 +1,34 @@
-from dagster import op, Output, OpExecutionContext
+import functools
+import uuid
+from dagster import op, graph, Output, DynamicOut, DynamicOutput, OpExecutionContext, MetadataValue
 from datetime import datetime, timedelta
-from services.daily_metrics_service import DailyMetricsService
+from services.daily_metrics_service import DailyMetricsService, local_report_date, DASHBOARD_ORDERS_LIMIT
 from services.email_service import EmailService
 from services.email_template_generator import EmailTemplateGenerator
+from services.tracing import run_span, span, current_root
+
+# Orders listed in the report email
+EMAIL_ORDERS_LIMIT = 50
+
+# Businesses listed in the run's timing summary
+SLOWEST_BUSINESSES = 10
+
+def _traced_op(fn):
+    """Run the op inside a root span on the Dagster run's trace (see services.tracing)"""
+    @functools.wraps(fn)
+    def wrapper(context, *args, **kwargs):
+        with run_span(context.run_id, fn.__name__, **{"dagster.run_id": context.run_id, "dagster.op": fn.__name__}):
+            return fn(context, *args, **kwargs)
+    return wrapper
+
+def _span_totals(root):
+    """Time spent under an op's root span, by span name, slowest first"""
+    return {name: round(ms, 1) for name, ms in sorted(root.totals.items(), key=lambda item: -item[1])}
 
 @op
+@_traced_op
 def get_business_accounts_op(context: OpExecutionContext):
-    """Get all active business accounts"""
+    """Get all active business accounts with their report date and daily metrics"""
     context.log.info("Fetching active business accounts...")
     
     metrics_service = DailyMetricsService()
@@ -14,53 +36,145 @@ def get_business_accounts_op(context: OpExecutionContext):
     
     context.log.info(f"Found {len(accounts)} active business accounts")
     
+    # Each business reports on yesterday in its own time zone; metrics for all of
+    # them come from one grouped query instead of one per business
+    for account in accounts:
+        account['report_date'] = local_report_date(account['timezone'])
+    metrics = metrics_service.get_daily_metrics_bulk({str(a['id']): a['report_date'] for a in accounts})
+    for account in accounts:
+        account['metrics'] = metrics.get(str(account['id']))
+    
+    context.log.info(f"Loaded daily metrics for {len(metrics)} business accounts")
+    
+    # Before any report of this run reads its leaderboards; on failure they use the last refresh
+    try:
+        _refresh_rollups(context, metrics_service)
+    except Exception as e:
+        context.log.warning(f"Could not refresh leaderboard rollups: {e}")
+    
+    # Only frees space: on failure expired snapshots wait for the next run
+    try:
+        pruned = metrics_service.prune_dashboard_snapshots()
+        if pruned:
+            context.log.info(f"Pruned {pruned} expired dashboard snapshots")
+    except Exception as e:
+        context.log.warning(f"Could not prune dashboard snapshots: {e}")
+    
+    # Before any report of this run is stored: pruning must not race with storing
+    try:
+        reports, sections = metrics_service.prune_rendered_reports()
+        if reports or sections:
+            context.log.info(f"Pruned {reports} expired reports and {sections} unused report sections")
+    except Exception as e:
+        context.log.warning(f"Could not prune rendered reports: {e}")
+    
     return accounts
 
+def _refresh_rollups(context, metrics_service):
+    context.log.info("Refreshing leaderboard rollups...")
+    
+    result = metrics_service.refresh_rollups()
+    
+    if result['skipped']:
+        context.log.info("Rollups are being refreshed by another run; skipping")
+    else:
+        context.log.info(f"Refreshed rollups for {result['days']} business-days (watermark {result['watermark']})")
+    
+    return result
+
+@op
+@_traced_op
+def refresh_rollups_op(context: OpExecutionContext):
+    """
+    Bring the leaderboard rollups up to date outside the nightly run, e.g. after a backfill
+    (get_business_accounts_op refreshes them at the start of every run)
+    """
+    return _refresh_rollups(context, DailyMetricsService())
+
 @op
+@_traced_op
 def generate_daily_report_op(context: OpExecutionContext, business_account: dict):
     """Generate daily report for a single business account"""
     business_id = str(business_account['id'])
     business_name = business_account['business_name']
     business_email = business_account['business_email']
+    current_root().set(business_id=business_id)
     
-    # Get yesterday's date (report runs at 10 PM for previous day)
-    report_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    # Yesterday in the business's time zone (set by get_business_accounts_op)
+    report_date = business_account.get('report_date') or local_report_date(business_account.get('timezone'))
     
     context.log.info(f"Generating report for {business_name} ({business_id}) - Date: {report_date}")
     
     metrics_service = DailyMetricsService()
     
-    # Get metrics
-    metrics = metrics_service.get_daily_metrics(business_id, report_date)
+    # Taken before anything is computed: dashboard snapshots are only stored if it still holds afterwards
+    watermark = metrics_service.get_orders_watermark(business_id, report_date)
+    
+    # Get metrics (preloaded in bulk by get_business_accounts_op)
+    metrics = business_account.get('metrics')
+    if metrics is None:
+        metrics = metrics_service.get_daily_metrics(business_id, report_date)
+    metrics = dict(metrics)
     
-    # Get orders
-    orders = metrics_service.get_daily_orders(business_id, report_date)
+    # Get orders (a dashboard page of them, for the snapshot; the email lists the first EMAIL_ORDERS_LIMIT)
+    orders = metrics_service.get_daily_orders(business_id, report_date, limit=DASHBOARD_ORDERS_LIMIT)
     
     # Get flyer data
     flyer_data = metrics_service.get_weekly_flyer_performance(business_id)
     
+    # Get leaderboards from the daily rollups (refreshed by get_business_accounts_op)
+    week_start = (datetime.strptime(report_date, '%Y-%m-%d') - timedelta(days=6)).strftime('%Y-%m-%d')
+    metrics['leaderboards'] = {
+        "top_products": metrics_service.get_top_products(business_id, report_date, report_date, limit=5),
+        "top_products_week": metrics_service.get_top_products(business_id, week_start, report_date, limit=5),
+        "top_customers": metrics_service.get_top_customers(business_id, report_date, report_date, limit=5)
+    }
+    
     # Generate HTML
     template_generator = EmailTemplateGenerator()
-    html_content = template_generator.generate_daily_report_html(
-        business_name=business_name,
-        metrics=metrics,
-        orders=orders,
-        flyer_data=flyer_data,
-        report_date=report_date
-    )
+    with span("render_report_html", business_id=business_id):
+        html_content = template_generator.generate_daily_report_html(
+            business_name=business_name,
+            metrics=metrics,
+            orders=orders[:EMAIL_ORDERS_LIMIT],
+            flyer_data=flyer_data,
+            report_date=report_date
+        )
     
     context.log.info(f"Report generated for {business_name}: Revenue=${metrics['total_revenue']:.2f}, Orders={metrics['total_transactions']}")
     
-    return {
+    # Keep the dashboard payloads for the morning rush; the API serves them while the day is unchanged
+    try:
+        if metrics_service.save_dashboard_snapshots(business_id, report_date, watermark, orders):
+            context.log.info(f"Saved dashboard snapshots for {business_name} ({report_date})")
+        else:
+            context.log.info(f"Orders of {business_name} changed during the run; dashboard snapshots skipped")
+    except Exception as e:
+        context.log.warning(f"Could not save dashboard snapshots for {business_name}: {e}")
+    
+    # Stored for "view in browser" links and support (/api/reports/{business_id}/{date})
+    try:
+        sections, stored = metrics_service.save_rendered_report(business_id, report_date, html_content)
+        context.log.info(f"Stored report for {business_name}: {stored} of {sections} sections new")
+    except Exception as e:
+        context.log.warning(f"Could not store report for {business_name}: {e}")
+    
+    # Carried to send_email_op and from there to summarize_run_timings_op
+    root = current_root()
+    timings = {"generate_ms": round(root.duration_ms, 1), "spans": _span_totals(root)}
+    
+    return Output({
         "business_id": business_id,
         "business_name": business_name,
         "business_email": business_email,
         "html_content": html_content,
         "report_date": report_date,
-        "metrics": metrics
-    }
+        "metrics": metrics,
+        "timings": timings
+    }, metadata={"duration_ms": timings["generate_ms"], "timings": MetadataValue.json(timings["spans"])})
 
 @op
+@_traced_op
 def send_email_op(context: OpExecutionContext, report_data: dict):
     """Send email report"""
     business_email = report_data['business_email']
@@ -69,16 +183,74 @@ def send_email_op(context: OpExecutionContext, report_data: dict):
     context.log.info(f"Sending email to {business_email}...")
     
     email_service = EmailService()
-    result = email_service.send_daily_report(
-        to_email=business_email,
-        business_name=business_name,
-        html_content=report_data['html_content'],
-        report_date=report_data['report_date']
-    )
+    with span("send_email", business_id=report_data.get('business_id')) as sending:
+        result = email_service.send_daily_report(
+            to_email=business_email,
+            business_name=business_name,
+            html_content=report_data['html_content'],
+            report_date=report_data['report_date']
+        )
     
     if result['success']:
         context.log.info(f"✓ Email sent successfully to {business_email}")
     else:
         context.log.error(f"✗ Failed to send email to {business_email}: {result['error']}")
     
-    return result
+    timings = dict(report_data.get('timings') or {})
+    timings['email_ms'] = round(sending.duration_ms, 1)
+    return {**result, "business_id": report_data.get('business_id'), "business_name": business_name, "timings": timings}
+
+@op
+@_traced_op
+def summarize_run_timings_op(context: OpExecutionContext, email_results: list):
+    """
+    The run's slowest businesses and where their time went, as op metadata.
+    Takes the collected send_email_op results (send_email_op.map(...).collect()).
+    """
+    businesses = []
+    for result in email_results:
+        timings = result.get('timings') or {}
+        spans = timings.get('spans') or {}
+        businesses.append({
+            "business_id": result.get('business_id'),
+            "business_name": result.get('business_name'),
+            "total_ms": round(timings.get('generate_ms', 0) + timings.get('email_ms', 0), 1),
+            "generate_ms": timings.get('generate_ms'),
+            "email_ms": timings.get('email_ms'),
+            "slowest_spans": dict(list(spans.items())[:3])
+        })
+    businesses.sort(key=lambda business: business['total_ms'], reverse=True)
+    slowest = businesses[:SLOWEST_BUSINESSES]
+    
+    table = ["| Business | Total ms | Generate ms | Email ms | Slowest spans |", "|---|---|---|---|---|"]
+    for business in slowest:
+        spans = ", ".join(f"{name} {ms:.0f} ms" for name, ms in business['slowest_spans'].items())
+        table.append(f"| {business['business_name']} | {business['total_ms']:.0f} | {business['generate_ms'] or 0:.0f} "
+                     f"| {business['email_ms'] or 0:.0f} | {spans} |")
+    
+    if slowest:
+        context.log.info(f"Slowest business: {slowest[0]['business_name']} ({slowest[0]['total_ms']:.0f} ms)")
+    
+    return Output({"businesses": len(businesses), "slowest": slowest}, metadata={
+        "businesses": len(businesses),
+        "total_ms": round(sum(business['total_ms'] for business in businesses), 1),
+        "slowest_businesses": MetadataValue.md("\n".join(table)),
+        "trace_id": uuid.UUID(context.run_id).hex
+    })
+
+@op(out=DynamicOut())
+def fan_out_business_accounts_op(context: OpExecutionContext, business_accounts: list):
+    """One dynamic output per business account, for a report and email each"""
+    for account in business_accounts:
+        yield DynamicOutput(account, mapping_key=str(account['id']).replace("-", "_"))
+
+@graph
+def daily_report_graph():
+    """
+    The nightly run: business accounts (rollups refreshed and expired snapshots and reports
+    pruned first), a report and email per business, then the run's timing summary.
+    Build the job with daily_report_graph.to_job().
+    """
+    accounts = fan_out_business_accounts_op(get_business_accounts_op())
+    email_results = accounts.map(generate_daily_report_op).map(send_email_op)
+    summarize_run_timings_op(email_results.collect())
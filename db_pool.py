@@ -0,0 +1,265 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.errors import QueryCanceled
+from psycopg2.extensions import connection as _PgConnection, parse_dsn
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+class DashboardConnection(_PgConnection):
+    """Connection subclass so per-session state can be kept on the pooled connection itself"""
+    statement_timeout_ms = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Names of server-side prepared statements on this session (see query_registry)
+        self.prepared_statements = set()
+
+def apply_statement_timeout(conn, timeout_ms):
+    """Set the session statement_timeout, skipping the round trip if it's already in effect"""
+    if timeout_ms is None or conn.statement_timeout_ms == timeout_ms:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SET statement_timeout = %s", (int(timeout_ms),))
+    conn.statement_timeout_ms = timeout_ms
+
+def _is_broken(error):
+    # A cancelled or timed-out statement leaves the connection perfectly usable
+    return (isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            and not isinstance(error, QueryCanceled))
+
+def config_from_dsn(dsn):
+    """Turn a libpq DSN or postgres:// URI into a connect() keyword dict"""
+    return parse_dsn(dsn)
+
+class PooledDatabase:
+    """A lazily created thread-safe connection pool for one database server"""
+
+    def __init__(self, name, config, minconn=1, maxconn=10, statement_timeout_ms=None,
+                 connection_factory=DashboardConnection, acquire_timeout=5):
+        self.name = name
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        # Seconds getconn waits for a connection once all maxconn are checked out
+        self.acquire_timeout = acquire_timeout
+        # A DashboardConnection subclass, e.g. one that traces its statements
+        self.connection_factory = connection_factory
+        self.statement_timeout_ms = statement_timeout_ms
+        self._pool = None
+        self._slots = None
+        self._pid = None
+        self._inherited = []
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # Created on first use so importing the app never opens connections, and again in
+        # a forked process: connections can't be shared with the parent
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is not None and self._pid != os.getpid():
+                    # Closing the parent's connections from here would end its sessions:
+                    # keep them referenced and unused instead
+                    self._inherited.append(self._pool)
+                    self._pool = None
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        self.minconn, self.maxconn,
+                        connection_factory=self.connection_factory,
+                        **self.config
+                    )
+                    # ThreadedConnectionPool raises as soon as it is empty; callers wait
+                    # for one of these instead
+                    self._slots = threading.BoundedSemaphore(self.maxconn)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def getconn(self, statement_timeout_ms=None, wait=True):
+        """
+        A connection from the pool, waiting up to acquire_timeout for one to be returned
+        (not at all with wait=False) before raising PoolError
+        """
+        pool = self._get_pool()
+        slots = self._slots
+        if not slots.acquire(timeout=self.acquire_timeout if wait else 0):
+            raise PoolError("connection pool exhausted")
+        try:
+            conn = pool.getconn()
+        except BaseException:
+            slots.release()
+            raise
+        try:
+            # Dashboard reads never need a transaction held open between statements
+            if not conn.autocommit:
+                conn.autocommit = True
+            apply_statement_timeout(conn, statement_timeout_ms or self.statement_timeout_ms)
+        except psycopg2.Error:
+            self.putconn(conn, broken=True)
+            raise
+        return conn
+
+    def putconn(self, conn, broken=False):
+        try:
+            self._get_pool().putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, statement_timeout_ms=None, cancel_token=None):
+        """
+        Pooled connection with the given statement timeout (the pool default otherwise).
+        While checked out it is registered with cancel_token, if any.
+        """
+        conn = self.getconn(statement_timeout_ms)
+        broken = False
+        try:
+            if cancel_token is not None:
+                cancel_token.register(conn)
+            yield conn
+        except Exception as e:
+            broken = _is_broken(e)
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.unregister(conn)
+            self.putconn(conn, broken)
+
+    def warm(self, prepare=None):
+        """Open the pool's minconn connections now, running prepare(conn) on each, if given"""
+        conns = [self.getconn() for _ in range(self.minconn)]
+        try:
+            for conn in conns:
+                if prepare is not None:
+                    prepare(conn)
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                if self._pid == os.getpid():
+                    self._pool.closeall()
+                else:
+                    self._inherited.append(self._pool)
+                self._pool = None
+
+class ReplicaRouter:
+    """
+    Routes read-only queries to replicas with round-robin load balancing.
+    Replicas that fail to connect are skipped for failure_cooldown seconds.
+    Fresh reads (queries about today) only go to replicas whose replication lag is
+    within max_lag_seconds, otherwise they fall back to the primary.
+    """
+
+    def __init__(self, primary, replicas=(), max_lag_seconds=30, lag_check_interval=5, failure_cooldown=30):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.failure_cooldown = failure_cooldown
+        self._next = itertools.count()
+        self._lag = {}
+        self._down_until = {}
+        self.routed = {db.name: 0 for db in [primary] + self.replicas}
+        self.lag_fallbacks = 0
+
+    def replica_lag(self, replica):
+        """Replication lag in seconds, cached for lag_check_interval"""
+        cached = self._lag.get(replica.name)
+        now = time.monotonic()
+        if cached and now - cached[1] < self.lag_check_interval:
+            return cached[0]
+
+        # Never queue for the probe: a busy replica raises PoolError and the read goes elsewhere
+        conn = replica.getconn(wait=False)
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+        except Exception as e:
+            broken = _is_broken(e)
+            raise
+        finally:
+            replica.putconn(conn, broken)
+
+        self._lag[replica.name] = (lag, now)
+        return lag
+
+    def _mark_down(self, replica):
+        self._down_until[replica.name] = time.monotonic() + self.failure_cooldown
+        self._lag.pop(replica.name, None)
+
+    def _candidates(self):
+        if not self.replicas:
+            return []
+        start = next(self._next) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        now = time.monotonic()
+        return [r for r in ordered if self._down_until.get(r.name, 0) <= now]
+
+    def _acquire(self, fresh, statement_timeout_ms):
+        for replica in self._candidates():
+            try:
+                if fresh and self.replica_lag(replica) > self.max_lag_seconds:
+                    self.lag_fallbacks += 1
+                    continue
+                # Don't queue on a busy replica while another one or the primary may be free
+                conn = replica.getconn(statement_timeout_ms, wait=False)
+            except PoolError:
+                continue
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._mark_down(replica)
+                continue
+            self.routed[replica.name] += 1
+            return replica, conn
+
+        self.routed[self.primary.name] += 1
+        return self.primary, self.primary.getconn(statement_timeout_ms)
+
+    @contextmanager
+    def read_connection(self, fresh=False, statement_timeout_ms=None, cancel_token=None):
+        """Pooled connection for a read-only query; fresh=True enforces the lag guard"""
+        target, conn = self._acquire(fresh, statement_timeout_ms)
+        broken = False
+        try:
+            if cancel_token is not None:
+                cancel_token.register(conn)
+            yield conn
+        except Exception as e:
+            broken = _is_broken(e)
+            if broken and target is not self.primary:
+                self._mark_down(target)
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.unregister(conn)
+            target.putconn(conn, broken)
+
+    def status(self):
+        replicas = {}
+        for replica in self.replicas:
+            try:
+                replicas[replica.name] = {"connected": True, "lag_seconds": self.replica_lag(replica)}
+            except PoolError:
+                replicas[replica.name] = {"connected": True, "busy": True}
+            except psycopg2.Error as e:
+                self._mark_down(replica)
+                replicas[replica.name] = {"connected": False, "error": str(e).strip()}
+        return {
+            "replicas": replicas,
+            "max_lag_seconds": self.max_lag_seconds,
+            "routed": dict(self.routed),
+            "lag_fallbacks": self.lag_fallbacks
+        }
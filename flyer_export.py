@@ -0,0 +1,151 @@
+"""
+The weekly flyer's product × day matrix as a spreadsheet download, one row per product
+with its quantity sold on each day of the flyer.
+
+Rows are built from EXPORT_QUERY as it is read, so the caller can run it on a
+server-side (named) cursor and stream the file: CSV goes out a chunk at a time, and XLSX
+is written with xlsxwriter's constant_memory mode to a temporary file that is streamed
+once it is complete, after the query's connection has been released. Memory use doesn't
+grow with the number of products or days.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import timedelta
+
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter is optional, CSV is always available
+    xlsxwriter = None
+
+# Format -> media type of the formats that can be exported here
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8"}
+if xlsxwriter is not None:
+    EXPORT_FORMATS["xlsx"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Bytes buffered before a chunk of the file is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Text starting with one of these is read as a formula by spreadsheet applications
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# One row per (product, local sale day) with sales, or per product without any, grouped by
+# product and ordered like /api/weekly-flyer-performance: most sold first, then by name.
+# Products come from the template so the ones that sold nothing are exported too.
+EXPORT_QUERY = """
+    WITH flyer_products AS (
+        SELECT DISTINCT pti.product_retailer_id, p.name
+        FROM product_template_items pti
+        JOIN product_template_sections pts ON pti.section_id = pts.id
+        JOIN products p ON pti.product_retailer_id = p.retailer_id
+        WHERE pts.template_id = %(template_id)s
+    ),
+    daily_sales AS (
+        SELECT
+            oi.product_retailer_id,
+            DATE(ot.created_at AT TIME ZONE ba.timezone) as sale_date,
+            SUM(oi.quantity) as quantity,
+            SUM(oi.quantity * oi.unit_price) as revenue
+        FROM business_accounts ba
+        JOIN order_transactions ot ON ot.business_account_id = ba.id
+        JOIN order_items oi ON oi.order_id = ot.id
+        WHERE ba.id = %(business_account_id)s::uuid
+            AND oi.product_retailer_id IN (SELECT product_retailer_id FROM flyer_products)
+            AND ot.status = 'completed'
+            AND ot.created_at >= (%(start_date)s::date)::timestamp AT TIME ZONE ba.timezone
+            AND ot.created_at < (%(end_date)s::date + 1)::timestamp AT TIME ZONE ba.timezone
+        GROUP BY oi.product_retailer_id, DATE(ot.created_at AT TIME ZONE ba.timezone)
+    )
+    SELECT fp.product_retailer_id, fp.name as product_name, s.sale_date, s.quantity, s.revenue
+    FROM flyer_products fp
+    LEFT JOIN daily_sales s ON s.product_retailer_id = fp.product_retailer_id
+    ORDER BY SUM(s.quantity) OVER (PARTITION BY fp.product_retailer_id) DESC NULLS LAST,
+        fp.name, fp.product_retailer_id, s.sale_date
+"""
+
+def flyer_days(start_date, end_date):
+    """The flyer's days, first to last"""
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+def header(days):
+    return ["product_name", "product_retailer_id", "total_quantity", "total_revenue"] + [day.isoformat() for day in days]
+
+def matrix_rows(sales, days):
+    """
+    One row per product from EXPORT_QUERY rows (grouped by product), in the order of
+    header(days). Only the current product's row is held.
+    """
+    day_index = {day: index for index, day in enumerate(days)}
+    row = None
+    for sale in sales:
+        product_retailer_id = str(sale['product_retailer_id'])
+        if row is None or row[1] != product_retailer_id:
+            if row is not None:
+                yield row
+            row = [sale['product_name'], product_retailer_id, 0, 0.0] + [0] * len(days)
+        index = day_index.get(sale['sale_date'])
+        if index is not None:
+            row[4 + index] += sale['quantity']
+            row[2] += sale['quantity']
+            row[3] += float(sale['revenue'])
+    if row is not None:
+        yield row
+
+def _as_text(value):
+    """A product name as spreadsheet text: one starting like a formula is prefixed with '"""
+    if value and value[0] in FORMULA_PREFIXES:
+        return "'" + value
+    return value
+
+def csv_chunks(rows, days):
+    """The CSV file in chunks of about EXPORT_CHUNK_SIZE bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header(days))
+    for row in rows:
+        row[0] = _as_text(row[0])
+        row[3] = round(row[3], 2)
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def write_xlsx(rows, days, sheet_name="Weekly Flyer"):
+    """
+    Write the XLSX file to a temporary file and return its path; the caller removes it. A
+    workbook can only be sent once it is complete, so rows are kept on disk until then.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        # constant_memory: each row is flushed to a temporary file as the next one starts.
+        # Names are written as text, never as formulas or links
+        workbook = xlsxwriter.Workbook(path, {
+            "constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False
+        })
+        sheet = workbook.add_worksheet(sheet_name)
+        bold = workbook.add_format({"bold": True})
+        money = workbook.add_format({"num_format": "0.00"})
+        sheet.write_row(0, 0, header(days), bold)
+        sheet.freeze_panes(1, 1)
+        for row_number, row in enumerate(rows, start=1):
+            sheet.write_row(row_number, 0, row[:3])
+            sheet.write_number(row_number, 3, row[3], money)
+            sheet.write_row(row_number, 4, row[4:])
+        workbook.close()
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def file_chunks(path):
+    """A file's contents in chunks of EXPORT_CHUNK_SIZE bytes"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
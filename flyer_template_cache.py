@@ -0,0 +1,237 @@
+import os
+import select
+import threading
+import time
+from dataclasses import dataclass
+import psycopg2
+
+# Channel the trigger in sql/flyer_template_notify.sql notifies on. The payload is the
+# business_account_id whose flyer changed, or '' when it can't be determined.
+NOTIFY_CHANNEL = "flyer_template_changed"
+
+# Key for "newest active flyer of any business"
+ANY_BUSINESS = None
+
+_TEMPLATE_COLUMNS = "id, name, start_date, end_date, status, business_account_id, updated_at"
+
+ACTIVE_TEMPLATE_QUERY = f"""
+    SELECT {_TEMPLATE_COLUMNS}
+    FROM product_templates
+    WHERE (name = 'Weekly Flyer' OR name ILIKE '%%weekly%%flyer%%')
+        AND status = 'active'
+        AND business_account_id = %s
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+ACTIVE_TEMPLATE_ANY_QUERY = f"""
+    SELECT {_TEMPLATE_COLUMNS}
+    FROM product_templates
+    WHERE (name = 'Weekly Flyer' OR name ILIKE '%%weekly%%flyer%%')
+        AND status = 'active'
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+TEMPLATE_VERSION_QUERY = """
+    SELECT status, updated_at
+    FROM product_templates
+    WHERE id = %s
+"""
+
+TEMPLATE_SECTIONS_QUERY = """
+    SELECT id, title, serial_number
+    FROM product_template_sections
+    WHERE template_id = %s
+    ORDER BY serial_number
+"""
+
+TEMPLATE_PRODUCTS_QUERY = """
+    SELECT DISTINCT pti.product_retailer_id, p.name
+    FROM product_template_items pti
+    JOIN product_template_sections pts ON pti.section_id = pts.id
+    JOIN products p ON pti.product_retailer_id = p.retailer_id
+    WHERE pts.template_id = %s
+    ORDER BY p.name
+"""
+
+@dataclass(slots=True)
+class ResolvedFlyer:
+    """An active flyer template with its sections and product list. Shared between requests: read only."""
+    template: dict
+    sections: list
+    products: list
+    version: object  # template updated_at when loaded
+
+    @property
+    def business_account_id(self):
+        return str(self.template['business_account_id'])
+
+    @property
+    def product_retailer_ids(self):
+        return [str(p['product_retailer_id']) for p in self.products]
+
+class _Entry:
+    __slots__ = ("flyer", "loaded_at", "checked_at")
+
+    def __init__(self, flyer, now):
+        self.flyer = flyer
+        self.loaded_at = now
+        self.checked_at = now
+
+class FlyerTemplateCache:
+    """
+    business_account_id -> active Weekly Flyer template -> sections and products.
+
+    Templates only change when a merchant edits the flyer, so flyer requests
+    resolve them from here and go straight to the sales aggregation. Entries are
+    dropped as soon as a NOTIFY arrives (when listen_config is given and the
+    trigger is installed), re-checked against the template's updated_at (a
+    primary-key lookup) every revalidate_after seconds, and reloaded in full
+    after max_age seconds in case a newer template was created without a NOTIFY.
+    "No active template" is cached too, until the next revalidation.
+    """
+
+    def __init__(self, listen_config=None, revalidate_after=60, max_age=900, max_entries=5000):
+        self.listen_config = listen_config
+        self.revalidate_after = revalidate_after
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.listening = False
+        self.hits = 0
+        self.revalidated = 0
+        self.loads = 0
+        self.invalidations = 0
+
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+
+    def resolve(self, cursor, business_account_id=ANY_BUSINESS):
+        """
+        The active flyer for business_account_id (ANY_BUSINESS: newest of any business),
+        or None. Queries run on the caller's cursor, which must return dict rows.
+        """
+        self._ensure_listener()
+        key = str(business_account_id) if business_account_id else ANY_BUSINESS
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation
+
+        if entry is not None and now - entry.loaded_at < self.max_age:
+            if now - entry.checked_at < self.revalidate_after:
+                self.hits += 1
+                return entry.flyer
+            if entry.flyer is not None and self._still_current(cursor, entry.flyer):
+                entry.checked_at = now
+                self.revalidated += 1
+                return entry.flyer
+
+        flyer = self._load(cursor, key)
+        with self._lock:
+            # Don't store a result that an invalidation raced with
+            if generation == self._generation:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                self._entries[key] = _Entry(flyer, now)
+        return flyer
+
+    def _still_current(self, cursor, flyer):
+        cursor.execute(TEMPLATE_VERSION_QUERY, (flyer.template['id'],))
+        row = cursor.fetchone()
+        return row is not None and row['status'] == 'active' and row['updated_at'] == flyer.version
+
+    def _load(self, cursor, key):
+        self.loads += 1
+        if key is ANY_BUSINESS:
+            cursor.execute(ACTIVE_TEMPLATE_ANY_QUERY, ())
+        else:
+            cursor.execute(ACTIVE_TEMPLATE_QUERY, (key,))
+        template = cursor.fetchone()
+        if not template:
+            return None
+
+        template = dict(template)
+        version = template.pop('updated_at')
+
+        cursor.execute(TEMPLATE_SECTIONS_QUERY, (template['id'],))
+        sections = [dict(row) for row in cursor.fetchall()]
+
+        products = []
+        if sections:
+            cursor.execute(TEMPLATE_PRODUCTS_QUERY, (template['id'],))
+            products = [dict(row) for row in cursor.fetchall()]
+
+        return ResolvedFlyer(template, sections, products, version)
+
+    def invalidate(self, business_account_id=None):
+        """Drop cached flyers for one business (and any that resolved to it), or everything"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if not business_account_id:
+                self._entries.clear()
+                return
+            business_account_id = str(business_account_id)
+            for key, entry in list(self._entries.items()):
+                if (key == business_account_id or key is ANY_BUSINESS
+                        or (entry.flyer is not None and entry.flyer.business_account_id == business_account_id)):
+                    del self._entries[key]
+
+    def _ensure_listener(self):
+        """Start the LISTEN thread in this process (again after a fork)"""
+        if not self.listen_config:
+            return
+        if self._listener_pid == os.getpid() and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="flyer-template-listener", daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self, reconnect_delay=5, heartbeat=30):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.listen_config)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                self.listening = True
+                # Anything may have changed while we weren't listening
+                self.invalidate()
+
+                while True:
+                    if select.select([conn], [], [], heartbeat) == ([], [], []):
+                        # Quiet: make sure the connection is still alive
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.invalidate(notify.payload or None)
+            except Exception as e:
+                print(f"Flyer template listener disconnected: {e}")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+            time.sleep(reconnect_delay)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+            "listening": self.listening
+        }
@@ -0,0 +1,46 @@
+"""
+Multi-process serving for the dashboard API:
+
+    gunicorn -c gunicorn.conf.py api:app
+
+The app is imported once in the master (preload_app) and the workers fork from it, so
+imports, the channel mapping and the query registry are ready in every worker. Database
+connections are never opened before the fork: each worker opens and warms its own pools
+(api.warm_worker) before it accepts requests. Workers share contact details through a
+SQLite cache in shared memory (caches.SharedCache).
+
+DASHBOARD_WORKERS sets the worker count and DASHBOARD_DB_CONNECTION_BUDGET the connections
+all workers together may hold to each database server; api.py sizes each worker's pools
+from the two. Admission control (rate limits and expensive-request caps) runs in each
+worker, with the API-wide limits divided between them.
+"""
+import glob
+import multiprocessing
+import os
+
+workers = int(os.environ.get("DASHBOARD_WORKERS", min(multiprocessing.cpu_count(), 4)))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("DASHBOARD_BIND", "0.0.0.0:8000")
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+
+# Read by api.py when the master imports it, so they're set here rather than in a hook
+os.environ["DASHBOARD_WORKERS"] = str(workers)
+os.environ.setdefault("DASHBOARD_DB_CONNECTION_BUDGET", "40")
+os.environ.setdefault("DASHBOARD_SHARED_CACHE", f"/dev/shm/dailydashboard-cache-{os.getpid()}.sqlite3")
+
+def _remove_shared_cache():
+    for path in glob.glob(os.environ["DASHBOARD_SHARED_CACHE"] + "*"):
+        os.remove(path)
+
+def on_starting(server):
+    # A file left by a master that had the same pid
+    _remove_shared_cache()
+
+def post_worker_init(worker):
+    import api
+    api.warm_worker()
+
+def on_exit(server):
+    _remove_shared_cache()
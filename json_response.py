@@ -0,0 +1,67 @@
+import gzip
+from decimal import Decimal
+import orjson
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; compressing them costs more than it saves
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+def _default(obj):
+    """Types orjson doesn't handle natively (UUID, datetime, date and dict rows are native)"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(content):
+    """Serialize a payload of rows straight to JSON bytes, skipping jsonable_encoder"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(Response):
+    """orjson-backed JSON response with native Decimal/UUID/datetime handling"""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+def _accepted_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress_body(body, accept_encoding):
+    """Compress a serialized body for the client; returns (body, content_encoding or None)"""
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    encoding = _accepted_encoding(accept_encoding or "")
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+def json_response(request, content, status_code=200, headers=None):
+    """Serialize with orjson and compress above COMPRESSION_MIN_SIZE when the client accepts it"""
+    return raw_json_response(request, dumps(content), status_code, headers)
+
+def raw_json_response(request, body, status_code=200, headers=None):
+    """json_response for a body that is already serialized JSON"""
+    return compressed_response(request, body, "application/json", status_code, headers)
+
+def compressed_response(request, body, media_type, status_code=200, headers=None):
+    """A serialized body of any type, compressed like json_response"""
+    body, encoding = compress_body(body, request.headers.get("accept-encoding"))
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, headers=headers, media_type=media_type)
@@ -0,0 +1,118 @@
+from dataclasses import dataclass, fields
+
+GUEST_CONTACT = ('Guest', 'N/A', None)
+
+@dataclass(slots=True)
+class OrderRecord:
+    """
+    One enriched order row. Slotted so a page of orders costs one small object per row,
+    and a dataclass so orjson serializes it directly (created_at is emitted as ISO 8601).
+    """
+    order_number: str
+    order_id: str
+    customer_id: str
+    chatwoot_contact_id: int
+    total_order_value: object
+    number_of_items: int
+    status: str
+    payment_status: str
+    delivery_type: str
+    created_at: object
+    channel_type_id: str
+    order_tax: object
+    order_value_sub_total: object
+    customer_name: str
+    customer_phone: str
+    customer_email: str
+    channel_name: str
+    customer_phone_display: str
+
+    # Dict-style access so email templates written against RealDictRow orders keep working
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def keys(self):
+        return [field.name for field in fields(self)]
+
+@dataclass(slots=True)
+class OrderRecordWithItems(OrderRecord):
+    """An OrderRecord with its line items nested, for include=items (attach_items)"""
+    items: list
+
+_ORDER_FIELDS = [field.name for field in fields(OrderRecord)]
+
+@dataclass(slots=True)
+class OrderItem:
+    """One line item of an order, with its product name"""
+    item_id: str
+    product_retailer_id: str
+    product_name: str
+    quantity: int
+    unit_price: object
+    line_total: object
+
+def contact_ids(rows):
+    """chatwoot_contact_ids referenced by a list of order tuples"""
+    return [row[3] for row in rows if row[3]]
+
+def build_contact_map(contact_rows):
+    """Map chatwoot_contact_id -> (name, phone, email) from tuple rows of the contacts lookup"""
+    return {
+        contact_id: (name or 'Guest', phone_number or 'N/A', email)
+        for contact_id, name, phone_number, email in contact_rows
+    }
+
+def build_order_records(rows, contacts, channel_mapping):
+    """Enrich order tuples with contact details, channel name and masked phone in a single pass"""
+    records = []
+    append = records.append
+
+    for row in rows:
+        (order_number, order_id, customer_id, chatwoot_contact_id, total_order_value,
+         number_of_items, status, payment_status, delivery_type, created_at,
+         channel_type_id, order_tax, order_value_sub_total) = row
+
+        name, phone, email = contacts.get(chatwoot_contact_id, GUEST_CONTACT) if chatwoot_contact_id else GUEST_CONTACT
+
+        if phone and phone != 'N/A':
+            phone_display = phone[:6] + '...' if len(phone) > 6 else phone
+        else:
+            phone_display = 'N/A'
+
+        append(OrderRecord(
+            order_number, order_id, customer_id, chatwoot_contact_id, total_order_value,
+            number_of_items, status, payment_status, delivery_type, created_at,
+            channel_type_id, order_tax, order_value_sub_total,
+            name, phone, email,
+            channel_mapping.get(str(channel_type_id), 'Unknown'),
+            phone_display
+        ))
+
+    return records
+
+def build_item_map(item_rows):
+    """Map order_id -> [OrderItem] from tuple rows of ORDER_ITEMS_BY_ORDER_IDS"""
+    items = {}
+    for order_id, item_id, product_retailer_id, product_name, quantity, unit_price in item_rows:
+        line_total = quantity * unit_price if quantity is not None and unit_price is not None else None
+        items.setdefault(str(order_id), []).append(OrderItem(
+            str(item_id), str(product_retailer_id) if product_retailer_id else None,
+            product_name or 'Unknown product', quantity, unit_price, line_total
+        ))
+    return items
+
+def attach_items(records, item_map):
+    """
+    The records with each order's items nested (an empty list for orders without any).
+    Plain OrderRecords have no items field, so orders serialize without it unless requested.
+    """
+    return [
+        OrderRecordWithItems(*[getattr(record, name) for name in _ORDER_FIELDS], item_map.get(str(record.order_id), []))
+        for record in records
+    ]
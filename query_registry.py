@@ -0,0 +1,486 @@
+"""
+Named queries shared by api.py and DailyMetricsService.
+
+Each hot query is prepared server-side once per pooled connection (PREPARE) and
+executed by name afterwards, so Postgres parses and plans it once per connection
+instead of on every request. Parameter types are inferred by the server.
+"""
+import re
+import uuid
+from datetime import datetime, timezone
+from psycopg2.errors import DuplicatePreparedStatement, InvalidSqlStatementName
+
+_PARAM = re.compile(r"\$(\d+)")
+
+class NamedQuery:
+    """A SQL text with $n placeholders that is prepared once per connection and executed by name"""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.param_count = max((int(n) for n in _PARAM.findall(sql)), default=0)
+        self.prepare_sql = f"PREPARE {name} AS {sql}"
+        placeholders = ", ".join(["%s"] * self.param_count)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if self.param_count else f"EXECUTE {name}"
+        # Same statement for connections that can't track prepared statements
+        self.inline_sql = _PARAM.sub(lambda m: f"%(p{m.group(1)})s", sql.replace("%", "%%"))
+
+    def inline_params(self, params):
+        return {f"p{i + 1}": value for i, value in enumerate(params)}
+
+def _prepare(cursor, query, prepared):
+    try:
+        cursor.execute(query.prepare_sql)
+    except DuplicatePreparedStatement:
+        # Prepared earlier on this session but not recorded (e.g. the connection was handed over)
+        if not cursor.connection.autocommit:
+            raise
+    prepared.add(query.name)
+
+def execute_named(cursor, query, params=()):
+    """Execute a NamedQuery on cursor, preparing it first if this connection hasn't yet"""
+    conn = cursor.connection
+    prepared = getattr(conn, "prepared_statements", None)
+
+    if prepared is None:
+        cursor.execute(query.inline_sql, query.inline_params(params))
+        return
+
+    if query.name not in prepared:
+        _prepare(cursor, query, prepared)
+
+    try:
+        cursor.execute(query.execute_sql, tuple(params))
+    except InvalidSqlStatementName:
+        # The session lost its statements (e.g. DISCARD ALL by a proxy); prepare again and retry once
+        if not conn.autocommit:
+            raise
+        prepared.discard(query.name)
+        _prepare(cursor, query, prepared)
+        cursor.execute(query.execute_sql, tuple(params))
+
+def prepare_named(cursor, queries):
+    """Prepare NamedQuerys this connection hasn't prepared yet, e.g. to warm a fresh pool"""
+    prepared = getattr(cursor.connection, "prepared_statements", None)
+    if prepared is None:
+        return
+    for query in queries:
+        if query.name not in prepared:
+            _prepare(cursor, query, prepared)
+
+# Column list for order lists. build_order_records unpacks rows positionally,
+# so this must stay in the same order as OrderRecord's leading fields.
+ORDER_SELECT_COLUMNS = """
+    ot.order_number,
+    ot.id as order_id,
+    ot.customer_id,
+    c.chatwoot_contact_id,
+    ot.total_order_value,
+    ot.number_of_items,
+    ot.status,
+    ot.payment_status,
+    ot.delivery_type,
+    ot.created_at,
+    ot.channel_type_id,
+    ot.order_tax,
+    ot.order_value_sub_total
+"""
+
+# Day $1 in the business's own time zone (ba is its business_accounts row), as a UTC
+# range on the raw column so the (business_account_id, created_at) indexes apply
+def _local_day(column):
+    return f"""{column} >= ($1::date)::timestamp AT TIME ZONE ba.timezone
+        AND {column} < ($1::date + 1)::timestamp AT TIME ZONE ba.timezone"""
+
+# Every time zone's day $1 falls inside this UTC window. The _ALL variants add it so
+# mixed-zone scans can still start from the created_at index.
+def _any_zone_day(column):
+    return f"""{column} >= ($1::date - 1)::timestamp AT TIME ZONE 'UTC'
+        AND {column} < ($1::date + 2)::timestamp AT TIME ZONE 'UTC'"""
+
+_METRICS_TOTALS = f"""
+    SELECT
+        COALESCE(SUM(ot.total_order_value), 0) as total_revenue,
+        COUNT(*) as total_transactions,
+        COALESCE(SUM(ot.number_of_items), 0) as items_sold
+    FROM business_accounts ba
+    JOIN order_transactions ot ON ot.business_account_id = ba.id
+    WHERE ot.status = 'completed'
+        AND {_local_day('ot.created_at')}
+"""
+
+_NEW_CUSTOMERS = f"""
+    SELECT COUNT(*) as new_customers
+    FROM business_accounts ba
+    JOIN customers c ON c.business_account_id = ba.id
+    WHERE {_local_day('c.created_at')}
+"""
+
+_DAILY_ORDERS = f"""
+    SELECT {ORDER_SELECT_COLUMNS}
+    FROM business_accounts ba
+    JOIN order_transactions ot ON ot.business_account_id = ba.id
+    LEFT JOIN customers c ON ot.customer_id = c.id
+    WHERE ot.status = 'completed'
+        AND {_local_day('ot.created_at')}
+"""
+
+# Per-business variants take the business as $2; the _all variants cover every business,
+# each bucketed by its own local day
+DAILY_METRICS_TOTALS = NamedQuery("daily_metrics_totals", _METRICS_TOTALS + " AND ba.id = $2")
+DAILY_METRICS_TOTALS_ALL = NamedQuery(
+    "daily_metrics_totals_all",
+    _METRICS_TOTALS + f" AND {_any_zone_day('ot.created_at')}"
+)
+
+NEW_CUSTOMERS = NamedQuery("new_customers", _NEW_CUSTOMERS + " AND ba.id = $2")
+NEW_CUSTOMERS_ALL = NamedQuery("new_customers_all", _NEW_CUSTOMERS + f" AND {_any_zone_day('c.created_at')}")
+
+# Newest first by the (created_at, id) keyset, so the first row is the since cursor's position
+DAILY_ORDERS = NamedQuery(
+    "daily_orders",
+    _DAILY_ORDERS + " AND ba.id = $2 ORDER BY ot.created_at DESC, ot.id DESC LIMIT $3"
+)
+DAILY_ORDERS_ALL = NamedQuery(
+    "daily_orders_all",
+    _DAILY_ORDERS + f" AND {_any_zone_day('ot.created_at')} ORDER BY ot.created_at DESC, ot.id DESC LIMIT $2"
+)
+
+# Incremental refresh of today's dashboard: rows of the day after a keyset cursor
+# (created_at, id), so a refresh costs time proportional to the new rows. Per-business
+# variants take the cursor as $3/$4; the _ALL variants as $2/$3. The summaries return
+# the totals of the new rows together with the cursor they advance to, in one snapshot.
+# Cursors are passed around as "created_at|id" per row source. SINCE_START is before
+# every row of a day, so a delta from it covers the whole day.
+SINCE_START = ("-infinity", "00000000-0000-0000-0000-000000000000")
+
+def encode_since(*positions):
+    parts = []
+    for created_at, row_id in positions:
+        if isinstance(created_at, datetime):
+            created_at = created_at.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+        parts.append(f"{created_at}|{row_id}")
+    return "|".join(parts)
+
+def decode_since(token, sources):
+    """Positions of a cursor made by encode_since; raises ValueError if it isn't one"""
+    parts = token.split("|")
+    if len(parts) != 2 * sources:
+        raise ValueError("wrong number of positions")
+    positions = []
+    for created_at, row_id in zip(parts[::2], parts[1::2]):
+        if created_at != SINCE_START[0]:
+            datetime.fromisoformat(created_at)
+        uuid.UUID(row_id)
+        positions.append((created_at, row_id))
+    return positions
+
+def since_position(row, previous):
+    """Cursor position reached by a delta query row, or previous if it found nothing new"""
+    return (row['last_created_at'], str(row['last_id'])) if row['last_id'] else previous
+
+_BY_BUSINESS_SINCE = {"business_filter": "AND ba.id = $2", "after": "$3", "after_id": "$4", "limit": "$5"}
+_ALL_BUSINESSES_SINCE = {"after": "$2", "after_id": "$3", "limit": "$4"}
+_ALL_BUSINESSES_SINCE_FILTERS = {
+    "orders": f"AND {_any_zone_day('ot.created_at')}",
+    "customers": f"AND {_any_zone_day('c.created_at')}"
+}
+
+_ORDERS_DELTA = f"""
+    WITH new_orders AS (
+        SELECT ot.id, ot.created_at, ot.total_order_value, ot.number_of_items
+        FROM business_accounts ba
+        JOIN order_transactions ot ON ot.business_account_id = ba.id
+        WHERE ot.status = 'completed'
+            AND {_local_day('ot.created_at')}
+            AND ot.created_at >= {{after}}
+            AND (ot.created_at, ot.id) > ({{after}}, {{after_id}})
+            {{business_filter}}
+    )
+    SELECT totals.*, last.created_at as last_created_at, last.id as last_id
+    FROM (
+        SELECT
+            COALESCE(SUM(total_order_value), 0) as total_revenue,
+            COUNT(*) as total_transactions,
+            COALESCE(SUM(number_of_items), 0) as items_sold
+        FROM new_orders
+    ) totals
+    LEFT JOIN (
+        SELECT created_at, id FROM new_orders ORDER BY created_at DESC, id DESC LIMIT 1
+    ) last ON true
+"""
+
+_NEW_CUSTOMERS_DELTA = f"""
+    WITH new_customers AS (
+        SELECT c.id, c.created_at
+        FROM business_accounts ba
+        JOIN customers c ON c.business_account_id = ba.id
+        WHERE {_local_day('c.created_at')}
+            AND c.created_at >= {{after}}
+            AND (c.created_at, c.id) > ({{after}}, {{after_id}})
+            {{business_filter}}
+    )
+    SELECT totals.new_customers, last.created_at as last_created_at, last.id as last_id
+    FROM (SELECT COUNT(*) as new_customers FROM new_customers) totals
+    LEFT JOIN (
+        SELECT created_at, id FROM new_customers ORDER BY created_at DESC, id DESC LIMIT 1
+    ) last ON true
+"""
+
+# Oldest first, so the last row is the next cursor
+_DAILY_ORDERS_SINCE = _DAILY_ORDERS + """
+        AND ot.created_at >= {after}
+        AND (ot.created_at, ot.id) > ({after}, {after_id})
+        {business_filter}
+    ORDER BY ot.created_at, ot.id
+    LIMIT {limit}
+"""
+
+ORDERS_DELTA = NamedQuery("orders_delta", _ORDERS_DELTA.format(**_BY_BUSINESS_SINCE))
+ORDERS_DELTA_ALL = NamedQuery(
+    "orders_delta_all",
+    _ORDERS_DELTA.format(business_filter=_ALL_BUSINESSES_SINCE_FILTERS["orders"], **_ALL_BUSINESSES_SINCE)
+)
+
+NEW_CUSTOMERS_DELTA = NamedQuery("new_customers_delta", _NEW_CUSTOMERS_DELTA.format(**_BY_BUSINESS_SINCE))
+NEW_CUSTOMERS_DELTA_ALL = NamedQuery(
+    "new_customers_delta_all",
+    _NEW_CUSTOMERS_DELTA.format(business_filter=_ALL_BUSINESSES_SINCE_FILTERS["customers"], **_ALL_BUSINESSES_SINCE)
+)
+
+DAILY_ORDERS_SINCE = NamedQuery("daily_orders_since", _DAILY_ORDERS_SINCE.format(**_BY_BUSINESS_SINCE))
+DAILY_ORDERS_SINCE_ALL = NamedQuery(
+    "daily_orders_since_all",
+    _DAILY_ORDERS_SINCE.format(business_filter=_ALL_BUSINESSES_SINCE_FILTERS["orders"], **_ALL_BUSINESSES_SINCE)
+)
+
+# Line items of a page of orders, with product names, in one round trip. Column order
+# matches build_item_map's unpacking.
+ORDER_ITEMS_BY_ORDER_IDS = NamedQuery("order_items_by_order_ids", """
+    SELECT
+        oi.order_id,
+        oi.id as item_id,
+        oi.product_retailer_id,
+        p.name as product_name,
+        oi.quantity,
+        oi.unit_price
+    FROM order_items oi
+    LEFT JOIN products p ON oi.product_retailer_id = p.retailer_id
+    WHERE oi.order_id = ANY($1::text[]::uuid[])
+    ORDER BY oi.order_id, p.name, oi.id
+""")
+
+CONTACTS_BY_IDS = NamedQuery("contacts_by_ids", """
+    SELECT id, name, phone_number, email
+    FROM contacts
+    WHERE id = ANY($1)
+""")
+
+# Dashboard queries over the rollups (rollups.py). Per-business variants take the
+# range as $1/$2, the business as $3 and the limit as $4; the _ALL variants take the limit as $3.
+_TOP_PRODUCTS = """
+    SELECT d.product_retailer_id, p.name as product_name, SUM(d.quantity) as quantity, SUM(d.revenue) as revenue
+    FROM daily_product_sales d
+    JOIN products p ON d.product_retailer_id = p.retailer_id
+    WHERE d.sale_date BETWEEN $1 AND $2 {business_filter}
+    GROUP BY d.product_retailer_id, p.name
+    ORDER BY {ranking} DESC, d.product_retailer_id
+    LIMIT {limit}
+"""
+
+_TOP_CUSTOMERS = """
+    SELECT d.customer_id, c.chatwoot_contact_id, SUM(d.orders) as orders, SUM(d.spend) as spend
+    FROM daily_customer_spend d
+    LEFT JOIN customers c ON d.customer_id = c.id
+    WHERE d.sale_date BETWEEN $1 AND $2 {business_filter}
+    GROUP BY d.customer_id, c.chatwoot_contact_id
+    ORDER BY spend DESC, d.customer_id
+    LIMIT {limit}
+"""
+
+_BY_BUSINESS = {"business_filter": "AND d.business_account_id = $3", "limit": "$4"}
+_ALL_BUSINESSES = {"business_filter": "", "limit": "$3"}
+
+TOP_PRODUCTS = {
+    ranking: NamedQuery(f"top_products_by_{ranking}", _TOP_PRODUCTS.format(ranking=ranking, **_BY_BUSINESS))
+    for ranking in ("quantity", "revenue")
+}
+TOP_PRODUCTS_ALL = {
+    ranking: NamedQuery(f"top_products_by_{ranking}_all", _TOP_PRODUCTS.format(ranking=ranking, **_ALL_BUSINESSES))
+    for ranking in ("quantity", "revenue")
+}
+
+TOP_CUSTOMERS = NamedQuery("top_customers", _TOP_CUSTOMERS.format(**_BY_BUSINESS))
+TOP_CUSTOMERS_ALL = NamedQuery("top_customers_all", _TOP_CUSTOMERS.format(**_ALL_BUSINESSES))
+
+# New vs. returning buyers over a range: customers with completed orders in the range
+# whose first completed order ever was before it are returning
+_RETURNING_CUSTOMERS = """
+    SELECT
+        COUNT(*) as buying_customers,
+        COUNT(*) FILTER (WHERE i.first_order_date < $1) as returning_customers
+    FROM (
+        SELECT DISTINCT business_account_id, customer_id
+        FROM daily_customer_spend d
+        WHERE d.sale_date BETWEEN $1 AND $2 {business_filter}
+    ) buyers
+    JOIN customer_order_index i ON i.business_account_id = buyers.business_account_id
+        AND i.customer_id = buyers.customer_id
+"""
+
+# Customers of each weekly cohort (first order week in $1..$2) active n weeks later, n <= limit
+_COHORT_RETENTION = """
+    SELECT
+        i.first_order_week as cohort_week,
+        (a.week_start - i.first_order_week) / 7 as week_number,
+        COUNT(*) as active_customers
+    FROM customer_order_index i
+    JOIN customer_activity_weeks a ON a.business_account_id = i.business_account_id
+        AND a.customer_id = i.customer_id
+    WHERE i.first_order_week BETWEEN $1 AND $2 {business_filter}
+        AND a.week_start >= i.first_order_week
+        AND a.week_start <= i.first_order_week + 7 * {limit}
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+RETURNING_CUSTOMERS = NamedQuery("returning_customers", _RETURNING_CUSTOMERS.format(**_BY_BUSINESS))
+RETURNING_CUSTOMERS_ALL = NamedQuery("returning_customers_all", _RETURNING_CUSTOMERS.format(**_ALL_BUSINESSES))
+
+COHORT_RETENTION = NamedQuery(
+    "cohort_retention",
+    _COHORT_RETENTION.format(business_filter="AND i.business_account_id = $3", limit="$4")
+)
+COHORT_RETENTION_ALL = NamedQuery("cohort_retention_all", _COHORT_RETENTION.format(business_filter="", limit="$3"))
+
+# KPIs of every business for one day ($1, each business's local day) in a single statement:
+# portfolio totals plus one sorted page ($2 limit, $3 offset). Range predicates so the
+# created_at indexes apply.
+_PORTFOLIO_METRICS = f"""
+    WITH orders AS (
+        SELECT 
+            ot.business_account_id,
+            SUM(ot.total_order_value) as total_revenue,
+            COUNT(*) as total_transactions,
+            SUM(ot.number_of_items) as items_sold
+        FROM business_accounts ba
+        JOIN order_transactions ot ON ot.business_account_id = ba.id
+        WHERE ot.status = 'completed'
+            AND {_local_day('ot.created_at')}
+            AND {_any_zone_day('ot.created_at')}
+        GROUP BY ot.business_account_id
+    ),
+    new_customers AS (
+        SELECT c.business_account_id, COUNT(*) as new_customers
+        FROM business_accounts ba
+        JOIN customers c ON c.business_account_id = ba.id
+        WHERE {_local_day('c.created_at')}
+            AND {_any_zone_day('c.created_at')}
+        GROUP BY c.business_account_id
+    ),
+    kpis AS (
+        SELECT 
+            ba.id as business_account_id,
+            ba.name as business_name,
+            COALESCE(o.total_revenue, 0) as total_revenue,
+            COALESCE(o.total_transactions, 0) as total_transactions,
+            COALESCE(o.items_sold, 0) as items_sold,
+            COALESCE(n.new_customers, 0) as new_customers,
+            COALESCE(o.total_revenue / NULLIF(o.total_transactions, 0), 0) as average_order_value
+        FROM business_accounts ba
+        LEFT JOIN orders o ON o.business_account_id = ba.id
+        LEFT JOIN new_customers n ON n.business_account_id = ba.id
+    ),
+    page AS (
+        SELECT kpis.*, row_number() OVER (ORDER BY {{order_by}}, business_account_id) as position
+        FROM kpis
+        ORDER BY position
+        LIMIT $2 OFFSET $3
+    ),
+    totals AS (
+        SELECT 
+            COUNT(*) as total_businesses,
+            COUNT(*) FILTER (WHERE total_transactions > 0) as active_businesses,
+            COALESCE(SUM(total_revenue), 0) as portfolio_revenue,
+            COALESCE(SUM(total_transactions), 0) as portfolio_transactions,
+            COALESCE(SUM(items_sold), 0) as portfolio_items_sold,
+            COALESCE(SUM(new_customers), 0) as portfolio_new_customers
+        FROM kpis
+    )
+    SELECT totals.*, page.*
+    FROM totals
+    LEFT JOIN page ON true
+    ORDER BY page.position
+"""
+
+# sort parameter -> KPI column
+PORTFOLIO_SORTS = {
+    "revenue": "total_revenue",
+    "transactions": "total_transactions",
+    "items_sold": "items_sold",
+    "new_customers": "new_customers",
+    "average_order_value": "average_order_value",
+    "business_name": "business_name"
+}
+
+PORTFOLIO_METRICS = {
+    (sort, direction): NamedQuery(
+        f"portfolio_metrics_{sort}_{direction}",
+        _PORTFOLIO_METRICS.format(order_by=f"{column} {direction.upper()} NULLS LAST")
+    )
+    for sort, column in PORTFOLIO_SORTS.items()
+    for direction in ("asc", "desc")
+}
+
+# Cheap change detection for a day's orders and customers ($1 day, $2 business or NULL
+# for all): index-friendly aggregates that change whenever the day's payloads would.
+# Behind the API's ETags and the validity of dashboard snapshots (snapshots.py).
+ORDERS_WATERMARK = NamedQuery("orders_watermark", f"""
+    SELECT 
+        (SELECT COUNT(*) || ':' || COALESCE(MAX(ot.updated_at)::text, '')
+         FROM business_accounts ba
+         JOIN order_transactions ot ON ot.business_account_id = ba.id
+         WHERE {_local_day('ot.created_at')}
+            AND ($2::uuid IS NULL OR ba.id = $2::uuid)
+        ) as orders_watermark,
+        (SELECT COUNT(*)
+         FROM business_accounts ba
+         JOIN customers c ON c.business_account_id = ba.id
+         WHERE {_local_day('c.created_at')}
+            AND ($2::uuid IS NULL OR ba.id = $2::uuid)
+        ) as customers_watermark
+""")
+
+# Changes when a business is added or removed, renamed or moves time zone: the portfolio
+# lists every business, by name, with its day in its own time zone
+BUSINESS_ACCOUNTS_WATERMARK = NamedQuery("business_accounts_watermark", """
+    SELECT COUNT(*) || ':' || md5(COALESCE(
+        string_agg(id::text || ':' || COALESCE(name, '') || ':' || timezone, ',' ORDER BY id), ''
+    )) as businesses_watermark
+    FROM business_accounts
+""")
+
+ROLLUPS_WATERMARK = NamedQuery("rollups_watermark", """
+    SELECT watermark, refreshed_at
+    FROM rollup_state
+    WHERE name = 'leaderboards'
+""")
+
+QUERIES = {
+    query.name: query for query in [
+        DAILY_METRICS_TOTALS, DAILY_METRICS_TOTALS_ALL,
+        NEW_CUSTOMERS, NEW_CUSTOMERS_ALL,
+        DAILY_ORDERS, DAILY_ORDERS_ALL,
+        ORDERS_DELTA, ORDERS_DELTA_ALL,
+        NEW_CUSTOMERS_DELTA, NEW_CUSTOMERS_DELTA_ALL,
+        DAILY_ORDERS_SINCE, DAILY_ORDERS_SINCE_ALL,
+        ORDER_ITEMS_BY_ORDER_IDS,
+        CONTACTS_BY_IDS,
+        *TOP_PRODUCTS.values(), *TOP_PRODUCTS_ALL.values(),
+        TOP_CUSTOMERS, TOP_CUSTOMERS_ALL,
+        RETURNING_CUSTOMERS, RETURNING_CUSTOMERS_ALL,
+        COHORT_RETENTION, COHORT_RETENTION_ALL,
+        *PORTFOLIO_METRICS.values(),
+        ORDERS_WATERMARK, BUSINESS_ACCOUNTS_WATERMARK, ROLLUPS_WATERMARK
+    ]
+}
@@ -0,0 +1,121 @@
+"""
+Rendered daily reports, stored by the nightly run in report_chunks and rendered_reports
+(sql/rendered_reports.sql) so "view in browser" links and support can open a report
+without re-running its queries and render.
+
+A report is split into sections before each HTML comment, the generator's section
+labels (e.g. <!-- Header -->), except Outlook's conditional comments (<!--[if mso]>),
+which sit inside a section. Each section is gzip-compressed and stored once under the
+SHA-256 of its HTML, and a report is the ordered list of its sections' digests. Styles,
+header, footer and any section that is the same as another business's or another day's
+are shared.
+"""
+import gzip
+import hashlib
+import re
+
+# Reports older than this are deleted by prune_reports
+REPORT_RETENTION_DAYS = 90
+
+# Chunks are compressed once and read many times
+REPORT_GZIP_LEVEL = 9
+
+# Unreferenced chunks are kept this long, so a report being stored concurrently can't lose one
+CHUNK_GRACE_PERIOD = "1 day"
+
+# Before a comment that isn't conditional (<!--[if ...]>, <!--<![endif]-->)
+_SECTION_BOUNDARY = re.compile(r"(?=<!--(?!\[if|<!\[endif))")
+
+TOUCH_CHUNKS_QUERY = """
+    UPDATE report_chunks
+    SET last_used = now()
+    WHERE digest = ANY(%s)
+    RETURNING digest
+"""
+
+SAVE_CHUNKS_QUERY = """
+    INSERT INTO report_chunks (digest, body, last_used)
+    SELECT digest, body, now()
+    FROM unnest(%s::text[], %s::bytea[]) AS chunk(digest, body)
+    ON CONFLICT (digest) DO UPDATE SET last_used = EXCLUDED.last_used
+"""
+
+SAVE_REPORT_QUERY = """
+    INSERT INTO rendered_reports (business_account_id, report_date, sections, html_size, created_at)
+    VALUES (%s, %s, %s, %s, now())
+    ON CONFLICT (business_account_id, report_date) DO UPDATE
+        SET sections = EXCLUDED.sections, html_size = EXCLUDED.html_size, created_at = EXCLUDED.created_at
+"""
+
+REPORT_SECTIONS_QUERY = """
+    SELECT sections
+    FROM rendered_reports
+    WHERE business_account_id = %s AND report_date = %s
+"""
+
+LOAD_CHUNKS_QUERY = """
+    SELECT digest, body
+    FROM report_chunks
+    WHERE digest = ANY(%s)
+"""
+
+PRUNE_REPORTS_QUERY = """
+    DELETE FROM rendered_reports
+    WHERE report_date < CURRENT_DATE - %s
+"""
+
+PRUNE_CHUNKS_QUERY = f"""
+    DELETE FROM report_chunks c
+    WHERE c.last_used < now() - interval '{CHUNK_GRACE_PERIOD}'
+        AND NOT EXISTS (SELECT 1 FROM rendered_reports r WHERE r.sections @> ARRAY[c.digest])
+"""
+
+def split_sections(html):
+    """The report's HTML cut before each section label; joining the parts gives it back unchanged"""
+    return [section for section in _SECTION_BOUNDARY.split(html) if section]
+
+def section_digest(section):
+    return hashlib.sha256(section.encode()).hexdigest()
+
+def save_report(cursor, business_account_id, report_date, html):
+    """
+    Store a rendered report, compressing only the sections not stored yet. Run in a
+    transaction on a cursor returning dict rows; returns (sections, newly stored sections).
+    """
+    sections = split_sections(html)
+    digests = [section_digest(section) for section in sections]
+    
+    # Marks the chunks this report reuses as in use (and locks them) so pruning leaves them alone
+    cursor.execute(TOUCH_CHUNKS_QUERY, (list(set(digests)),))
+    stored = {row['digest'] for row in cursor.fetchall()}
+    
+    new_chunks = {}
+    for digest, section in zip(digests, sections):
+        if digest not in stored and digest not in new_chunks:
+            new_chunks[digest] = gzip.compress(section.encode(), compresslevel=REPORT_GZIP_LEVEL)
+    if new_chunks:
+        cursor.execute(SAVE_CHUNKS_QUERY, (list(new_chunks), list(new_chunks.values())))
+    
+    cursor.execute(SAVE_REPORT_QUERY, (business_account_id, report_date, digests, len(html.encode())))
+    return len(digests), len(new_chunks)
+
+def report_sections(cursor, business_account_id, report_date):
+    """Section digests of a stored report, or None. They identify its exact HTML"""
+    cursor.execute(REPORT_SECTIONS_QUERY, (business_account_id, report_date))
+    row = cursor.fetchone()
+    return row['sections'] if row else None
+
+def load_sections(cursor, sections):
+    """The HTML of a report from its section digests, or None if a chunk is gone"""
+    cursor.execute(LOAD_CHUNKS_QUERY, (list(sections),))
+    bodies = {row['digest']: row['body'] for row in cursor.fetchall()}
+    if not all(digest in bodies for digest in sections):
+        return None
+    return "".join(gzip.decompress(bodies[digest]).decode() for digest in sections)
+
+def prune_reports(cursor, retention_days=REPORT_RETENTION_DAYS):
+    """Delete reports past their retention, then the chunks no report uses; returns (reports, chunks)"""
+    cursor.execute(PRUNE_REPORTS_QUERY, (retention_days,))
+    reports = cursor.rowcount
+    cursor.execute(PRUNE_CHUNKS_QUERY)
+    return reports, cursor.rowcount
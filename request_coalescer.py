@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+
+class RequestCoalescer:
+    """
+    Single-flight coalescing of identical concurrent requests on the event loop.
+    The first caller for a key starts the computation; callers arriving while it is
+    still running await it and receive the same result (or the same exception).
+    Nothing is cached once the computation finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async_calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) once per key across concurrent tasks (async handlers)"""
+        task = self._async_calls.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._async_calls[key] = task
+            task.add_done_callback(lambda done: self._finish_async(key, done))
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        # Shield so one cancelled waiter does not cancel the shared computation
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key, task):
+        self.forget(key, task)
+        with self._lock:
+            self.executed += 1
+
+    def forget(self, key, task=None):
+        """Stop handing an in-flight async computation to new callers (e.g. once it was cancelled)"""
+        if task is None or self._async_calls.get(key) is task:
+            self._async_calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._async_calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced
+            }
@@ -0,0 +1,95 @@
+import threading
+import time
+from psycopg2.errors import QueryCanceled
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for reset_timeout seconds after
+    failure_threshold consecutive failures, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let exactly one trial call through
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """
+        The call let through by allow() ended without telling whether the dependency works
+        (e.g. it was cancelled): let the next call make the half-open trial instead
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected
+            }
+
+class CancelToken:
+    """
+    Cancels the in-progress queries of one computation, e.g. once every client
+    waiting for it has disconnected. Connections register while executing.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def register(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCanceled("canceling statement: no client is waiting for the result")
+            self._connections.add(conn)
+
+    def unregister(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def cancel(self):
+        # Cancel under the lock: once unregister() returns, the connection can go back to
+        # the pool and to another request, which must not see this cancel
+        with self._lock:
+            self.cancelled = True
+            for conn in self._connections:
+                # Sends a cancel request to the backend; the running statement raises QueryCanceled
+                conn.cancel()
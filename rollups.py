@@ -0,0 +1,248 @@
+"""
+Incrementally maintained rollups of order_transactions (tables in sql/rollups.sql).
+
+- daily_product_sales / daily_customer_spend: one row per business, local day
+  (business_accounts.timezone) and product / customer, behind the top-products and top-customers leaderboards
+- customer_order_index: first and last completed order per customer, behind
+  new vs. returning buyers and weekly cohorts
+- customer_activity_weeks: the weeks each customer ordered in, behind retention curves
+
+refresh_rollups() recomputes only the (business, day) pairs with orders created
+or updated since the previous refresh, plus the index rows of the customers and
+the activity of the weeks they touch, so dashboard queries are small GROUP BYs
+over pre-aggregated rows instead of scans or self-joins of the order history.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+ROLLUP_NAME = "leaderboards"
+
+# Orders updated up to this long before the previous watermark are picked up again,
+# for transactions that committed after the previous refresh had read past them
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+TOP_PRODUCTS_ORDERINGS = ("quantity", "revenue")
+
+LOCK_QUERY = "SELECT pg_try_advisory_xact_lock(hashtext('rollups:' || %s))"
+
+STATE_QUERY = "SELECT watermark FROM rollup_state WHERE name = %s"
+
+HIGH_WATERMARK_QUERY = """
+    SELECT MAX(COALESCE(updated_at, created_at))
+    FROM order_transactions
+    WHERE COALESCE(updated_at, created_at) >= %(since)s
+"""
+
+CHANGED_DAYS_QUERY = """
+    CREATE TEMP TABLE rollup_changed_days ON COMMIT DROP AS
+    SELECT DISTINCT ot.business_account_id, DATE(ot.created_at AT TIME ZONE ba.timezone) as sale_date
+    FROM order_transactions ot
+    JOIN business_accounts ba ON ba.id = ot.business_account_id
+    WHERE COALESCE(ot.updated_at, ot.created_at) >= %(since)s
+"""
+
+# Orders of one changed (business, day), found through the (business_account_id, created_at) index
+_CHANGED_ORDERS = """
+    FROM rollup_changed_days d
+    JOIN business_accounts ba ON ba.id = d.business_account_id
+    JOIN order_transactions ot ON ot.business_account_id = d.business_account_id
+        AND ot.created_at >= (d.sale_date)::timestamp AT TIME ZONE ba.timezone
+        AND ot.created_at < (d.sale_date + 1)::timestamp AT TIME ZONE ba.timezone
+"""
+
+# Customers with any order on a changed day; their index rows are rebuilt from all their orders
+CHANGED_CUSTOMERS_QUERY = f"""
+    CREATE TEMP TABLE rollup_changed_customers ON COMMIT DROP AS
+    SELECT DISTINCT ot.business_account_id, ot.customer_id
+    {_CHANGED_ORDERS}
+    WHERE ot.customer_id IS NOT NULL
+"""
+
+# Weeks (Monday start) containing a changed day; their activity rows are rebuilt
+CHANGED_WEEKS_QUERY = """
+    CREATE TEMP TABLE rollup_changed_weeks ON COMMIT DROP AS
+    SELECT DISTINCT business_account_id, date_trunc('week', sale_date)::date as week_start
+    FROM rollup_changed_days
+"""
+
+# (result key, statement) in execution order; row counts of keyed statements are reported
+REFRESH_QUERIES = [
+    (None, """
+    DELETE FROM daily_product_sales s
+    USING rollup_changed_days d
+    WHERE s.business_account_id = d.business_account_id AND s.sale_date = d.sale_date
+    """),
+    ("product_rows", f"""
+    INSERT INTO daily_product_sales (business_account_id, sale_date, product_retailer_id, quantity, revenue)
+    SELECT d.business_account_id, d.sale_date, oi.product_retailer_id,
+        SUM(oi.quantity), COALESCE(SUM(oi.quantity * oi.unit_price), 0)
+    {_CHANGED_ORDERS}
+    JOIN order_items oi ON oi.order_id = ot.id
+    WHERE ot.status = 'completed'
+        AND oi.product_retailer_id IS NOT NULL
+    GROUP BY d.business_account_id, d.sale_date, oi.product_retailer_id
+    """),
+    (None, """
+    DELETE FROM daily_customer_spend s
+    USING rollup_changed_days d
+    WHERE s.business_account_id = d.business_account_id AND s.sale_date = d.sale_date
+    """),
+    ("customer_rows", f"""
+    INSERT INTO daily_customer_spend (business_account_id, sale_date, customer_id, orders, spend)
+    SELECT d.business_account_id, d.sale_date, ot.customer_id,
+        COUNT(*), COALESCE(SUM(ot.total_order_value), 0)
+    {_CHANGED_ORDERS}
+    WHERE ot.status = 'completed'
+        AND ot.customer_id IS NOT NULL
+    GROUP BY d.business_account_id, d.sale_date, ot.customer_id
+    """),
+    (None, """
+    DELETE FROM customer_order_index i
+    USING rollup_changed_customers c
+    WHERE i.business_account_id = c.business_account_id AND i.customer_id = c.customer_id
+    """),
+    ("customer_index_rows", """
+    INSERT INTO customer_order_index (
+        business_account_id, customer_id, first_order_at, last_order_at,
+        first_order_date, first_order_week, completed_orders, total_spend
+    )
+    SELECT c.business_account_id, c.customer_id, MIN(ot.created_at), MAX(ot.created_at),
+        DATE(MIN(ot.created_at) AT TIME ZONE ba.timezone),
+        date_trunc('week', DATE(MIN(ot.created_at) AT TIME ZONE ba.timezone))::date,
+        COUNT(*), COALESCE(SUM(ot.total_order_value), 0)
+    FROM rollup_changed_customers c
+    JOIN business_accounts ba ON ba.id = c.business_account_id
+    JOIN order_transactions ot ON ot.customer_id = c.customer_id
+        AND ot.business_account_id = c.business_account_id
+    WHERE ot.status = 'completed'
+    GROUP BY c.business_account_id, c.customer_id, ba.timezone
+    """),
+    (None, """
+    DELETE FROM customer_activity_weeks a
+    USING rollup_changed_weeks w
+    WHERE a.business_account_id = w.business_account_id AND a.week_start = w.week_start
+    """),
+    ("activity_rows", """
+    INSERT INTO customer_activity_weeks (business_account_id, customer_id, week_start, orders)
+    SELECT w.business_account_id, ot.customer_id, w.week_start, COUNT(*)
+    FROM rollup_changed_weeks w
+    JOIN business_accounts ba ON ba.id = w.business_account_id
+    JOIN order_transactions ot ON ot.business_account_id = w.business_account_id
+        AND ot.created_at >= (w.week_start)::timestamp AT TIME ZONE ba.timezone
+        AND ot.created_at < (w.week_start + 7)::timestamp AT TIME ZONE ba.timezone
+    WHERE ot.status = 'completed'
+        AND ot.customer_id IS NOT NULL
+    GROUP BY w.business_account_id, ot.customer_id, w.week_start
+    """)
+]
+
+SAVE_STATE_QUERY = """
+    INSERT INTO rollup_state (name, watermark, refreshed_at)
+    VALUES (%s, %s, now())
+    ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, refreshed_at = EXCLUDED.refreshed_at
+"""
+
+def refresh_rollups(conn, name=ROLLUP_NAME):
+    """
+    Bring the daily rollups up to date with order_transactions in one transaction.
+    Returns counts of what was refreshed, or skipped=True if another refresh holds the lock.
+    """
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute(LOCK_QUERY, (name,))
+            if not cursor.fetchone()[0]:
+                return {"skipped": True}
+
+            cursor.execute(STATE_QUERY, (name,))
+            state = cursor.fetchone()
+            since = state[0] - REFRESH_OVERLAP if state else datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+            cursor.execute(HIGH_WATERMARK_QUERY, {"since": since})
+            watermark = cursor.fetchone()[0]
+            if watermark is None:
+                return {"skipped": False, "days": 0, "watermark": state[0].isoformat() if state else None}
+
+            cursor.execute(CHANGED_DAYS_QUERY, {"since": since})
+            days = cursor.rowcount
+            cursor.execute(CHANGED_CUSTOMERS_QUERY)
+            cursor.execute(CHANGED_WEEKS_QUERY)
+            counts = {}
+            for key, query in REFRESH_QUERIES:
+                cursor.execute(query)
+                if key:
+                    counts[key] = cursor.rowcount
+
+            cursor.execute(SAVE_STATE_QUERY, (name, watermark))
+        conn.commit()
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+
+    return {
+        "skipped": False,
+        "days": days,
+        **counts,
+        "watermark": watermark.isoformat()
+    }
+
+def format_top_products(rows):
+    return [
+        {
+            "product_retailer_id": str(row['product_retailer_id']),
+            "product_name": row['product_name'],
+            "quantity": int(row['quantity']),
+            "revenue": float(row['revenue'])
+        }
+        for row in rows
+    ]
+
+def format_top_customers(rows, contacts):
+    """rows from TOP_CUSTOMERS; contacts maps chatwoot_contact_id -> (name, phone, email)"""
+    customers = []
+    for row in rows:
+        name, phone, email = contacts.get(row['chatwoot_contact_id'], ('Guest', 'N/A', None))
+        customers.append({
+            "customer_id": str(row['customer_id']),
+            "customer_name": name,
+            "customer_phone": phone,
+            "customer_email": email,
+            "orders": int(row['orders']),
+            "total_spend": float(row['spend'])
+        })
+    return customers
+
+def format_returning_customers(row):
+    buying = row['buying_customers']
+    returning = row['returning_customers']
+    return {
+        "buying_customers": buying,
+        "new_customers": buying - returning,
+        "returning_customers": returning,
+        "returning_rate": round(returning / buying, 4) if buying else 0.0
+    }
+
+def format_cohorts(rows, weeks):
+    """
+    rows from COHORT_RETENTION as weekly cohorts with a retention curve each:
+    retention[n] is the share of the cohort that ordered again n weeks after its first week
+    """
+    cohorts = {}
+    for row in rows:
+        active = cohorts.setdefault(row['cohort_week'], [0] * (weeks + 1))
+        active[row['week_number']] = row['active_customers']
+    return [
+        {
+            "cohort_week": cohort_week,
+            "customers": active[0],
+            "active_customers": active,
+            "retention": [round(count / active[0], 4) if active[0] else 0.0 for count in active]
+        }
+        for cohort_week, active in sorted(cohorts.items())
+    ]
+
+def cohort_range(end_date, cohorts):
+    """(first, last) Monday of the `cohorts` weeks ending with the week of end_date"""
+    end_date = date.fromisoformat(str(end_date)[:10])
+    last_week = end_date - timedelta(days=end_date.weekday())
+    return (last_week - timedelta(weeks=cohorts - 1)).isoformat(), last_week.isoformat()
@@ -0,0 +1,57 @@
+"""
+Dashboard snapshots: API payloads computed by the nightly report run and stored in
+dashboard_snapshots (sql/dashboard_snapshots.sql), keyed by business, report date
+and endpoint.
+
+Each snapshot is stored with the orders watermark (query_registry.ORDERS_WATERMARK)
+of its day at the time it was computed. The API serves a snapshot only while the
+live watermark still matches, so the morning's dashboard opens for "yesterday" skip
+the heavy queries, and a late or changed order sends requests back to live queries.
+"""
+SNAPSHOT_ENDPOINTS = ("daily-metrics", "daily-orders")
+
+# Snapshots older than this are deleted by prune_snapshots
+SNAPSHOT_RETENTION_DAYS = 14
+
+SAVE_SNAPSHOT_QUERY = """
+    INSERT INTO dashboard_snapshots (business_account_id, report_date, endpoint, watermark, payload, created_at)
+    VALUES (%s, %s, %s, %s, %s, now())
+    ON CONFLICT (business_account_id, report_date, endpoint) DO UPDATE
+        SET watermark = EXCLUDED.watermark, payload = EXCLUDED.payload, created_at = EXCLUDED.created_at
+"""
+
+LOAD_SNAPSHOT_QUERY = """
+    SELECT payload
+    FROM dashboard_snapshots
+    WHERE business_account_id = %s AND report_date = %s AND endpoint = %s AND watermark = %s
+"""
+
+PRUNE_SNAPSHOTS_QUERY = """
+    DELETE FROM dashboard_snapshots
+    WHERE report_date < CURRENT_DATE - %s
+"""
+
+def watermark_key(row):
+    """An ORDERS_WATERMARK row (tuple or dict row) as the text stored with snapshots"""
+    values = row.values() if isinstance(row, dict) else row
+    return "|".join("" if value is None else str(value) for value in values)
+
+def save_snapshot(cursor, endpoint, business_account_id, report_date, watermark, body):
+    """
+    Store a payload serialized by json_response.dumps, the API's own serializer, so it is
+    served byte for byte as the live endpoint would send it
+    """
+    cursor.execute(SAVE_SNAPSHOT_QUERY, (business_account_id, report_date, endpoint, watermark, body))
+
+def load_snapshot(cursor, endpoint, business_account_id, report_date, watermark):
+    """Serialized payload stored at this watermark, or None"""
+    cursor.execute(LOAD_SNAPSHOT_QUERY, (business_account_id, report_date, endpoint, watermark))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    payload = row['payload'] if isinstance(row, dict) else row[0]
+    return bytes(payload)
+
+def prune_snapshots(cursor, retention_days=SNAPSHOT_RETENTION_DAYS):
+    cursor.execute(PRUNE_SNAPSHOTS_QUERY, (retention_days,))
+    return cursor.rowcount
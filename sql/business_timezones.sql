@@ -0,0 +1,40 @@
+-- Each business reports by its own local day. Values are IANA zone names
+-- (e.g. 'America/Chicago'); the default matches the Eastern-time reporting
+-- every business used before, now with daylight saving applied.
+ALTER TABLE business_accounts
+    ADD COLUMN IF NOT EXISTS timezone text NOT NULL DEFAULT 'America/New_York';
+
+-- Reject names Postgres doesn't know: AT TIME ZONE raises for them. A trigger rather
+-- than a CHECK: the set of zone names isn't immutable
+ALTER TABLE business_accounts DROP CONSTRAINT IF EXISTS business_accounts_timezone_check;
+
+CREATE OR REPLACE FUNCTION check_business_timezone() RETURNS trigger AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_timezone_names WHERE name = NEW.timezone) THEN
+        RAISE EXCEPTION 'unknown time zone: %', NEW.timezone USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS business_accounts_timezone_check ON business_accounts;
+CREATE TRIGGER business_accounts_timezone_check
+    BEFORE INSERT OR UPDATE OF timezone ON business_accounts
+    FOR EACH ROW EXECUTE FUNCTION check_business_timezone();
+
+-- The rollups (sql/rollups.sql) are bucketed by local day, and the ones built before
+-- this migration used fixed-offset EST: clear them so the next refresh_rollups run
+-- backfills everything in each business's zone. Re-running this file costs one more
+-- full backfill. Do the same after changing a business's time zone.
+DO $$
+DECLARE
+    rollup text;
+BEGIN
+    FOREACH rollup IN ARRAY ARRAY['daily_product_sales', 'daily_customer_spend',
+                                  'customer_order_index', 'customer_activity_weeks', 'rollup_state'] LOOP
+        IF to_regclass(rollup) IS NOT NULL THEN
+            EXECUTE format('TRUNCATE %I', rollup);
+        END IF;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,11 @@
+-- API payloads of /api/daily-metrics and /api/daily-orders computed by the nightly
+-- report run (snapshots.py). Served while the day's orders watermark still matches.
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+    business_account_id uuid NOT NULL,
+    report_date date NOT NULL,
+    endpoint text NOT NULL,
+    watermark text NOT NULL,
+    payload bytea NOT NULL,  -- serialized JSON, served as is
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (business_account_id, report_date, endpoint)
+);
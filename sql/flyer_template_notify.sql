@@ -0,0 +1,49 @@
+-- NOTIFY flyer_template_changed whenever a flyer template, its sections or its items
+-- change, so FlyerTemplateCache (flyer_template_cache.py) drops the cached flyer at once.
+-- Payload: the template's business_account_id, or '' if it can't be determined
+-- (the cache then drops everything). Notifications are sent on commit and
+-- duplicates within a transaction are collapsed.
+
+CREATE OR REPLACE FUNCTION notify_flyer_template_changed() RETURNS trigger AS $$
+DECLARE
+    changed record;
+    business uuid;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'product_templates' THEN
+        business := changed.business_account_id;
+    ELSIF TG_TABLE_NAME = 'product_template_sections' THEN
+        SELECT t.business_account_id INTO business
+        FROM product_templates t
+        WHERE t.id = changed.template_id;
+    ELSE
+        SELECT t.business_account_id INTO business
+        FROM product_template_sections s
+        JOIN product_templates t ON t.id = s.template_id
+        WHERE s.id = changed.section_id;
+    END IF;
+
+    PERFORM pg_notify('flyer_template_changed', COALESCE(business::text, ''));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS product_templates_notify_flyer ON product_templates;
+CREATE TRIGGER product_templates_notify_flyer
+    AFTER INSERT OR UPDATE OR DELETE ON product_templates
+    FOR EACH ROW EXECUTE FUNCTION notify_flyer_template_changed();
+
+DROP TRIGGER IF EXISTS product_template_sections_notify_flyer ON product_template_sections;
+CREATE TRIGGER product_template_sections_notify_flyer
+    AFTER INSERT OR UPDATE OR DELETE ON product_template_sections
+    FOR EACH ROW EXECUTE FUNCTION notify_flyer_template_changed();
+
+DROP TRIGGER IF EXISTS product_template_items_notify_flyer ON product_template_items;
+CREATE TRIGGER product_template_items_notify_flyer
+    AFTER INSERT OR UPDATE OR DELETE ON product_template_items
+    FOR EACH ROW EXECUTE FUNCTION notify_flyer_template_changed();
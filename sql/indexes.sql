@@ -0,0 +1,27 @@
+-- Recommended indexes for the dashboard API's read paths.
+-- CONCURRENTLY can't run inside a transaction block: apply statement by statement.
+
+-- Trigram index for the ILIKE '%weekly%flyer%' template lookups (flyer endpoint,
+-- flyer ETag watermark, /api/debug-templates?name=). A btree can't serve a
+-- leading-wildcard ILIKE; a GIN trigram index can.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_templates_name_trgm_idx
+    ON product_templates USING gin (name gin_trgm_ops);
+
+-- Keyset pagination for /api/debug-templates, with and without a business filter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_templates_business_created_idx
+    ON product_templates (business_account_id, created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_templates_created_idx
+    ON product_templates (created_at DESC, id DESC);
+
+-- Incremental export to the analytics mirror (analytics_mirror.py) reads rows changed since its watermark
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_transactions_changed_at_idx
+    ON order_transactions ((COALESCE(updated_at, created_at)));
+
+-- Rebuilding a customer's row in customer_order_index (rollups.py) reads all their orders
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_transactions_customer_idx
+    ON order_transactions (customer_id);
+
+-- Line items of a page of orders (/api/daily-orders?include=items) in one order_id = ANY(...) lookup
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_items_order_id_idx
+    ON order_items (order_id);
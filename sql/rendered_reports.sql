@@ -0,0 +1,19 @@
+-- Daily report emails as rendered by the nightly run, served by /api/reports (report_store.py).
+-- Sections are stored once per distinct content; a report lists its sections' digests in order.
+CREATE TABLE IF NOT EXISTS report_chunks (
+    digest text PRIMARY KEY,  -- SHA-256 of the section's HTML
+    body bytea NOT NULL,  -- gzip-compressed HTML
+    last_used timestamptz NOT NULL DEFAULT now()  -- last stored as part of a report, guards pruning
+);
+
+CREATE TABLE IF NOT EXISTS rendered_reports (
+    business_account_id uuid NOT NULL,
+    report_date date NOT NULL,
+    sections text[] NOT NULL,  -- report_chunks digests, in order
+    html_size integer NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (business_account_id, report_date)
+);
+
+-- Pruning looks up whether any report still references a chunk
+CREATE INDEX IF NOT EXISTS rendered_reports_sections_idx ON rendered_reports USING gin (sections);
@@ -0,0 +1,60 @@
+-- Daily rollups behind the top-products / top-customers leaderboards, maintained
+-- incrementally by rollups.refresh_rollups (refresh_rollups_op). Run it every few
+-- minutes to keep today's leaderboards current; the first run backfills all history.
+
+CREATE TABLE IF NOT EXISTS daily_product_sales (
+    business_account_id uuid NOT NULL,
+    sale_date date NOT NULL,
+    product_retailer_id uuid NOT NULL,
+    quantity bigint NOT NULL,
+    revenue numeric NOT NULL,
+    PRIMARY KEY (business_account_id, sale_date, product_retailer_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_customer_spend (
+    business_account_id uuid NOT NULL,
+    sale_date date NOT NULL,
+    customer_id uuid NOT NULL,
+    orders integer NOT NULL,
+    spend numeric NOT NULL,
+    PRIMARY KEY (business_account_id, sale_date, customer_id)
+);
+
+-- Leaderboards across every business scan by date
+CREATE INDEX IF NOT EXISTS daily_product_sales_date_idx ON daily_product_sales (sale_date);
+CREATE INDEX IF NOT EXISTS daily_customer_spend_date_idx ON daily_customer_spend (sale_date);
+
+-- How far each rollup has caught up with order_transactions
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name text PRIMARY KEY,
+    watermark timestamptz NOT NULL,
+    refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- First and last completed order per customer (new vs. returning buyers, weekly cohorts).
+-- When adding these to an existing install, DELETE FROM rollup_state WHERE name = 'leaderboards'
+-- so the next refresh backfills them.
+CREATE TABLE IF NOT EXISTS customer_order_index (
+    business_account_id uuid NOT NULL,
+    customer_id uuid NOT NULL,
+    first_order_at timestamptz NOT NULL,
+    last_order_at timestamptz NOT NULL,
+    first_order_date date NOT NULL,
+    first_order_week date NOT NULL,
+    completed_orders integer NOT NULL,
+    total_spend numeric NOT NULL,
+    PRIMARY KEY (business_account_id, customer_id)
+);
+CREATE INDEX IF NOT EXISTS customer_order_index_cohort_idx
+    ON customer_order_index (business_account_id, first_order_week);
+
+-- Weeks (Monday start, in the business's time zone) in which each customer placed completed orders (retention curves)
+CREATE TABLE IF NOT EXISTS customer_activity_weeks (
+    business_account_id uuid NOT NULL,
+    customer_id uuid NOT NULL,
+    week_start date NOT NULL,
+    orders integer NOT NULL,
+    PRIMARY KEY (business_account_id, customer_id, week_start)
+);
+CREATE INDEX IF NOT EXISTS customer_activity_weeks_week_idx
+    ON customer_activity_weeks (business_account_id, week_start);
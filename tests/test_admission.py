@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from admission import TenantAdmission, AdmissionRejected
+
+def test_tenant_starts_while_another_waits_on_its_own_cap():
+    async def scenario():
+        admission = TenantAdmission(max_active_total=8, max_active_per_tenant=2, queue_timeout=1)
+        await admission.acquire("a")
+        await admission.acquire("a")
+        third = asyncio.ensure_future(admission.acquire("a"))
+        await asyncio.sleep(0)
+        assert admission.queue_depth() == 1
+
+        # b isn't queued behind a's third request
+        await asyncio.wait_for(admission.acquire("b"), 0.1)
+        assert admission.stats()["active_expensive"] == 3
+
+        admission.release("a")
+        await asyncio.wait_for(third, 0.1)
+        assert admission.queue_depth() == 0
+
+    asyncio.run(scenario())
+
+def test_rate_buckets_are_bounded():
+    admission = TenantAdmission(burst=1, max_buckets=3)
+    for tenant in ["a", "b", "c", "d"]:
+        admission.check_rate(tenant)
+    assert list(admission._buckets) == ["b", "c", "d"]
+    with pytest.raises(AdmissionRejected):
+        admission.check_rate("d")
+
+def test_requests_without_a_tenant_share_the_anonymous_budget():
+    admission = TenantAdmission(rate_per_second=0.1, burst=1, anonymous_rate_per_second=0.1, anonymous_burst=3)
+    for _ in range(3):
+        admission.check_rate(None)
+    with pytest.raises(AdmissionRejected):
+        admission.check_rate(None)
+
+    admission.check_rate("a")
+    with pytest.raises(AdmissionRejected):
+        admission.check_rate("a")
@@ -0,0 +1,26 @@
+from caches import RunningTotals
+
+def test_advance_adds_the_delta_and_moves_the_cursor():
+    totals = RunningTotals(max_age=60)
+    totals.seed("day", {"total_revenue": 10.0, "total_transactions": 1}, "c1")
+    assert totals.advance("day", "c1", {"total_revenue": 2.5, "total_transactions": 1}, "c2") == (
+        {"total_revenue": 12.5, "total_transactions": 2}, "c2"
+    )
+    assert totals.get("day") == ({"total_revenue": 12.5, "total_transactions": 2}, "c2")
+
+def test_advance_from_a_stale_cursor_is_refused():
+    totals = RunningTotals(max_age=60)
+    totals.seed("day", {"total_transactions": 1}, "c1")
+    totals.advance("day", "c1", {"total_transactions": 1}, "c2")
+
+    # Another request already moved the entry past c1: adding its delta would count it twice
+    assert totals.advance("day", "c1", {"total_transactions": 1}, "c2") is None
+    assert totals.get("day") == ({"total_transactions": 2}, "c2")
+
+def test_advance_of_an_expired_or_missing_entry_is_refused():
+    totals = RunningTotals(max_age=60)
+    assert totals.advance("day", "c1", {"total_transactions": 1}, "c2") is None
+
+    totals.seed("day", {"total_transactions": 1}, "c1")
+    totals._entries.set("day", ({"total_transactions": 1}, "c1", 0.0))
+    assert totals.advance("day", "c1", {"total_transactions": 1}, "c2") is None
@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from psycopg2.pool import PoolError
+from db_pool import PooledDatabase, ReplicaRouter
+
+class FakeConnection:
+    autocommit = True
+    statement_timeout_ms = None
+    closed = 0
+
+class FakePool:
+    """Behaves like ThreadedConnectionPool: raises as soon as maxconn are checked out"""
+
+    def __init__(self, maxconn):
+        self.maxconn = maxconn
+        self.out = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.out >= self.maxconn:
+                raise PoolError("connection pool exhausted")
+            self.out += 1
+            self.peak = max(self.peak, self.out)
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            self.out -= 1
+
+def fake_database(name, maxconn, acquire_timeout=5):
+    db = PooledDatabase(name, {}, maxconn=maxconn, acquire_timeout=acquire_timeout)
+    db._get_pool()  # sets up the slots; the pool itself is swapped for the fake
+    db._pool = FakePool(maxconn)
+    return db
+
+@pytest.fixture(autouse=True)
+def no_connect(monkeypatch):
+    monkeypatch.setattr("db_pool.ThreadedConnectionPool", lambda *args, **kwargs: None)
+
+def test_waits_for_a_connection_beyond_maxconn():
+    db = fake_database("primary", maxconn=3)
+    errors = []
+
+    def query():
+        try:
+            with db.connection():
+                time.sleep(0.02)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=query) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert db._pool.peak == 3
+    assert db._pool.out == 0
+
+def test_raises_pool_error_after_acquire_timeout():
+    db = fake_database("primary", maxconn=1, acquire_timeout=0.05)
+    with db.connection():
+        with pytest.raises(PoolError):
+            db.getconn()
+    # The slot of the failed attempt isn't lost
+    with db.connection():
+        pass
+
+def test_busy_replica_falls_back_without_marking_it_down():
+    primary = fake_database("primary", maxconn=2)
+    replica = fake_database("replica", maxconn=1)
+    router = ReplicaRouter(primary, [replica])
+
+    held = replica.getconn()
+    with router.read_connection() as conn:
+        assert conn is not held
+        assert router.routed == {"primary": 1, "replica": 0}
+    assert "replica" not in router._down_until
+    replica.putconn(held)
+
+    with router.read_connection():
+        assert router.routed["replica"] == 1
+
+def test_fresh_read_skips_lag_probe_of_a_busy_replica():
+    primary = fake_database("primary", maxconn=2)
+    replica = fake_database("replica", maxconn=1)
+    router = ReplicaRouter(primary, [replica])
+
+    held = replica.getconn()
+    started = time.monotonic()
+    with router.read_connection(fresh=True):
+        assert router.routed == {"primary": 1, "replica": 0}
+    # Routed without waiting out the replica's acquire_timeout
+    assert time.monotonic() - started < 1
+    assert "replica" not in router._down_until
+    replica.putconn(held)
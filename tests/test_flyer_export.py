@@ -0,0 +1,45 @@
+import csv
+import io
+from datetime import date
+from decimal import Decimal
+import flyer_export
+from flyer_export import flyer_days, header, matrix_rows, csv_chunks
+
+DAYS = flyer_days(date(2025, 12, 22), date(2025, 12, 24))
+
+def sale(product_retailer_id, name, sale_date=None, quantity=None, revenue=None):
+    return {"product_retailer_id": product_retailer_id, "product_name": name, "sale_date": sale_date,
+            "quantity": quantity, "revenue": revenue}
+
+def test_matrix_rows_pivot_sales_by_day():
+    sales = [
+        sale("p1", "Apples", date(2025, 12, 22), 3, Decimal("4.50")),
+        sale("p1", "Apples", date(2025, 12, 24), 2, Decimal("3.00")),
+        sale("p2", "Bread"),  # sold nothing
+    ]
+    assert header(DAYS)[4:] == ["2025-12-22", "2025-12-23", "2025-12-24"]
+    assert list(matrix_rows(sales, DAYS)) == [
+        ["Apples", "p1", 5, 7.5, 3, 0, 2],
+        ["Bread", "p2", 0, 0.0, 0, 0, 0],
+    ]
+
+def test_csv_is_chunked_at_row_boundaries(monkeypatch):
+    monkeypatch.setattr(flyer_export, "EXPORT_CHUNK_SIZE", 64)
+    rows = [[f"Product {i}", f"p{i}", 1, 1.0, 1, 0, 0] for i in range(20)]
+    chunks = list(csv_chunks(rows, DAYS))
+
+    # A chunk is sent as soon as a whole row takes it to EXPORT_CHUNK_SIZE
+    assert len(chunks) > 2
+    for chunk in chunks[:-1]:
+        assert len(chunk) >= 64 and chunk.endswith(b"\r\n")
+    for chunk in chunks[1:-1]:
+        assert chunk.count(b"\r\n") == 3  # 26-28 byte rows
+    parsed = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert parsed[0] == header(DAYS)
+    assert [row[0] for row in parsed[1:]] == [f"Product {i}" for i in range(20)]
+
+def test_csv_escapes_names_read_as_formulas():
+    names = ["=HYPERLINK(\"http://x\")", "+1", "-1", "@SUM(A1)", "Plain", ""]
+    rows = [[name, f"p{i}", 0, 0.0, 0, 0, 0] for i, name in enumerate(names)]
+    parsed = list(csv.reader(io.StringIO(b"".join(csv_chunks(rows, DAYS)).decode())))
+    assert [row[0] for row in parsed[1:]] == ["'=HYPERLINK(\"http://x\")", "'+1", "'-1", "'@SUM(A1)", "Plain", ""]
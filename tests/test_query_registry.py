@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from query_registry import SINCE_START, encode_since, decode_since, since_position
+
+ORDER_ID = "3f2c1e0a-8b7d-4c6e-9f1a-2b3c4d5e6f70"
+
+def test_since_round_trips_in_utc():
+    created_at = datetime(2025, 12, 28, 9, 30, tzinfo=timezone(timedelta(hours=2)))
+    token = encode_since((created_at, ORDER_ID), SINCE_START)
+    assert token == f"2025-12-28T07:30:00Z|{ORDER_ID}|-infinity|{SINCE_START[1]}"
+    assert decode_since(token, 2) == [("2025-12-28T07:30:00Z", ORDER_ID), SINCE_START]
+
+@pytest.mark.parametrize("token", [
+    f"2025-12-28T07:30:00Z|{ORDER_ID}",
+    f"yesterday|{ORDER_ID}|-infinity|{SINCE_START[1]}",
+    f"2025-12-28T07:30:00Z|42|-infinity|{SINCE_START[1]}",
+])
+def test_decode_rejects_malformed_cursors(token):
+    with pytest.raises(ValueError):
+        decode_since(token, 2)
+
+def test_since_position_keeps_the_previous_one_without_new_rows():
+    assert since_position({"last_created_at": None, "last_id": None}, SINCE_START) == SINCE_START
+    created_at = datetime(2025, 12, 28, 7, 30, tzinfo=timezone.utc)
+    assert since_position({"last_created_at": created_at, "last_id": ORDER_ID}, SINCE_START) == (created_at, ORDER_ID)
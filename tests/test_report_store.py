@@ -0,0 +1,60 @@
+import gzip
+from report_store import split_sections, section_digest, save_report, load_sections
+
+REPORT = """<html><head><style>td { padding: 4px; }</style></head><body>
+<!-- Header --><h1>Daily report</h1>
+<!-- KPIs --><table><tr><td>Revenue</td></tr></table>
+<!--[if mso]><table><tr><td><![endif]--><a href="#">View orders</a><!--[if mso]></td></tr></table><![endif]-->
+<!-- Footer --><p>Unsubscribe</p>
+</body></html>"""
+
+class FakeCursor:
+    """Just enough of report_chunks/rendered_reports for save_report and load_sections"""
+
+    def __init__(self):
+        self.chunks = {}
+        self.reports = {}
+        self.rows = []
+
+    def execute(self, query, params):
+        if query.lstrip().startswith("UPDATE report_chunks"):
+            self.rows = [{"digest": digest} for digest in params[0] if digest in self.chunks]
+        elif query.lstrip().startswith("INSERT INTO report_chunks"):
+            self.chunks.update(zip(*params))
+        elif query.lstrip().startswith("INSERT INTO rendered_reports"):
+            self.reports[params[:2]] = params[2]
+        else:
+            self.rows = [{"digest": digest, "body": self.chunks[digest]} for digest in params[0] if digest in self.chunks]
+
+    def fetchall(self):
+        return self.rows
+
+def test_sections_start_at_labels_not_conditional_comments():
+    sections = split_sections(REPORT)
+    assert "".join(sections) == REPORT
+    assert [section[:16] for section in sections[1:]] == ["<!-- Header --><", "<!-- KPIs --><ta", "<!-- Footer --><"]
+    assert "<!--[if mso]>" in sections[2]
+
+def test_saved_report_loads_back_and_shares_sections():
+    cursor = FakeCursor()
+    assert save_report(cursor, "a", "2025-12-28", REPORT) == (4, 4)
+
+    # Another business's report differs only in its KPIs: only that section is stored
+    other = REPORT.replace("Revenue", "Orders")
+    assert save_report(cursor, "b", "2025-12-28", other) == (4, 1)
+    assert len(cursor.chunks) == 5
+
+    for key, html in [(("a", "2025-12-28"), REPORT), (("b", "2025-12-28"), other)]:
+        assert load_sections(cursor, cursor.reports[key]) == html
+
+def test_missing_chunk_loads_nothing():
+    cursor = FakeCursor()
+    save_report(cursor, "a", "2025-12-28", REPORT)
+    del cursor.chunks[section_digest(split_sections(REPORT)[0])]
+    assert load_sections(cursor, cursor.reports[("a", "2025-12-28")]) is None
+
+def test_chunks_are_gzipped_html():
+    cursor = FakeCursor()
+    save_report(cursor, "a", "2025-12-28", REPORT)
+    section = split_sections(REPORT)[1]
+    assert gzip.decompress(cursor.chunks[section_digest(section)]).decode() == section
@@ -0,0 +1,64 @@
+import threading
+from contextlib import contextmanager
+import pytest
+from psycopg2.errors import QueryCanceled
+from resilience import CircuitBreaker, CancelToken
+
+def open_breaker():
+    breaker = CircuitBreaker("athena", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+    return breaker
+
+def test_released_trial_lets_the_next_call_try():
+    breaker = open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release_trial()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_cancelled_contact_lookup_resolves_the_trial(monkeypatch):
+    import api
+
+    token = CancelToken()
+
+    @contextmanager
+    def cancelled_connection(cancel_token=None):
+        token.cancel()
+        raise QueryCanceled("canceling statement: no client is waiting for the result")
+        yield
+
+    breaker = open_breaker()
+    monkeypatch.setattr(api, "athena_breaker", breaker)
+    monkeypatch.setattr(api.ATHENA_DB, "connection", cancelled_connection)
+
+    with pytest.raises(QueryCanceled):
+        api._lookup_contacts([1, 2], cancel_token=token)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+
+def test_cancel_holds_connections_until_done():
+    token = CancelToken()
+    started = threading.Event()
+    finish = threading.Event()
+
+    class SlowCancel:
+        def cancel(self):
+            started.set()
+            finish.wait(1)
+
+    conn = SlowCancel()
+    token.register(conn)
+    canceller = threading.Thread(target=token.cancel)
+    canceller.start()
+    started.wait(1)
+
+    unregistered = threading.Event()
+    threading.Thread(target=lambda: (token.unregister(conn), unregistered.set())).start()
+    assert not unregistered.wait(0.05)
+    finish.set()
+    canceller.join()
+    assert unregistered.wait(1)
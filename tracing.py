@@ -0,0 +1,268 @@
+"""
+Tracing for the nightly report run: spans around DailyMetricsService calls, each SQL
+execution, rendering and email, grouped per Dagster op and linked to the Dagster run
+(every op of a run shares one trace id, derived from the run id).
+
+Spans are exported to either or both of:
+- DASHBOARD_TRACE_FILE: appended as JSON lines, one span per line
+- OTEL_EXPORTER_OTLP_ENDPOINT: an OTLP collector, when opentelemetry-sdk and
+  opentelemetry-exporter-otlp are installed
+
+Spans inside a run_span are recorded even with no exporter configured: the root span
+totals the time of the spans under it by name, which the ops report as metadata.
+Outside a run_span and without an exporter, span() does nothing.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import psycopg2.extensions
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+except ImportError:  # OpenTelemetry is optional; spans then only go to the JSON file
+    otel_trace = None
+
+SERVICE_NAME = "daily-dashboard"
+
+# SQL text recorded per statement, enough to recognise the query
+STATEMENT_MAX_LENGTH = 300
+
+_current = contextvars.ContextVar("dashboard_span", default=None)
+
+class Span:
+    """One timed operation; set() adds attributes while it runs"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "started_at", "start", "end",
+                 "error", "root", "totals", "_otel")
+
+    def __init__(self, name, parent, attributes, trace_id=None):
+        self.name = name
+        self.trace_id = trace_id or (parent.trace_id if parent else secrets.token_hex(16))
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+        self.root = parent.root if parent else self
+        self.totals = {}
+        self._otel = None
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        if self._otel is not None:
+            self._otel.set_attributes(_otel_attributes(attributes))
+
+class _NoopSpan:
+    __slots__ = ()
+    duration_ms = 0.0
+    totals = {}
+
+    def set(self, **attributes):
+        pass
+
+_NOOP = _NoopSpan()
+
+class _Exporters:
+    """Exporters configured from the environment, set up again in a forked process"""
+
+    def __init__(self):
+        self.pid = None
+        self.file = None
+        self.tracer = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self._setup()
+        return self
+
+    def _setup(self):
+        self.file = None
+        self.tracer = None
+        path = os.environ.get("DASHBOARD_TRACE_FILE")
+        if path:
+            self.file = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if otel_trace is not None and os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            self.tracer = provider.get_tracer(__name__)
+        self.pid = os.getpid()
+
+    @property
+    def active(self):
+        return self.file is not None or self.tracer is not None
+
+    def write(self, span):
+        if self.file is None:
+            return
+        record = {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "start": datetime.fromtimestamp(span.started_at, timezone.utc).isoformat(),
+            "duration_ms": round(span.duration_ms, 3),
+            "attributes": span.attributes,
+            "error": span.error
+        }
+        # One write per line: lines from concurrent processes don't interleave
+        os.write(self.file, (json.dumps(record, default=str) + "\n").encode())
+
+_exporters = _Exporters()
+
+def _otel_attributes(attributes):
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items() if value is not None}
+
+def _start_otel(exporters, span, parent):
+    if parent is not None and parent._otel is not None:
+        context = otel_trace.set_span_in_context(parent._otel)
+    else:
+        # Parent every root span on the run's trace id, so a run is one trace in the collector
+        remote = otel_trace.SpanContext(
+            trace_id=int(span.trace_id, 16), span_id=int(secrets.token_hex(8), 16), is_remote=True,
+            trace_flags=otel_trace.TraceFlags(otel_trace.TraceFlags.SAMPLED)
+        )
+        context = otel_trace.set_span_in_context(otel_trace.NonRecordingSpan(remote))
+    span._otel = exporters.tracer.start_span(
+        span.name, context=context, attributes=_otel_attributes(span.attributes),
+        start_time=int(span.started_at * 1e9)
+    )
+
+@contextmanager
+def _record(span):
+    parent = _current.get()
+    exporters = _exporters.get()
+    if exporters.tracer is not None:
+        _start_otel(exporters, span, parent)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end = time.perf_counter()
+        _current.reset(token)
+        if span.root is not span:
+            span.root.totals[span.name] = span.root.totals.get(span.name, 0.0) + span.duration_ms
+        if span._otel is not None:
+            if span.error:
+                span._otel.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+            span._otel.end(end_time=int((span.started_at + span.duration_ms / 1000) * 1e9))
+        exporters.write(span)
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a child of the current span"""
+    parent = _current.get()
+    if parent is None and not _exporters.get().active:
+        yield _NOOP
+        return
+    with _record(Span(name, parent, attributes)) as current:
+        yield current
+
+@contextmanager
+def run_span(run_id, name, **attributes):
+    """
+    Root span of one unit of a run (a Dagster op), on the trace of run_id. Its totals
+    hold the time of the spans under it by name once it has finished.
+    """
+    try:
+        trace_id = uuid.UUID(str(run_id)).hex
+    except ValueError:
+        trace_id = None
+    with _record(Span(name, None, attributes, trace_id=trace_id)) as current:
+        yield current
+
+def current_root():
+    """Root span of the current run_span (its totals so far), or a no-op span outside one"""
+    current = _current.get()
+    return current.root if current is not None else _NOOP
+
+def traced_methods(cls):
+    """
+    Class decorator: a span around every public method, named Class.method, with the
+    method's business_account_id and report_date arguments as attributes
+    """
+    for attr, method in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.isfunction(method):
+            continue
+        setattr(cls, attr, _traced(method, f"{cls.__name__}.{attr}"))
+    return cls
+
+def _traced(method, name):
+    signature = inspect.signature(method)
+    recorded = [param for param in ("business_account_id", "report_date") if param in signature.parameters]
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None and not _exporters.get().active:
+            return method(*args, **kwargs)
+        bound = signature.bind_partial(*args, **kwargs).arguments
+        with span(name, **{param: bound.get(param) for param in recorded}):
+            return method(*args, **kwargs)
+    return wrapper
+
+def _statement(query):
+    text = query.decode(errors="replace") if isinstance(query, bytes) else str(query)
+    text = " ".join(text.split())
+    return text if len(text) <= STATEMENT_MAX_LENGTH else text[:STATEMENT_MAX_LENGTH] + "..."
+
+_traced_cursors = {}
+
+def _traced_cursor_class(base):
+    cursor_class = _traced_cursors.get(base)
+    if cursor_class is not None:
+        return cursor_class
+
+    class TracedCursor(base):
+        def execute(self, query, vars=None):
+            if _current.get() is None and not _exporters.get().active:
+                return super().execute(query, vars)
+            with span("sql", **{"db.name": self.connection.info.dbname, "db.statement": _statement(query)}) as current:
+                result = super().execute(query, vars)
+                current.set(**{"db.rows": self.rowcount})
+                return result
+
+        def executemany(self, query, vars_list):
+            if _current.get() is None and not _exporters.get().active:
+                return super().executemany(query, vars_list)
+            with span("sql", **{"db.name": self.connection.info.dbname, "db.statement": _statement(query)}):
+                return super().executemany(query, vars_list)
+
+    TracedCursor.__name__ = f"Traced{base.__name__}"
+    _traced_cursors[base] = TracedCursor
+    return TracedCursor
+
+def traced_connection_factory(base):
+    """Subclass of a psycopg2 connection class whose cursors record a "sql" span per statement"""
+
+    class TracedConnection(base):
+        def cursor(self, *args, **kwargs):
+            factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+            kwargs["cursor_factory"] = _traced_cursor_class(factory)
+            return super().cursor(*args, **kwargs)
+
+    TracedConnection.__name__ = f"Traced{base.__name__}"
+    return TracedConnection